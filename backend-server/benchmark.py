@@ -0,0 +1,203 @@
+"""
+Latency / memory benchmark for the detection pipeline.
+
+Reports p50/p95 latency and resident memory (RSS) for:
+  - the rule-based pipeline (AutoPlantDiseaseDetector.analyze_image)
+  - the ONNX classifier, float32 vs int8 dynamic quantization (if onnxruntime
+    is installed). Without --model a tiny generated model is used, which
+    measures the runtime overhead rather than a real network.
+  - concurrent classify() callers, one forward pass each vs micro-batched
+
+Usage:
+    python benchmark.py
+    python benchmark.py --model models/leaf_classifier.onnx --threads 2 --runs 50 --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import resource
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from logic.plant_detection_engine import AutoPlantDiseaseDetector
+from logic.onnx_classifier import OnnxClassifier, ort
+
+DEFAULT_IMAGE = os.path.join(BASE_DIR, "logic", "TS.png")
+
+
+def rss_mb():
+    """Current resident set size in MB (Linux), falls back to peak RSS elsewhere"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def time_calls(fn, runs, warmup=1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings = np.array(timings)
+    return {
+        "runs": runs,
+        "p50_ms": round(float(np.percentile(timings, 50)), 2),
+        "p95_ms": round(float(np.percentile(timings, 95)), 2),
+        "mean_ms": round(float(timings.mean()), 2)
+    }
+
+
+def bench_rules(image, runs):
+    before = rss_mb()
+    detector = AutoPlantDiseaseDetector(persist=False)
+    loaded = rss_mb()
+    result = time_calls(lambda: detector.analyze_image(image.copy()), runs)
+    result.update({"rss_load_mb": round(loaded - before, 1), "rss_after_mb": round(rss_mb(), 1)})
+    return result
+
+
+def bench_classifier(image, model_path, threads, runs):
+    results = {}
+    for quantize in (False, True):
+        before = rss_mb()
+        started = time.perf_counter()
+        classifier = OnnxClassifier(model_path, quantize=quantize, intra_op_threads=threads)
+        load_ms = (time.perf_counter() - started) * 1000
+        warmup_ms = classifier.warmup()
+        loaded = rss_mb()
+
+        result = time_calls(lambda: classifier.classify(image), runs)
+        result.update({
+            "model_mb": round(os.path.getsize(classifier.model_path) / 1e6, 2),
+            "load_ms": round(load_ms, 1),
+            "warmup_ms": round(warmup_ms, 2),
+            "rss_load_mb": round(loaded - before, 1),
+            "rss_after_mb": round(rss_mb(), 1)
+        })
+        results["int8" if quantize else "float32"] = result
+    return results
+
+
+def bench_batching(image, model_path, threads, concurrency, requests, max_wait_ms):
+    """Throughput of `concurrency` parallel callers, one forward pass each vs micro-batched"""
+    from concurrent.futures import ThreadPoolExecutor
+    from logic.micro_batcher import BatchedClassifier
+
+    classifier = OnnxClassifier(model_path, quantize=True, intra_op_threads=threads)
+    classifier.warmup()
+    variants = {
+        "unbatched": classifier,
+        "batched": BatchedClassifier(classifier, max_batch_size=concurrency, max_wait_ms=max_wait_ms)
+    }
+
+    results = {}
+    for name, target in variants.items():
+        latencies = []
+
+        def call(_):
+            started = time.perf_counter()
+            target.classify(image)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(call, range(requests)))
+        elapsed = time.perf_counter() - started
+        results[name] = {
+            "requests_per_s": round(requests / elapsed, 1),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2)
+        }
+        if name == "batched":
+            metrics = target.metrics()
+            results[name]["mean_batch_size"] = metrics["mean_batch_size"]
+            results[name]["added_wait_ms"] = metrics["added_wait_ms"]
+    results["concurrency"] = concurrency
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection latency and memory")
+    parser.add_argument("--image", type=str, default=DEFAULT_IMAGE, help="Leaf image to analyze")
+    parser.add_argument("--model", type=str, default=None, help="ONNX model (default: generated tiny model)")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = auto)")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per benchmark")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel callers for the batching benchmark")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Micro-batching wait budget")
+    parser.add_argument("--skip-rules", action="store_true", help="Only benchmark the classifier")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        sys.exit(f"Could not read {args.image}")
+
+    report = {"image": os.path.basename(args.image), "baseline_rss_mb": round(rss_mb(), 1)}
+    if not args.skip_rules:
+        report["rules_pipeline"] = bench_rules(image, max(1, args.runs // 4))
+
+    if ort is None:
+        report["onnx_classifier"] = "skipped (onnxruntime not installed)"
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = args.model
+            if model_path is None:
+                import onnx
+                from make_tiny_onnx_model import build_model
+                model_path = os.path.join(tmp_dir, "tiny_leaf_classifier.onnx")
+                onnx.save(build_model(), model_path)
+            report["onnx_classifier"] = bench_classifier(image, model_path, args.threads, args.runs)
+            report["onnx_classifier"]["model"] = args.model or "tiny (generated)"
+            report["micro_batching"] = bench_batching(
+                image, model_path, args.threads, args.concurrency, args.runs * args.concurrency, args.max_wait_ms)
+
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"\nBenchmark ({report['image']}), baseline RSS {report['baseline_rss_mb']} MB")
+    rows = []
+    if "rules_pipeline" in report:
+        rows.append(("rules pipeline", report["rules_pipeline"]))
+    if isinstance(report["onnx_classifier"], dict):
+        rows.append(("onnx float32", report["onnx_classifier"]["float32"]))
+        rows.append(("onnx int8", report["onnx_classifier"]["int8"]))
+    print(f"{'component':<16}{'p50 ms':>10}{'p95 ms':>10}{'RSS +MB':>10}")
+    for name, r in rows:
+        print(f"{name:<16}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['rss_load_mb']:>10}")
+    if not isinstance(report["onnx_classifier"], dict):
+        print(f"onnx: {report['onnx_classifier']}")
+    if "micro_batching" in report:
+        batching = report["micro_batching"]
+        print(f"\n{'classify x' + str(batching['concurrency']):<16}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name in ("unbatched", "batched"):
+            r = batching[name]
+            print(f"{name:<16}{r['requests_per_s']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}")
+        print(f"mean batch size {batching['batched']['mean_batch_size']}, "
+              f"added wait p95 {batching['batched']['added_wait_ms']['p95']} ms")
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
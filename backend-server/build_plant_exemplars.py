@@ -0,0 +1,103 @@
+"""
+Build the kNN plant identification exemplars from labeled leaf photos.
+
+Expects one folder per plant, named like the engine's plant keys
+(e.g. `tomato`, `rice`, `bitter_gourd`):
+
+    labeled_leaves/
+        tomato/   img001.jpg ...
+        rice/     img001.jpg ...
+
+Features are extracted with the same pipeline as /predict and written to
+models/plant_exemplars.npz, which the engine loads on startup.
+
+Usage:
+    python build_plant_exemplars.py labeled_leaves/
+    python build_plant_exemplars.py labeled_leaves/ --k 5 --workers 8 --output /tmp/exemplars.npz
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from logic.plant_exemplars import PlantExemplarIndex, plant_feature_vector, DEFAULT_EXEMPLARS_PATH
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+_detector = None
+
+
+def _init_worker():
+    global _detector
+    from logic.plant_detection_engine import AutoPlantDiseaseDetector
+    _detector = AutoPlantDiseaseDetector(persist=False)
+
+
+def extract(path):
+    """Plant feature vector for one photo, or None if no leaf was found"""
+    image = cv2.imread(path)
+    if image is None:
+        return None
+    image = _detector.preprocess_image(image)
+    mask, contour, _ = _detector.segment_leaf(image)
+    if mask is None:
+        return None
+    shape_features = _detector.extract_shape_features(contour, image.shape)
+    texture_features = _detector.extract_texture_features(image, mask)
+    return plant_feature_vector(shape_features, texture_features)
+
+
+def find_images(root):
+    samples = []
+    for plant_dir in sorted(os.listdir(root)):
+        full_dir = os.path.join(root, plant_dir)
+        if not os.path.isdir(full_dir):
+            continue
+        plant_key = plant_dir.lower().replace(" ", "_")
+        for dirpath, _, filenames in os.walk(full_dir):
+            for name in sorted(filenames):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    samples.append((os.path.join(dirpath, name), plant_key))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build kNN plant exemplars from labeled leaf photos")
+    parser.add_argument("root", type=str, help="Folder with one sub-folder of photos per plant")
+    parser.add_argument("--output", type=str, default=DEFAULT_EXEMPLARS_PATH, help="Output .npz path")
+    parser.add_argument("--k", type=int, default=7, help="Neighbours per vote")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Feature extraction processes")
+    args = parser.parse_args()
+
+    samples = find_images(args.root)
+    if not samples:
+        sys.exit(f"No images found under {args.root}")
+    print(f"Extracting features from {len(samples)} photos with {args.workers} workers...")
+
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        vectors = list(pool.map(extract, [path for path, _ in samples], chunksize=4))
+
+    kept = [(vector, plant) for vector, (_, plant) in zip(vectors, samples) if vector is not None]
+    print(f"{len(kept)}/{len(samples)} photos had a detectable leaf ({time.time() - started:.1f}s)")
+    if not kept:
+        sys.exit("Nothing to build")
+
+    index = PlantExemplarIndex.build(np.stack([v for v, _ in kept]), [p for _, p in kept], k=args.k)
+    index.save(args.output)
+
+    counts = np.bincount(index.labels, minlength=len(index.classes))
+    for plant, count in sorted(zip(index.classes, counts), key=lambda x: -x[1]):
+        print(f"  {plant:<24}{count:>6}")
+    print(f"Saved {len(index)} exemplars for {len(index.classes)} plants to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# ===========================
+# OFFLINE BUNDLE ENDPOINTS
+# ===========================
+# Serve the offline diagnosis bundle (see logic/rule_bundle.py) so the mobile
+# app can diagnose from on-device features without a connection. Registered
+# from main.py
+
+
+def register_bundle_endpoints(app, HTTPException, plant_detector, bundle_store):
+    """Register offline bundle endpoints with the FastAPI app"""
+
+    from fastapi import Request, Response
+
+    def current_version():
+        # Picks up hot-reloaded rule edits; a no-op while the rules content is unchanged
+        return bundle_store.publish_from(plant_detector)
+
+    @app.get("/bundle/latest")
+    def get_latest_bundle(request: Request):
+        """Full bundle of the latest version (gzipped JSON, ETag = version)"""
+        version = current_version()
+        etag = f'"{version}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        headers = {"ETag": etag, "X-Bundle-Version": str(version), "Cache-Control": "no-cache"}
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(bundle_store.raw(version), media_type="application/json", headers=headers)
+        return {"format": 1, "version": version, "sections": bundle_store.load(version)}
+
+    @app.get("/bundle/delta")
+    def get_bundle_delta(since: int):
+        """Entries changed since the client's bundle version; a full bundle if that version is unknown"""
+        version = current_version()
+        if since > version:
+            raise HTTPException(status_code=400, detail=f"Unknown bundle version {since}; latest is {version}")
+
+        delta = bundle_store.delta(since)
+        if delta is None:
+            return {"full": True, "format": 1, "version": version, "sections": bundle_store.load(version)}
+        delta["full"] = False
+        return delta
+
+    @app.get("/bundle/versions")
+    def get_bundle_versions():
+        """Bundle versions still available for delta updates"""
+        return {"latest": current_version(), "versions": bundle_store.versions()}
@@ -36,6 +36,34 @@ def init_db():
         )
     ''')
     
+    # Link disease test results to their row in `detections` (added later, so migrate old DBs)
+    cursor.execute("PRAGMA table_info(test_results)")
+    if 'detection_id' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE test_results ADD COLUMN detection_id INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_results_detection ON test_results(detection_id)")
+    
+    # Which stage produced a disease result: 'rules' or 'onnx' (classifier); rescore.py leaves 'onnx' rows alone
+    cursor.execute("PRAGMA table_info(test_results)")
+    if 'diagnosis_source' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE test_results ADD COLUMN diagnosis_source TEXT")
+    
+    # Per-photo scores of multi-image soil tests (/predict_soil/batch); the
+    # fused decision is the linked test_results row
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS soil_samples (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_result_id INTEGER NOT NULL,
+            sample_index INTEGER NOT NULL,
+            filename TEXT,
+            top_type TEXT,
+            sandy_score REAL,
+            clay_score REAL,
+            loamy_score REAL,
+            FOREIGN KEY(test_result_id) REFERENCES test_results(id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_soil_samples_test ON soil_samples(test_result_id)")
+    
     # Products Table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS products (
@@ -141,6 +169,42 @@ def init_db():
         )
     ''')
     
+    # Shadow Mode Results (candidate pipeline re-runs of sampled /predict requests)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shadow_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            detection_id INTEGER,
+            candidate TEXT,
+            primary_rules_version TEXT,
+            candidate_rules_version TEXT,
+            primary_diagnosis TEXT,
+            candidate_diagnosis TEXT,
+            diagnosis_agrees INTEGER,
+            primary_plant TEXT,
+            candidate_plant TEXT,
+            plant_agrees INTEGER,
+            primary_ms REAL,
+            candidate_ms REAL,
+            delta_ms REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Crowd-sourced soil prior (logic/crowd_prior.py): decayed soil-class counts
+    # per lat/lon grid cell, each row decayed to its own updated_at
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS soil_crowd_cells (
+            cell_row INTEGER NOT NULL,
+            cell_col INTEGER NOT NULL,
+            sandy REAL NOT NULL DEFAULT 0,
+            clay REAL NOT NULL DEFAULT 0,
+            loamy REAL NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (cell_row, cell_col)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_soil_crowd_updated ON soil_crowd_cells(updated_at)")
+    
     conn.commit()
     conn.close()
 
@@ -0,0 +1,115 @@
+# ===========================
+# DETECTION ENDPOINTS
+# ===========================
+# This file contains endpoints that work on stored plant detections
+# (history screen, reports). They are registered from main.py
+
+import json
+import time
+
+
+def register_detection_endpoints(app, get_db_connection, HTTPException, plant_detector, report_store, similarity_index):
+    """Register all detection endpoints with the FastAPI app"""
+
+    from fastapi.responses import FileResponse
+
+    def fetch_detection(detection_id: int):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM detections WHERE id = ?", (detection_id,))
+        row = cursor.fetchone()
+        conn.close()
+
+        if not row:
+            raise HTTPException(status_code=404, detail="Detection not found")
+        return row
+
+    # Plain `def` so FastAPI runs the (CPU bound) rendering in its threadpool
+    @app.get("/detections/{detection_id}/visual")
+    def get_detection_visual(detection_id: int, format: str = "jpg"):
+        """Annotated visual report for a detection, rendered on first request"""
+        if format not in report_store.FORMATS:
+            raise HTTPException(status_code=400, detail="Invalid format. Must be 'jpg' or 'webp'")
+
+        detection = fetch_detection(detection_id)
+
+        try:
+            diseases = json.loads(detection["disease_details"] or "[]")
+        except ValueError:
+            diseases = []
+
+        path = report_store.get_or_render(
+            plant_detector,
+            detection_id,
+            detection["plant_detected"] or "unknown",
+            diseases,
+            fmt=format
+        )
+        if path is None:
+            raise HTTPException(status_code=404, detail="Source image not available for this detection")
+
+        # Remember where the report lives for other consumers of the table
+        if detection["visual_report_path"] != path:
+            conn = get_db_connection()
+            conn.execute("UPDATE detections SET visual_report_path = ? WHERE id = ?", (path, detection_id))
+            conn.commit()
+            conn.close()
+
+        return FileResponse(
+            path,
+            media_type=report_store.MEDIA_TYPES[format],
+            headers={"Cache-Control": "private, max-age=86400"}
+        )
+
+    @app.get("/detections/{detection_id}/similar")
+    def get_similar_detections(detection_id: int, k: int = 10):
+        """Most similar past leaves (by stored feature vector) and their diagnoses"""
+        if not 1 <= k <= 100:
+            raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+
+        started = time.perf_counter()
+        neighbours = similarity_index.search_id(detection_id, k)
+        if neighbours is None:
+            raise HTTPException(status_code=404, detail="No feature vector stored for this detection")
+        search_ms = (time.perf_counter() - started) * 1000
+
+        details = {}
+        if neighbours:
+            ids = [neighbour_id for neighbour_id, _ in neighbours]
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT id, timestamp, plant_detected, primary_diagnosis, health_status FROM detections "
+                f"WHERE id IN ({','.join('?' * len(ids))})",
+                ids
+            )
+            details = {row["id"]: dict(row) for row in cursor.fetchall()}
+            conn.close()
+
+        similar = []
+        for neighbour_id, similarity in neighbours:
+            row = details.get(neighbour_id)
+            if row is None:  # vector outlived its detection row
+                continue
+            row["similarity"] = round(similarity, 4)
+            similar.append(row)
+
+        return {
+            "detection_id": detection_id,
+            "similar": similar,
+            "index": {"mode": similarity_index.mode, "size": len(similarity_index), "search_ms": round(search_ms, 2)}
+        }
+
+    @app.get("/metrics/inference")
+    def get_inference_metrics():
+        """Classifier configuration and micro-batching metrics (queue depth, batch sizes, added wait)"""
+        classifier = plant_detector.classifier
+        return {
+            "classifier": classifier.info() if classifier is not None else None,
+            "batching": classifier.metrics() if hasattr(classifier, "metrics") else None
+        }
+
+    @app.get("/rules/disease")
+    def get_disease_rules():
+        """Active disease decision table, so clients can show which rule version diagnosed them"""
+        return plant_detector.rule_table.spec
@@ -0,0 +1,60 @@
+"""
+Export the offline diagnosis bundle for the mobile app.
+
+Snapshots the disease decision table, HSV color ranges, plant knowledge base and
+treatments of AutoPlantDiseaseDetector into bundles/ (the directory served by
+/bundle/latest and /bundle/delta). A new version is only written when something
+changed since the last export.
+
+Usage:
+    python export_bundle.py                          # publish into bundles/
+    python export_bundle.py --rules candidate.json   # export a different rule table
+    python export_bundle.py --since 3                # also report the delta size from version 3
+"""
+import os
+import sys
+import json
+import gzip
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from logic.plant_detection_engine import AutoPlantDiseaseDetector
+from logic.rule_bundle import RuleBundleStore, build_bundle
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the offline diagnosis bundle")
+    parser.add_argument("--output", type=str, default=os.path.join(BASE_DIR, "bundles"), help="Bundle directory")
+    parser.add_argument("--rules", type=str, default=None, help="Decision table JSON (default: the engine's)")
+    parser.add_argument("--since", type=int, default=None, help="Print the delta size from this version")
+    args = parser.parse_args()
+
+    detector = AutoPlantDiseaseDetector(rules_path=args.rules, persist=False)
+    store = RuleBundleStore(args.output)
+    previous = store.latest_version
+    version = store.publish(build_bundle(detector))
+
+    if version == previous:
+        print(f"No changes; latest bundle is still v{version}")
+    else:
+        print(f"Published bundle v{version} (rules {detector.rule_table.version})")
+
+    sections = store.load(version)
+    for name, entries in sections.items():
+        print(f"  {name:<14}{len(entries):>6} entries")
+    print(f"  {len(store.raw(version)) / 1024:.1f} KiB gzipped")
+
+    if args.since is not None:
+        delta = store.delta(args.since)
+        if delta is None:
+            print(f"v{args.since} is not available; clients on it get the full bundle")
+        else:
+            size = len(gzip.compress(json.dumps(delta, separators=(',', ':')).encode('utf-8')))
+            changed = {name: len(change['set']) + len(change['remove']) for name, change in delta['sections'].items()}
+            print(f"Delta v{args.since} -> v{version}: {changed or 'no changes'}, {size / 1024:.1f} KiB gzipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Ingest the Harmonized World Soil Database v2 into hwsd/.
+
+Crops the global SMU grid (HWSD2.bil + HWSD2.hdr) to the served area as a
+uint32 raster and flattens the topsoil (D1) composition of every mapping unit
+found in it from HWSD2.mdb into an indexed SQLite table. SoilEngine reads the
+result through logic/hwsd.py; no Access drivers are needed at runtime.
+
+Reading the .mdb needs mdbtools (`apt install mdbtools`); on Windows export the
+HWSD2_LAYERS table to CSV from Access and pass --layers-csv instead.
+
+Usage:
+    python ingest_hwsd.py --bil ../HWSD2.bil --mdb ../HWSD2.mdb
+    python ingest_hwsd.py --bil ../HWSD2.bil --layers-csv HWSD2_LAYERS.csv
+    python ingest_hwsd.py --bil ../HWSD2.bil --mdb ../HWSD2.mdb --bounds 15.8,19.9,77.2,81.3
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from logic.hwsd import (DEFAULT_BOUNDS, DEFAULT_HWSD_DIR, NODATA_SMU, aggregate_units,
+                        read_bil_window, read_mdb_table, write_store)
+
+
+def parse_bounds(text: str) -> dict:
+    """'lat_bottom,lat_top,lon_left,lon_right'"""
+    lat_bottom, lat_top, lon_left, lon_right = (float(v) for v in text.split(","))
+    return {'lat_top': lat_top, 'lat_bottom': lat_bottom, 'lon_left': lon_left, 'lon_right': lon_right}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest HWSD2 into a local raster + SQLite store")
+    parser.add_argument("--bil", type=str, required=True, help="HWSD2.bil (HWSD2.hdr next to it)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--mdb", type=str, help="HWSD2.mdb (read with mdb-export)")
+    source.add_argument("--layers-csv", type=str, help="HWSD2_LAYERS exported to CSV")
+    parser.add_argument("--bounds", type=parse_bounds, default=DEFAULT_BOUNDS,
+                        help="lat_bottom,lat_top,lon_left,lon_right (default: India)")
+    parser.add_argument("--output", type=str, default=os.environ.get('HWSD_DIR', DEFAULT_HWSD_DIR),
+                        help="Store directory")
+    args = parser.parse_args()
+
+    start = time.time()
+    try:
+        raster, bounds = read_bil_window(args.bil, args.bounds)
+        smu_ids = set(np.unique(raster).tolist()) - {NODATA_SMU}
+        print(f"Raster: {raster.shape[1]}x{raster.shape[0]} cells, {len(smu_ids)} mapping units")
+
+        if args.mdb:
+            units = aggregate_units(read_mdb_table(args.mdb, "HWSD2_LAYERS"), smu_ids)
+        else:
+            with open(args.layers_csv, newline='') as f:
+                units = aggregate_units(csv.DictReader(f), smu_ids)
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Ingestion failed: {e}")
+
+    missing = len(smu_ids - set(units))
+    header = write_store(args.output, raster, bounds, units,
+                         source=os.path.basename(args.mdb or args.layers_csv))
+    print(f"Wrote {header['units']} units to {args.output}"
+          + (f" ({missing} units without topsoil data)" if missing else "")
+          + f" in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Ingest region soil maps into tiled raster layers.
+
+Each region in the manifest (default: regions.json) is read once - a plain
+image with explicit bounds, or a GeoTIFF that carries its own bounds when
+rasterio is installed - and written to layers/<name>/ as 'avg' (window-averaged
+BGR) and 'classes' (land class id) tiles. SoilEngine serves points outside
+TS.png from these layers, loading tiles lazily.
+
+Usage:
+    python ingest_layers.py                          # every region in regions.json
+    python ingest_layers.py --only andhra_pradesh    # one region
+    python ingest_layers.py --tile-size 512 --output /data/layers
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from logic.soil_engine import SoilEngine
+from logic.raster_layers import DEFAULT_LAYERS_DIR, read_source, write_layer
+
+
+def ingest_region(engine: SoilEngine, region: dict, output_dir: str, tile_size: int, base_dir: str = BASE_DIR) -> dict:
+    """Read one manifest entry and write its layer; returns the layer.json contents"""
+    source = os.path.join(base_dir, region['source'])
+    bgr, bounds = read_source(source, region.get('bounds'))
+    avg = engine.window_average(bgr)
+    classes = engine.classify_raster(avg)
+    return write_layer(os.path.join(output_dir, region['name']), region['name'], bounds,
+                       {'avg': avg, 'classes': classes}, tile_size=tile_size,
+                       extra={'source': region['source'], 'class_names': list(engine.class_names),
+                              'class_params': engine.class_params()})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest region soil maps into tiled raster layers")
+    parser.add_argument("--regions", type=str, default=os.path.join(BASE_DIR, "regions.json"), help="Region manifest")
+    parser.add_argument("--output", type=str, default=os.environ.get('RASTER_LAYERS_DIR', DEFAULT_LAYERS_DIR),
+                        help="Layer directory")
+    parser.add_argument("--tile-size", type=int, default=256, help="Tile edge in pixels")
+    parser.add_argument("--only", type=str, default=None, help="Comma-separated region names")
+    args = parser.parse_args()
+
+    with open(args.regions) as f:
+        regions = json.load(f)['regions']
+    if args.only:
+        wanted = set(args.only.split(","))
+        regions = [region for region in regions if region['name'] in wanted]
+
+    engine = SoilEngine()
+    base_dir = os.path.dirname(os.path.abspath(args.regions))
+    for region in regions:
+        start = time.time()
+        try:
+            meta = ingest_region(engine, region, args.output, args.tile_size, base_dir)
+        except (OSError, ValueError) as e:
+            print(f"  {region['name']:<20} FAILED: {e}")
+            continue
+        tiles = -(-meta['height'] // args.tile_size) * -(-meta['width'] // args.tile_size)
+        print(f"  {region['name']:<20}{meta['width']}x{meta['height']} px, {tiles} tiles/band "
+              f"({time.time() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
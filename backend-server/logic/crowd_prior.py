@@ -0,0 +1,172 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Soil prior learned from our own soil tests. Every located result adds its
+# image scores (soft counts over SOIL_TYPES) to the grid cell it falls in.
+# Counts decay exponentially with age. Each row holds its counts decayed to
+# its own updated_at: an update decays them to the new sample's time and adds
+# the sample in one atomic upsert, and a read decays them to now. Decay
+# factors are exp(-decay * age) with age >= 0, so they never overflow, however
+# short the half-life. Nothing is recomputed as time passes.
+
+DEFAULT_CROWD_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "farmx.db")
+
+CROWD_SOIL_TYPES = ('Sandy', 'Clay', 'Loamy')
+
+# Bulk export record: cell indices, decayed sample count and the prior as 0..255
+EXPORT_DTYPE = np.dtype([('row', '<i4'), ('col', '<i4'), ('samples', '<f4'), ('prior', 'u1', (3,))])
+
+
+class CrowdSoilPrior:
+    """
+    Decayed soil-class counts per cell of a regular lat/lon grid, in the
+    soil_crowd_cells table. One primary-key upsert per recorded result and
+    one primary-key read per lookup.
+    """
+
+    # Prior weight in the final blend approaches this as a cell gathers samples
+    MAX_WEIGHT = 0.15
+    # Decayed samples at which a cell gets half of MAX_WEIGHT
+    HALF_WEIGHT_SAMPLES = 10.0
+
+    def __init__(self, db_path: str = DEFAULT_CROWD_DB, cell_deg: float = 0.01, half_life_days: float = 180.0,
+                 min_samples: float = 3.0):
+        self.db_path = db_path
+        self.cell_deg = cell_deg
+        self.half_life_days = half_life_days
+        self.decay = math.log(2) / (half_life_days * 86400.0)
+        self.min_samples = min_samples
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'CrowdSoilPrior':
+        """SOIL_CROWD_CELL_DEG, SOIL_CROWD_HALF_LIFE_DAYS, SOIL_CROWD_MIN_SAMPLES; counts live in the app database"""
+        return cls(
+            cell_deg=float(os.environ.get('SOIL_CROWD_CELL_DEG', '0.01')),
+            half_life_days=float(os.environ.get('SOIL_CROWD_HALF_LIFE_DAYS', '180')),
+            min_samples=float(os.environ.get('SOIL_CROWD_MIN_SAMPLES', '3'))
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # soil_crowd_cells is created by database.init_db()
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.create_function('crowd_decay', 1, self._decay, deterministic=True)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def valid_point(lat: float, lon: float) -> bool:
+        """Finite coordinates on the globe (anything else has no grid cell)"""
+        return (lat is not None and lon is not None and math.isfinite(lat) and math.isfinite(lon)
+                and -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0)
+
+    def cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        """Grid cell (row, col) of a valid_point; the cell spans row..row+1 times cell_deg in latitude"""
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def _decay(self, age: float) -> float:
+        """Weight left after `age` seconds (1.0 for samples from the future)"""
+        return math.exp(-self.decay * max(age, 0.0))
+
+    def record(self, lat: float, lon: float, scores: Dict[str, float], timestamp: float = None) -> bool:
+        """Add one result's scores (normalized to one sample) to its cell; False if not recorded"""
+        if not self.valid_point(lat, lon):
+            return False
+        total = sum(max(0.0, scores.get(t, 0.0)) for t in CROWD_SOIL_TYPES)
+        if not (0 < total < math.inf):
+            return False
+        timestamp = time.time() if timestamp is None else timestamp
+        row, col = self.cell(lat, lon)
+        values = [max(0.0, scores.get(t, 0.0)) / total for t in CROWD_SOIL_TYPES]
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute('''
+                        INSERT INTO soil_crowd_cells (cell_row, cell_col, sandy, clay, loamy, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(cell_row, cell_col) DO UPDATE SET
+                            sandy = sandy * crowd_decay(excluded.updated_at - updated_at)
+                                    + excluded.sandy * crowd_decay(updated_at - excluded.updated_at),
+                            clay = clay * crowd_decay(excluded.updated_at - updated_at)
+                                   + excluded.clay * crowd_decay(updated_at - excluded.updated_at),
+                            loamy = loamy * crowd_decay(excluded.updated_at - updated_at)
+                                    + excluded.loamy * crowd_decay(updated_at - excluded.updated_at),
+                            updated_at = MAX(updated_at, excluded.updated_at)
+                    ''', (row, col, *values, timestamp))
+        except sqlite3.Error as e:
+            logging.error(f"Could not record crowd soil sample: {e}")
+            return False
+        return True
+
+    def counts(self, lat: float, lon: float, now: float = None) -> Optional[np.ndarray]:
+        """Decayed (Sandy, Clay, Loamy) counts of the point's cell, None if it has none"""
+        if not self.valid_point(lat, lon):
+            return None
+        row, col = self.cell(lat, lon)
+        try:
+            with self._lock:
+                found = self._connection().execute(
+                    "SELECT sandy, clay, loamy, updated_at FROM soil_crowd_cells WHERE cell_row = ? AND cell_col = ?",
+                    (row, col)).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Could not read crowd soil prior: {e}")
+            return None
+        if found is None:
+            return None
+        now = time.time() if now is None else now
+        return np.array(found[:3], dtype=np.float64) * self._decay(now - found[3])
+
+    def get_prior(self, lat: float, lon: float, now: float = None) -> Optional[Dict]:
+        """
+        Soil prior of the point's cell with its blend weight, or None while the
+        cell has fewer than min_samples decayed samples.
+        """
+        counts = self.counts(lat, lon, now)
+        if counts is None:
+            return None
+        samples = float(counts.sum())
+        if samples < self.min_samples:
+            return None
+        return {
+            'cell': list(self.cell(lat, lon)),
+            'samples': round(samples, 2),
+            'soil_prior': {t: round(float(c / samples), 3) for t, c in zip(CROWD_SOIL_TYPES, counts)},
+            'weight': round(self.MAX_WEIGHT * samples / (samples + self.HALF_WEIGHT_SAMPLES), 4)
+        }
+
+    def export(self, since: float = None, min_samples: float = 0.0, now: float = None) -> np.ndarray:
+        """
+        All cells (or those updated after `since`) with at least min_samples
+        decayed samples, as EXPORT_DTYPE records decayed to `now`.
+        """
+        now = time.time() if now is None else now
+        try:
+            with self._lock:
+                found = self._connection().execute(
+                    "SELECT cell_row, cell_col, sandy, clay, loamy, updated_at FROM soil_crowd_cells WHERE updated_at > ?",
+                    (-math.inf if since is None else since,)).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Could not export crowd soil prior: {e}")
+            found = []
+
+        table = np.array(found, dtype=np.float64).reshape(-1, 6)
+        counts = table[:, 2:5] * np.exp(-self.decay * np.maximum(now - table[:, 5], 0.0))[:, np.newaxis]
+        samples = counts.sum(axis=1)
+        keep = (samples > 0) & (samples >= min_samples)
+
+        records = np.zeros(int(keep.sum()), dtype=EXPORT_DTYPE)
+        records['row'] = table[keep, 0]
+        records['col'] = table[keep, 1]
+        records['samples'] = samples[keep]
+        records['prior'] = np.rint(counts[keep] / samples[keep, np.newaxis] * 255)
+        return records
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import Callable, Dict, List
+
+# Declarative disease rules (see disease_rules.json), compiled to NumPy mask
+# expressions. The same compiled table diagnoses one leaf (arrays of length 1)
+# or a whole archive of stored feature vectors (see feature_store.py) at once.
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'disease_rules.json')
+
+CONFIDENCE_LEVELS = ('High', 'Medium', 'Low')
+
+# Numeric confidence stored in test_results for each confidence level
+CONFIDENCE_SCORES = {'High': 0.50, 'Medium': 0.45, 'Low': 0.40}
+
+_OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+
+def health_status(diagnosis_type: str) -> str:
+    """Health status stored in the detections table for a diagnosis type"""
+    if diagnosis_type == 'healthy':
+        return 'Healthy'
+    if diagnosis_type == 'unknown':
+        return 'Unknown'
+    return 'Diseased'
+
+
+# --- COMPILER ---
+def _compile_value(value, features: set) -> Callable:
+    """Number, feature name, {"feature": name}, {"max": [...]} or {"min": [...]}"""
+    if isinstance(value, (int, float)):
+        constant = float(value)
+        return lambda cols, n: np.full(n, constant)
+    if isinstance(value, str):
+        features.add(value)
+        return lambda cols, n: cols[value]
+    if isinstance(value, dict) and 'feature' in value:
+        return _compile_value(value['feature'], features)
+    if isinstance(value, dict) and ('max' in value or 'min' in value):
+        reduce_fn = np.maximum if 'max' in value else np.minimum
+        parts = [_compile_value(v, features) for v in value.get('max', value.get('min'))]
+
+        def reduced(cols, n):
+            result = parts[0](cols, n)
+            for part in parts[1:]:
+                result = reduce_fn(result, part(cols, n))
+            return result
+        return reduced
+    raise ValueError(f"Invalid value expression: {value!r}")
+
+
+def _compile_condition(cond, features: set) -> Callable:
+    """[feature, op, value] leaves combined with {"all"}, {"any"}, {"not"}; None = always"""
+    if cond is None or cond == {} or cond == []:
+        return lambda cols, n: np.ones(n, dtype=bool)
+
+    if isinstance(cond, list):
+        if len(cond) != 3 or cond[1] not in _OPERATORS:
+            raise ValueError(f"Invalid condition: {cond!r}")
+        left = _compile_value(cond[0], features)
+        op = _OPERATORS[cond[1]]
+        right = _compile_value(cond[2], features)
+        return lambda cols, n: op(left(cols, n), right(cols, n))
+
+    if isinstance(cond, dict):
+        if 'all' in cond or 'any' in cond:
+            combine = np.logical_and if 'all' in cond else np.logical_or
+            parts = [_compile_condition(c, features) for c in cond.get('all', cond.get('any'))]
+
+            def combined(cols, n):
+                result = parts[0](cols, n)
+                for part in parts[1:]:
+                    result = combine(result, part(cols, n))
+                return result
+            return combined
+        if 'not' in cond:
+            inner = _compile_condition(cond['not'], features)
+            return lambda cols, n: ~inner(cols, n)
+
+    raise ValueError(f"Invalid condition: {cond!r}")
+
+
+def _compile_confidence(conf, features: set) -> Callable:
+    """"High" / "Medium" / "Low" or {"if": cond, "then": level, "else": level}; returns level indices"""
+    if isinstance(conf, str):
+        level = CONFIDENCE_LEVELS.index(conf)
+        return lambda cols, n: np.full(n, level, dtype=np.int8)
+    if isinstance(conf, dict) and 'if' in conf:
+        cond = _compile_condition(conf['if'], features)
+        then_level = CONFIDENCE_LEVELS.index(conf['then'])
+        else_level = CONFIDENCE_LEVELS.index(conf['else'])
+        return lambda cols, n: np.where(cond(cols, n), then_level, else_level).astype(np.int8)
+    raise ValueError(f"Invalid confidence expression: {conf!r}")
+
+
+class _CompiledTable:
+    """Immutable compiled form of one table version"""
+
+    def __init__(self, spec: Dict):
+        self.version = str(spec['version'])
+        # Content digest: changes with any edit, even one that keeps the version string
+        self.digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        rules = sorted(spec['rules'], key=lambda r: r['priority'])
+        if not rules or rules[-1].get('when'):
+            raise ValueError("Decision table needs a lowest-priority default rule without 'when'")
+
+        self.features = set()
+        self.rules = []
+        self.outputs = []
+        for rule in rules:
+            output = rule['output']
+            self.rules.append((
+                _compile_condition(rule.get('when'), self.features),
+                _compile_confidence(output.get('confidence', 'Low'), self.features),
+                _compile_value(output.get('score', 0.0), self.features),
+            ))
+            self.outputs.append({
+                'id': rule['id'],
+                'name': output['name'],
+                'type': output['type'],
+                'symptoms': list(output.get('symptoms', [])),
+                'original_symptoms': list(output.get('original_symptoms', []))
+            })
+        self.spec = spec
+
+
+class DecisionTable:
+    """
+    Versioned, hot-reloadable disease decision table.
+
+    The backing JSON file is re-checked (by mtime) at most every
+    RELOAD_CHECK_INTERVAL seconds; a broken edit is logged and the last good
+    table stays active, so rules can be tuned without restarting the server.
+    """
+
+    RELOAD_CHECK_INTERVAL = 2.0
+
+    def __init__(self, path: str = DEFAULT_RULES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._table = None
+        self.reload()
+
+    @classmethod
+    def from_spec(cls, spec: Dict) -> 'DecisionTable':
+        """Build an in-memory table (no backing file, never reloads)"""
+        table = cls.__new__(cls)
+        table.path = None
+        table._lock = threading.Lock()
+        table._mtime = None
+        table._next_check = float('inf')
+        table._table = _CompiledTable(spec)
+        return table
+
+    # --- LOADING ---
+    def reload(self) -> bool:
+        """(Re)compile the table from disk. Returns True if a new version was loaded."""
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path) as f:
+                compiled = _CompiledTable(json.load(f))
+            self._table = compiled
+            self._mtime = mtime
+            self._next_check = time.monotonic() + self.RELOAD_CHECK_INTERVAL
+        logging.info(f"Disease decision table v{compiled.version} loaded ({len(compiled.rules)} rules)")
+        return True
+
+    def _maybe_reload(self):
+        if self.path is None or time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.RELOAD_CHECK_INTERVAL
+        try:
+            if os.path.getmtime(self.path) != self._mtime:
+                self.reload()
+        except Exception as e:
+            logging.error(f"Keeping decision table v{self._table.version}; reload failed: {e}")
+
+    @property
+    def table(self) -> _CompiledTable:
+        self._maybe_reload()
+        return self._table
+
+    @property
+    def version(self) -> str:
+        return self.table.version
+
+    @property
+    def digest(self) -> str:
+        return self.table.digest
+
+    @property
+    def required_features(self) -> List[str]:
+        return sorted(self.table.features)
+
+    @property
+    def outputs(self) -> List[Dict]:
+        return self.table.outputs
+
+    @property
+    def spec(self) -> Dict:
+        return self.table.spec
+
+    # --- EVALUATION ---
+    def evaluate_batch(self, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        Diagnose N leaves at once.
+        columns: {feature_name: array of shape (N,)}; missing features count as 0.
+        Returns index arrays into `outputs` / CONFIDENCE_LEVELS, the scores and
+        the table version that produced them.
+        """
+        table = self.table  # one consistent version for the whole batch
+        n = len(next(iter(columns.values()))) if columns else 1
+        cols = {name: np.asarray(columns[name], dtype=np.float64) if name in columns else np.zeros(n)
+                for name in table.features}
+
+        matched = [when(cols, n) for when, _, _ in table.rules]
+        choices = np.arange(len(table.rules))
+        diagnosis = np.select(matched, choices, default=len(table.rules) - 1)
+
+        selectors = [diagnosis == i for i in choices]
+        confidence = np.select(selectors, [conf_fn(cols, n) for _, conf_fn, _ in table.rules], default=2)
+        score = np.select(selectors, [score_fn(cols, n) for _, _, score_fn in table.rules], default=0.0)
+
+        return {
+            'diagnosis': diagnosis.astype(np.int16),
+            'confidence': confidence.astype(np.int8),
+            'score': score,
+            'version': table.version,
+            'outputs': table.outputs
+        }
+
+    def evaluate_one(self, color_features: Dict, shape_features: Dict, texture_features: Dict) -> List[Dict]:
+        """Single-leaf form with detect_diseases' return shape (same compiled masks, N=1)"""
+        merged = {}
+        for group in (texture_features, shape_features, color_features):
+            merged.update(group)
+        columns = {key: np.array([merged.get(key, 0) or 0], dtype=np.float64) for key in self.table.features}
+        result = self.evaluate_batch(columns)
+        return [diagnosis_dict(result, 0)]
+
+
+def diagnosis_dict(result: Dict, i: int) -> Dict:
+    """Build the dict detect_diseases returns for row i of an evaluate_batch result"""
+    output = result['outputs'][int(result['diagnosis'][i])]
+    return {
+        'name': output['name'],
+        'type': output['type'],
+        'confidence': CONFIDENCE_LEVELS[int(result['confidence'][i])],
+        'score': float(result['score'][i]),
+        'symptoms': list(output['symptoms']),
+        'original_symptoms': list(output['original_symptoms'])
+    }
@@ -0,0 +1,268 @@
+import os
+import json
+import threading
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl  # POSIX only; used to serialize writers across worker processes
+except ImportError:
+    fcntl = None
+
+
+# Bump when the feature extraction or the key layout below changes.
+# Each schema version gets its own store directory.
+FEATURE_SCHEMA_VERSION = 1
+
+SHAPE_FEATURE_KEYS = (
+    'aspect_ratio', 'solidity', 'circularity', 'extent', 'curl_index',
+    'hu_0', 'hu_1', 'hu_2', 'hu_3', 'hu_4', 'hu_5', 'hu_6',
+    'eccentricity', 'orientation', 'compactness', 'relative_size',
+)
+
+TEXTURE_FEATURE_KEYS = (
+    'edge_density', 'lbp_energy', 'lbp_entropy', 'lbp_uniformity',
+    'hue_mean', 'hue_std', 'saturation_mean', 'saturation_std', 'value_mean', 'value_std',
+    'contrast', 'homogeneity', 'energy', 'correlation',
+)
+
+COLOR_FEATURE_KEYS = (
+    'red_index', 'healthy_green', 'yellowing', 'necrosis_brown', 'orange_rust',
+    'white_mildew', 'black_spots', 'water_soaked', 'gray_blight', 'spot_index',
+)
+
+FEATURE_KEYS = SHAPE_FEATURE_KEYS + TEXTURE_FEATURE_KEYS + COLOR_FEATURE_KEYS
+FEATURE_INDEX = {key: i for i, key in enumerate(FEATURE_KEYS)}
+
+
+def features_to_vector(shape_features: Dict, texture_features: Dict, color_features: Dict) -> np.ndarray:
+    """Pack the engine's feature dicts into one float32 row (missing keys -> 0, like .get(key, 0))"""
+    vector = np.zeros(len(FEATURE_KEYS), dtype=np.float32)
+    for group, keys in ((shape_features, SHAPE_FEATURE_KEYS),
+                        (texture_features, TEXTURE_FEATURE_KEYS),
+                        (color_features, COLOR_FEATURE_KEYS)):
+        for key in keys:
+            vector[FEATURE_INDEX[key]] = float(group.get(key, 0) or 0)
+    return vector
+
+
+def validate_features(shape_features: Dict, texture_features: Dict, color_features: Dict,
+                      required: List[str] = ()) -> List[str]:
+    """Problems with an externally supplied feature payload (empty list = valid)"""
+    errors = []
+    for group_name, group, keys in (('shape', shape_features, SHAPE_FEATURE_KEYS),
+                                    ('texture', texture_features, TEXTURE_FEATURE_KEYS),
+                                    ('color', color_features, COLOR_FEATURE_KEYS)):
+        unknown = sorted(set(group) - set(keys))
+        if unknown:
+            errors.append(f"unknown {group_name} features: {', '.join(unknown)}")
+        for key, value in group.items():
+            if not isinstance(value, (int, float)) or not np.isfinite(value):
+                errors.append(f"{group_name}.{key} must be a finite number")
+
+    supplied = set(shape_features) | set(texture_features) | set(color_features)
+    missing = [key for key in required if key not in supplied]
+    if missing:
+        errors.append(f"missing required features: {', '.join(missing)}")
+    return errors
+
+
+def vector_to_features(vector: np.ndarray) -> Tuple[Dict, Dict, Dict]:
+    """Inverse of features_to_vector: returns (shape, texture, color) dicts"""
+    values = [float(v) for v in vector]
+    shape = {key: values[FEATURE_INDEX[key]] for key in SHAPE_FEATURE_KEYS}
+    texture = {key: values[FEATURE_INDEX[key]] for key in TEXTURE_FEATURE_KEYS}
+    color = {key: values[FEATURE_INDEX[key]] for key in COLOR_FEATURE_KEYS}
+    return shape, texture, color
+
+
+class FeatureStore:
+    """
+    Append-only columnar store of per-detection feature vectors.
+
+    Rows live in fixed-size chunks of two .npy files (int64 detection ids and a
+    float32 matrix, one column per FEATURE_KEYS entry). Chunks are preallocated,
+    so appends are plain memmap writes and bulk reads are zero-copy memmaps.
+    An id of 0 marks an unused slot (SQLite AUTOINCREMENT ids start at 1).
+    """
+
+    CHUNK_ROWS = 65536
+
+    def __init__(self, root_dir: str, chunk_rows: int = None):
+        """chunk_rows only applies to a new store; an existing one keeps the size in its meta.json"""
+        self.chunk_rows = chunk_rows or self.CHUNK_ROWS
+        self.store_dir = os.path.join(root_dir, f"v{FEATURE_SCHEMA_VERSION}")
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._active = None  # (chunk_no, ids memmap, features memmap)
+        self._listeners = []
+        with self._file_lock():
+            self._load_meta()
+
+    def _load_meta(self):
+        meta_path = os.path.join(self.store_dir, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.chunk_rows = json.load(f)['chunk_rows']
+            return
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'schema_version': FEATURE_SCHEMA_VERSION,
+                'feature_keys': list(FEATURE_KEYS),
+                'chunk_rows': self.chunk_rows
+            }, f, indent=2)
+
+    # --- PATHS ---
+    def _chunk_paths(self, chunk_no: int) -> Tuple[str, str]:
+        prefix = os.path.join(self.store_dir, f"chunk_{chunk_no:05d}")
+        return f"{prefix}.ids.npy", f"{prefix}.features.npy"
+
+    def _chunk_numbers(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.store_dir):
+            if name.startswith('chunk_') and name.endswith('.ids.npy'):
+                numbers.append(int(name[len('chunk_'):-len('.ids.npy')]))
+        return sorted(numbers)
+
+    @staticmethod
+    def _row_count(ids: np.ndarray) -> int:
+        # Slots are filled in order, so the used rows are the non-zero prefix
+        return int(np.count_nonzero(ids))
+
+    # --- WRITES ---
+    def _open_chunk_for_write(self, chunk_no: int):
+        ids_path, features_path = self._chunk_paths(chunk_no)
+        if os.path.exists(ids_path):
+            ids = np.load(ids_path, mmap_mode='r+')
+            features = np.load(features_path, mmap_mode='r+')
+        else:
+            features = np.lib.format.open_memmap(
+                features_path, mode='w+', dtype=np.float32, shape=(self.chunk_rows, len(FEATURE_KEYS)))
+            # ids file is created last: its existence marks a complete chunk
+            ids = np.lib.format.open_memmap(
+                ids_path, mode='w+', dtype=np.int64, shape=(self.chunk_rows,))
+        return chunk_no, ids, features
+
+    def append(self, detection_id: int, vector: np.ndarray):
+        """Append one detection's feature vector"""
+        if detection_id is None:
+            return
+
+        with self._lock, self._file_lock():
+            if self._active is None:
+                chunks = self._chunk_numbers()
+                self._active = self._open_chunk_for_write(chunks[-1] if chunks else 0)
+
+            chunk_no, ids, features = self._active
+            row = self._row_count(ids)  # re-read: another process may have appended
+            while row >= len(ids):  # the chunk's own capacity
+                self._active = self._open_chunk_for_write(chunk_no + 1)
+                chunk_no, ids, features = self._active
+                row = self._row_count(ids)
+
+            features[row] = np.asarray(vector, dtype=np.float32)
+            ids[row] = detection_id  # written last, so readers never see a partial row
+
+        for listener in self._listeners:
+            listener(detection_id)
+
+    def add_listener(self, callback):
+        """Call callback(detection_id) after every append made through this instance"""
+        self._listeners.append(callback)
+
+    def _file_lock(self):
+        return _FileLock(os.path.join(self.store_dir, '.lock'))
+
+    def flush(self):
+        with self._lock:
+            if self._active is not None:
+                self._active[1].flush()
+                self._active[2].flush()
+
+    # --- READS ---
+    def iter_chunks(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yield (ids, features) read-only memmaps per chunk, trimmed to the used rows"""
+        for chunk_no in self._chunk_numbers():
+            ids_path, features_path = self._chunk_paths(chunk_no)
+            ids = np.load(ids_path, mmap_mode='r')
+            rows = self._row_count(ids)
+            if rows == 0:
+                continue
+            features = np.load(features_path, mmap_mode='r')
+            yield ids[:rows], features[:rows]
+
+    def load(self, columns: Optional[List[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Load all rows as (ids, matrix); optionally only the given feature columns"""
+        col_idx = [FEATURE_INDEX[c] for c in columns] if columns else None
+        id_parts, feature_parts = [], []
+        for ids, features in self.iter_chunks():
+            id_parts.append(np.asarray(ids))
+            feature_parts.append(np.asarray(features if col_idx is None else features[:, col_idx]))
+
+        width = len(col_idx) if col_idx is not None else len(FEATURE_KEYS)
+        if not id_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, width), dtype=np.float32)
+        return np.concatenate(id_parts), np.concatenate(feature_parts)
+
+    def load_columns(self, columns: Optional[List[str]] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """Like load(), but returns a {feature_name: column array} dict"""
+        columns = list(columns or FEATURE_KEYS)
+        ids, matrix = self.load(columns)
+        return ids, {name: matrix[:, i] for i, name in enumerate(columns)}
+
+    def read_since(self, position: Tuple[int, int] = (0, 0)) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int]]:
+        """
+        Rows appended after `position` (a (chunk_no, row) watermark, (0, 0) = start).
+        Returns (ids, matrix, new_position); pass new_position back in to tail the store.
+        """
+        start_chunk, start_row = position
+        id_parts, feature_parts = [], []
+        for chunk_no in self._chunk_numbers():
+            if chunk_no < start_chunk:
+                continue
+            ids_path, features_path = self._chunk_paths(chunk_no)
+            ids = np.load(ids_path, mmap_mode='r')
+            rows = self._row_count(ids)
+            first = start_row if chunk_no == start_chunk else 0
+            if rows > first:
+                features = np.load(features_path, mmap_mode='r')
+                id_parts.append(np.array(ids[first:rows]))
+                feature_parts.append(np.array(features[first:rows]))
+            position = (chunk_no, max(rows, first))
+
+        if not id_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, len(FEATURE_KEYS)), dtype=np.float32), position
+        return np.concatenate(id_parts), np.concatenate(feature_parts), position
+
+    def get(self, detection_id: int) -> Optional[np.ndarray]:
+        """Feature vector of one detection, or None if it was never stored"""
+        for ids, features in self.iter_chunks():
+            hits = np.flatnonzero(ids == detection_id)
+            if hits.size:
+                return np.array(features[hits[-1]])
+        return None
+
+    def __len__(self):
+        return sum(len(ids) for ids, _ in self.iter_chunks())
+
+
+class _FileLock:
+    """Exclusive advisory lock on a lock file (no-op where fcntl is unavailable)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        return False
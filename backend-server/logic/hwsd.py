@@ -0,0 +1,300 @@
+import os
+import csv
+import json
+import sqlite3
+import logging
+import threading
+import subprocess
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Harmonized World Soil Database v2 as a point soil prior. HWSD2 ships as a
+# global 30" raster of soil mapping unit (SMU) ids plus an Access database of
+# unit compositions; ingest_hwsd.py crops the raster to the area we serve and
+# flattens the topsoil attributes into SQLite, so the server needs neither
+# Access drivers nor the 88 MB .mdb at runtime.
+
+DEFAULT_HWSD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "hwsd")
+
+RASTER_FILE = "hwsd_smu.npy"
+HEADER_FILE = "hwsd.json"
+ATTRIBUTES_FILE = "hwsd.sqlite"
+
+# Raster value of cells with no mapping unit (sea, outside the source grid)
+NODATA_SMU = 0
+
+# HWSD2 TEXTURE_USDA codes: name and the share of each SOIL_TYPES class it counts towards
+USDA_TEXTURES = {
+    1: ('clay (heavy)', {'Clay': 1.0}),
+    2: ('silty clay', {'Clay': 1.0}),
+    3: ('clay', {'Clay': 1.0}),
+    4: ('silty clay loam', {'Clay': 0.5, 'Loamy': 0.5}),
+    5: ('clay loam', {'Clay': 0.5, 'Loamy': 0.5}),
+    6: ('silt', {'Loamy': 1.0}),
+    7: ('silt loam', {'Loamy': 1.0}),
+    8: ('sandy clay', {'Clay': 1.0}),
+    9: ('loam', {'Loamy': 1.0}),
+    10: ('sandy clay loam', {'Clay': 0.5, 'Loamy': 0.5}),
+    11: ('sandy loam', {'Sandy': 1.0}),
+    12: ('loamy sand', {'Sandy': 1.0}),
+    13: ('sand', {'Sandy': 1.0}),
+}
+
+TOPSOIL_LAYER = 'D1'  # 0-20 cm
+
+# India by default; the cropped uint32 raster is ~55 MB
+DEFAULT_BOUNDS = {'lat_top': 37.5, 'lat_bottom': 6.0, 'lon_left': 68.0, 'lon_right': 97.5}
+
+
+class HwsdSoilDatabase:
+    """
+    Point lookups into an ingested HWSD2 store: SMU id from the memmapped
+    raster in O(1), unit attributes from SQLite, cached per unit.
+    """
+
+    def __init__(self, store_dir: str = DEFAULT_HWSD_DIR):
+        self.store_dir = store_dir
+        self.raster = None
+        self.header = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._units: Dict[int, Optional[Dict]] = {}
+
+        header_path = os.path.join(store_dir, HEADER_FILE)
+        if not os.path.exists(header_path):
+            return
+        try:
+            with open(header_path) as f:
+                self.header = json.load(f)
+            self.raster = np.asarray(np.load(os.path.join(store_dir, RASTER_FILE), mmap_mode='r'))
+            self._conn = sqlite3.connect(f"file:{os.path.join(store_dir, ATTRIBUTES_FILE)}?mode=ro",
+                                         uri=True, check_same_thread=False)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            logging.error(f"HWSD store {store_dir} unusable: {e}")
+            self.raster, self.header, self._conn = None, None, None
+            return
+
+        bounds = self.header['bounds']
+        self.lat_top, self.lat_bottom = bounds['lat_top'], bounds['lat_bottom']
+        self.lon_left, self.lon_right = bounds['lon_left'], bounds['lon_right']
+        self.height, self.width = self.raster.shape
+        logging.info(f"HWSD2 soil prior loaded: {self.width}x{self.height}, {self.header['units']} units")
+
+    @classmethod
+    def from_env(cls) -> 'HwsdSoilDatabase':
+        """Store in HWSD_DIR (default: hwsd/)"""
+        return cls(os.environ.get('HWSD_DIR', DEFAULT_HWSD_DIR))
+
+    @property
+    def available(self) -> bool:
+        return self.raster is not None
+
+    def lookup_unit(self, lat: float, lon: float) -> int:
+        """SMU id at a point, NODATA_SMU outside the store"""
+        if not self.available or lat is None or lon is None:
+            return NODATA_SMU
+        if not (self.lat_bottom <= lat <= self.lat_top and self.lon_left <= lon <= self.lon_right):
+            return NODATA_SMU
+        x = min(int((lon - self.lon_left) / (self.lon_right - self.lon_left) * self.width), self.width - 1)
+        y = min(int((self.lat_top - lat) / (self.lat_top - self.lat_bottom) * self.height), self.height - 1)
+        return int(self.raster[y, x])
+
+    def unit_attributes(self, smu_id: int) -> Optional[Dict]:
+        """Topsoil attributes of a mapping unit (None for unknown units)"""
+        if smu_id == NODATA_SMU or self._conn is None:
+            return None
+        if smu_id in self._units:
+            return self._units[smu_id]
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT texture_usda, texture_class, ph, organic_carbon, sand, silt, clay, "
+                "prior_sandy, prior_clay, prior_loamy, components FROM hwsd_units WHERE smu_id = ?",
+                (smu_id,)
+            ).fetchone()
+        unit = None
+        if row is not None:
+            unit = {
+                'smu_id': smu_id,
+                'texture_usda': row[0],
+                'texture_class': row[1],
+                'ph': row[2],
+                'organic_carbon': row[3],
+                'sand': row[4],
+                'silt': row[5],
+                'clay': row[6],
+                'soil_prior': {'Sandy': row[7], 'Clay': row[8], 'Loamy': row[9]} if row[7] is not None else None,
+                'components': row[10],
+            }
+        self._units[smu_id] = unit
+        return unit
+
+    def get_prior(self, lat: float, lon: float) -> Optional[Dict]:
+        """Attributes and SOIL_TYPES prior of the unit at a point, or None"""
+        return self.unit_attributes(self.lookup_unit(lat, lon))
+
+
+# --- INGESTION ---
+def read_bil_header(hdr_path: str) -> Dict[str, str]:
+    header = {}
+    with open(hdr_path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2:
+                header[parts[0].upper()] = parts[1]
+    return header
+
+
+def read_bil_window(bil_path: str, bounds: Dict) -> Tuple[np.ndarray, Dict]:
+    """
+    Crop an ESRI .bil grid (HWSD2.bil + HWSD2.hdr) to `bounds` without reading
+    the rest of the file. Returns the uint32 window and its snapped bounds.
+    """
+    header = read_bil_header(os.path.splitext(bil_path)[0] + ".hdr")
+    rows, cols = int(header['NROWS']), int(header['NCOLS'])
+    if int(header.get('NBANDS', 1)) != 1:
+        raise ValueError(f"{bil_path}: expected a single band")
+    nbits = int(header.get('NBITS', 16))
+    signed = header.get('PIXELTYPE', '').upper().startswith('SIGNED')
+    byteorder = '>' if header.get('BYTEORDER', 'I').upper() == 'M' else '<'
+    dtype = np.dtype(f"{byteorder}{'i' if signed else 'u'}{nbits // 8}")
+
+    xdim, ydim = float(header['XDIM']), float(header['YDIM'])
+    left = float(header['ULXMAP']) - xdim / 2  # ULXMAP/ULYMAP are cell centres
+    top = float(header['ULYMAP']) + ydim / 2
+
+    col0 = max(0, int(np.floor((bounds['lon_left'] - left) / xdim)))
+    col1 = min(cols, int(np.ceil((bounds['lon_right'] - left) / xdim)))
+    row0 = max(0, int(np.floor((top - bounds['lat_top']) / ydim)))
+    row1 = min(rows, int(np.ceil((top - bounds['lat_bottom']) / ydim)))
+    if col1 <= col0 or row1 <= row0:
+        raise ValueError(f"{bil_path}: bounds do not overlap the grid")
+
+    grid = np.memmap(bil_path, dtype=dtype, mode='r', shape=(rows, cols))
+    window = np.array(grid[row0:row1, col0:col1]).astype(np.int64)
+    nodata = header.get('NODATA')
+    if nodata is not None:
+        window[window == int(float(nodata))] = NODATA_SMU
+    window[window < 0] = NODATA_SMU
+
+    snapped = {'lat_top': top - row0 * ydim, 'lat_bottom': top - row1 * ydim,
+               'lon_left': left + col0 * xdim, 'lon_right': left + col1 * xdim}
+    return window.astype(np.uint32), snapped
+
+
+def read_mdb_table(mdb_path: str, table: str) -> Iterable[Dict[str, str]]:
+    """Rows of an Access table via mdbtools' mdb-export (ingestion only)"""
+    try:
+        output = subprocess.run(["mdb-export", mdb_path, table], check=True,
+                                capture_output=True, text=True).stdout
+    except FileNotFoundError:
+        raise ValueError("mdb-export not found: install mdbtools or pass --layers-csv "
+                         "with HWSD2_LAYERS exported from Access")
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"mdb-export {table} failed: {e.stderr.strip()}")
+    return csv.DictReader(output.splitlines())
+
+
+def _number(value) -> Optional[float]:
+    """HWSD2 marks missing values with negative codes (-9, -7, ...)"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number >= 0 else None
+
+
+def aggregate_units(layer_rows: Iterable[Dict[str, str]], smu_ids=None) -> Dict[int, Dict]:
+    """
+    Per-SMU topsoil summary from HWSD2_LAYERS rows: dominant texture, share-
+    weighted pH / organic carbon / sand / silt / clay and a SOIL_TYPES prior
+    from the texture of every component. Restricted to `smu_ids` if given.
+    """
+    components = defaultdict(list)
+    for row in layer_rows:
+        if row.get('LAYER', TOPSOIL_LAYER) != TOPSOIL_LAYER:
+            continue
+        smu_id = int(float(row['HWSD2_SMU_ID']))
+        if smu_ids is not None and smu_id not in smu_ids:
+            continue
+        share = _number(row.get('SHARE'))
+        if share:
+            components[smu_id].append((share, row))
+
+    units = {}
+    for smu_id, parts in components.items():
+        prior = {'Sandy': 0.0, 'Clay': 0.0, 'Loamy': 0.0}
+        texture_shares = defaultdict(float)
+        sums, weights = defaultdict(float), defaultdict(float)
+        for share, row in parts:
+            texture = _number(row.get('TEXTURE_USDA'))
+            if texture is not None and int(texture) in USDA_TEXTURES:
+                texture_shares[int(texture)] += share
+                for soil_type, weight in USDA_TEXTURES[int(texture)][1].items():
+                    prior[soil_type] += share * weight
+            for key, column in (('ph', 'PH_WATER'), ('organic_carbon', 'ORG_CARBON'),
+                                ('sand', 'SAND'), ('silt', 'SILT'), ('clay', 'CLAY')):
+                value = _number(row.get(column))
+                if value is not None:
+                    sums[key] += share * value
+                    weights[key] += share
+
+        total = sum(prior.values())
+        dominant = max(texture_shares.items(), key=lambda item: item[1])[0] if texture_shares else None
+        unit = {key: round(sums[key] / weights[key], 2) if weights[key] else None
+                for key in ('ph', 'organic_carbon', 'sand', 'silt', 'clay')}
+        unit.update({
+            'texture_usda': dominant,
+            'texture_class': USDA_TEXTURES[dominant][0] if dominant else None,
+            'prior': {k: round(v / total, 4) for k, v in prior.items()} if total else None,
+            'components': len(parts),
+        })
+        units[smu_id] = unit
+    return units
+
+
+def write_store(store_dir: str, raster: np.ndarray, bounds: Dict, units: Dict[int, Dict], source: str) -> Dict:
+    """Write the raster, the attribute table and hwsd.json (last, marking the store complete)"""
+    os.makedirs(store_dir, exist_ok=True)
+    np.save(os.path.join(store_dir, RASTER_FILE + ".tmp.npy"), np.ascontiguousarray(raster, dtype=np.uint32))
+    os.replace(os.path.join(store_dir, RASTER_FILE + ".tmp.npy"), os.path.join(store_dir, RASTER_FILE))
+
+    db_tmp = os.path.join(store_dir, ATTRIBUTES_FILE + ".tmp")
+    if os.path.exists(db_tmp):
+        os.remove(db_tmp)
+    conn = sqlite3.connect(db_tmp)
+    conn.execute('''
+        CREATE TABLE hwsd_units (
+            smu_id INTEGER PRIMARY KEY,
+            texture_usda INTEGER,
+            texture_class TEXT,
+            ph REAL,
+            organic_carbon REAL,
+            sand REAL,
+            silt REAL,
+            clay REAL,
+            prior_sandy REAL,
+            prior_clay REAL,
+            prior_loamy REAL,
+            components INTEGER
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO hwsd_units VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(smu_id, u['texture_usda'], u['texture_class'], u['ph'], u['organic_carbon'], u['sand'], u['silt'],
+          u['clay'], *((u['prior'][t] for t in ('Sandy', 'Clay', 'Loamy')) if u['prior'] else (None,) * 3),
+          u['components'])
+         for smu_id, u in sorted(units.items())]
+    )
+    conn.commit()
+    conn.close()
+    os.replace(db_tmp, os.path.join(store_dir, ATTRIBUTES_FILE))
+
+    header = {'bounds': bounds, 'width': int(raster.shape[1]), 'height': int(raster.shape[0]),
+              'nodata': NODATA_SMU, 'units': len(units), 'source': source}
+    with open(os.path.join(store_dir, HEADER_FILE + ".tmp"), 'w') as f:
+        json.dump(header, f, indent=2)
+    os.replace(os.path.join(store_dir, HEADER_FILE + ".tmp"), os.path.join(store_dir, HEADER_FILE))
+    return header
@@ -0,0 +1,169 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching for a batch inference function.
+
+    Callers submit() single items and get a concurrent.futures.Future back
+    (await it from async code with asyncio.wrap_future). A worker thread
+    takes the first waiting item, keeps collecting for up to max_wait_ms or
+    until max_batch_size items are gathered, runs batch_fn once on the list
+    and resolves every caller's future with its own result (or the batch's
+    exception).
+    """
+
+    # Wait / inference timings kept for percentile metrics
+    METRICS_WINDOW = 2048
+
+    def __init__(self, batch_fn: Callable[[List], List], max_batch_size: int = 8, max_wait_ms: float = 5.0,
+                 name: str = "inference"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+
+        self._metrics_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = Counter()
+        self._wait_ms = deque(maxlen=self.METRICS_WINDOW)
+        self._batch_ms = deque(maxlen=self.METRICS_WINDOW)
+
+        self._worker = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._worker.start()
+
+    # --- CALLERS ---
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        with self._metrics_lock:
+            self._requests += 1
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    def __call__(self, item):
+        """Blocking single-item call (for code running in a worker thread)"""
+        return self.submit(item).result()
+
+    # --- WORKER ---
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                results = self.batch_fn([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+                failed = False
+            except Exception as e:
+                logging.error(f"{self.name} batch of {len(batch)} failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                failed = True
+
+            finished = time.perf_counter()
+            with self._metrics_lock:
+                self._batches += 1
+                self._failed_batches += int(failed)
+                self._batch_sizes[len(batch)] += 1
+                self._wait_ms.extend((started - enqueued) * 1000 for _, _, enqueued in batch)
+                self._batch_ms.append((finished - started) * 1000)
+
+    # --- METRICS ---
+    def metrics(self) -> Dict:
+        with self._metrics_lock:
+            wait_ms = np.array(self._wait_ms)
+            batch_ms = np.array(self._batch_ms)
+            sizes = dict(sorted(self._batch_sizes.items()))
+            metrics = {
+                'name': self.name,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'requests': self._requests,
+                'batches': self._batches,
+                'failed_batches': self._failed_batches,
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'batch_size_histogram': sizes,
+            }
+
+        total = sum(size * count for size, count in sizes.items())
+        metrics['mean_batch_size'] = round(total / max(1, sum(sizes.values())), 2)
+        metrics['added_wait_ms'] = _summary(wait_ms)
+        metrics['batch_inference_ms'] = _summary(batch_ms)
+        return metrics
+
+
+def _summary(values: np.ndarray) -> Dict:
+    if values.size == 0:
+        return {'p50': None, 'p95': None, 'max': None}
+    return {
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p95': round(float(np.percentile(values, 95)), 3),
+        'max': round(float(values.max()), 3)
+    }
+
+
+class BatchedClassifier:
+    """
+    Drop-in wrapper giving an OnnxClassifier a micro-batched classify().
+    The engine calls classify() from request threads: preprocessing stays in
+    the caller's thread, and concurrent calls share one forward pass through
+    the MicroBatcher.
+    """
+
+    def __init__(self, classifier, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        self.classifier = classifier
+        self.mode = classifier.mode
+        self.min_confidence = classifier.min_confidence
+        self.batcher = MicroBatcher(classifier.classify_tensors, max_batch_size, max_wait_ms, name="onnx")
+
+    @classmethod
+    def from_env(cls, classifier):
+        """Wrap `classifier` per BATCH_MAX_SIZE / BATCH_MAX_WAIT_MS (BATCH_MAX_SIZE=1 disables batching)"""
+        max_batch_size = int(os.environ.get('BATCH_MAX_SIZE', '8'))
+        if classifier is None or max_batch_size <= 1:
+            return classifier
+        return cls(classifier, max_batch_size, float(os.environ.get('BATCH_MAX_WAIT_MS', '5')))
+
+    def classify(self, image):
+        return self.batcher(self.classifier.preprocess(image))
+
+    def classify_batch(self, images):
+        return self.classifier.classify_batch(images)
+
+    def info(self):
+        info = self.classifier.info()
+        info['batching'] = {'max_batch_size': self.batcher.max_batch_size, 'max_wait_ms': self.batcher.max_wait * 1000}
+        return info
+
+    def metrics(self):
+        return self.batcher.metrics()
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+import cv2
+from typing import Dict, List, Optional
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional dependency: the rule engine works without it
+    ort = None
+
+
+CLASSIFIER_MODES = ('rules', 'onnx', 'both')
+
+# ImageNet statistics, used by the usual torchvision/timm exports
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def quantize_model(model_path: str) -> str:
+    """int8 dynamic quantization of model_path, cached next to it as <name>.int8.onnx"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    root, ext = os.path.splitext(model_path)
+    quantized_path = f"{root}.int8{ext}"
+    if not os.path.exists(quantized_path) or os.path.getmtime(quantized_path) < os.path.getmtime(model_path):
+        tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+        logging.info(f"Quantized {model_path} -> {quantized_path}")
+    return quantized_path
+
+
+class OnnxClassifier:
+    """
+    Leaf disease classifier running an exported ONNX model on CPU.
+
+    The model takes NCHW float32 RGB images (ImageNet-normalized) and
+    returns class probabilities (or logits; softmax is applied when the output
+    does not already sum to 1). Class labels come from a `<model>.labels.json`
+    file or the model's `labels` metadata entry, either as plain names or as
+    {"name", "type"} objects so results map onto detect_diseases' format.
+    """
+
+    def __init__(self, model_path: str, quantize: bool = True, intra_op_threads: int = 0,
+                 mode: str = 'both', min_confidence: float = 0.6, labels: List = None):
+        if ort is None:
+            raise ImportError("onnxruntime is not installed")
+        if mode not in CLASSIFIER_MODES:
+            raise ValueError(f"Invalid classifier mode: {mode}")
+
+        self.source_path = model_path
+        self.model_path = quantize_model(model_path) if quantize else model_path
+        self.quantized = quantize
+        self.mode = mode
+        self.min_confidence = min_confidence
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads  # 0 = one per physical core
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Exports with a symbolic batch dimension can run many images per forward pass
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        height, width = model_input.shape[2:4]
+        self.input_size = (int(width) if isinstance(width, int) else 224,
+                           int(height) if isinstance(height, int) else 224)
+
+        self.labels = [self._label_entry(l) for l in (labels or self._load_labels())]
+
+    @classmethod
+    def from_env(cls) -> Optional['OnnxClassifier']:
+        """Build from ONNX_* / CLASSIFIER_MODE environment variables; None when not configured"""
+        model_path = os.environ.get('ONNX_MODEL_PATH')
+        mode = os.environ.get('CLASSIFIER_MODE', 'both')
+        if not model_path or mode == 'rules':
+            return None
+        if ort is None:
+            logging.warning("ONNX_MODEL_PATH is set but onnxruntime is not installed; using rules only")
+            return None
+
+        classifier = cls(
+            model_path,
+            quantize=os.environ.get('ONNX_QUANTIZE', '1') == '1',
+            intra_op_threads=int(os.environ.get('ONNX_INTRA_OP_THREADS', '0')),
+            mode=mode,
+            min_confidence=float(os.environ.get('ONNX_MIN_CONFIDENCE', '0.6'))
+        )
+        classifier.warmup()
+        return classifier
+
+    # --- LABELS ---
+    def _load_labels(self) -> List:
+        labels_path = os.path.splitext(self.source_path)[0] + '.labels.json'
+        if os.path.exists(labels_path):
+            with open(labels_path) as f:
+                return json.load(f)
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if 'labels' in metadata:
+            return json.loads(metadata['labels'])
+
+        n_classes = self.session.get_outputs()[0].shape[-1]
+        return [f"class_{i}" for i in range(n_classes if isinstance(n_classes, int) else 0)]
+
+    @staticmethod
+    def _label_entry(label) -> Dict:
+        if isinstance(label, dict):
+            return {'name': label['name'], 'type': label.get('type', 'unknown')}
+        return {'name': label, 'type': 'healthy' if 'healthy' in label.lower() else 'unknown'}
+
+    # --- INFERENCE ---
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        """BGR uint8 image -> (1, 3, H, W) float32 tensor"""
+        resized = cv2.resize(image, self.input_size, interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+        tensor = (rgb - IMAGENET_MEAN) / IMAGENET_STD
+        return np.ascontiguousarray(tensor.transpose(2, 0, 1)[np.newaxis])
+
+    def predict_proba(self, image: np.ndarray) -> np.ndarray:
+        return self.predict_proba_batch([image])[0]
+
+    def predict_proba_batch(self, images: List[np.ndarray]) -> np.ndarray:
+        """(N, classes) probabilities; one forward pass unless the model has a fixed batch size"""
+        return self.predict_proba_tensors([self.preprocess(image) for image in images])
+
+    def predict_proba_tensors(self, tensors: List[np.ndarray]) -> np.ndarray:
+        """Like predict_proba_batch, for already preprocessed (1, 3, H, W) tensors"""
+        if self.fixed_batch is None:
+            outputs = self.session.run(None, {self.input_name: np.concatenate(tensors)})[0]
+        else:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: t})[0] for t in tensors])
+        outputs = outputs.astype(np.float64)
+
+        is_probability = np.all(outputs >= 0, axis=1) & (np.abs(outputs.sum(axis=1) - 1.0) < 1e-3)
+        exp = np.exp(outputs - outputs.max(axis=1, keepdims=True))
+        softmax = exp / exp.sum(axis=1, keepdims=True)
+        return np.where(is_probability[:, np.newaxis], outputs, softmax)
+
+    def classify(self, image: np.ndarray) -> Dict:
+        """Top-1 prediction as a detect_diseases-style diagnosis dict"""
+        return self.classify_batch([image])[0]
+
+    def classify_batch(self, images: List[np.ndarray]) -> List[Dict]:
+        return [self._diagnosis(probs) for probs in self.predict_proba_batch(images)]
+
+    def classify_tensors(self, tensors: List[np.ndarray]) -> List[Dict]:
+        return [self._diagnosis(probs) for probs in self.predict_proba_tensors(tensors)]
+
+    def _diagnosis(self, probs: np.ndarray) -> Dict:
+        best = int(np.argmax(probs))
+        probability = float(probs[best])
+        label = self.labels[best] if best < len(self.labels) else self._label_entry(f"class_{best}")
+        return {
+            'name': label['name'],
+            'type': label['type'],
+            'confidence': 'High' if probability >= 0.8 else 'Medium' if probability >= 0.5 else 'Low',
+            'score': round(probability, 4),
+            'symptoms': [],
+            'original_symptoms': [],
+            'source': 'onnx'
+        }
+
+    def warmup(self, runs: int = 3) -> float:
+        """Run a few dummy inferences so the first request doesn't pay for lazy init; returns avg ms"""
+        dummy = np.zeros((self.input_size[1], self.input_size[0], 3), dtype=np.uint8)
+        started = time.perf_counter()
+        for _ in range(runs):
+            self.predict_proba(dummy)
+        avg_ms = (time.perf_counter() - started) * 1000 / runs
+        logging.info(f"ONNX classifier warm-up: {avg_ms:.1f} ms/inference ({self.model_path})")
+        return avg_ms
+
+    def info(self) -> Dict:
+        return {
+            'model': os.path.basename(self.source_path),
+            'quantized': self.quantized,
+            'mode': self.mode,
+            'input_size': self.input_size,
+            'classes': len(self.labels),
+            'batched_inputs': self.fixed_batch is None
+        }
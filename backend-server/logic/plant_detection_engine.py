@@ -3,6 +3,7 @@ import numpy as np
 import sys
 import os
 import json
+import logging
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
@@ -11,13 +12,45 @@ from sklearn.cluster import KMeans
 import sqlite3
 import os
 
+try:
+    from logic.feature_store import FeatureStore, features_to_vector
+    from logic.disease_rules import DecisionTable, DEFAULT_RULES_PATH, diagnosis_dict, health_status as diagnosis_health_status
+    from logic.plant_exemplars import PlantExemplarIndex, DEFAULT_EXEMPLARS_PATH
+except ImportError:  # running this file directly as a script
+    from feature_store import FeatureStore, features_to_vector
+    from disease_rules import DecisionTable, DEFAULT_RULES_PATH, diagnosis_dict, health_status as diagnosis_health_status
+    from plant_exemplars import PlantExemplarIndex, DEFAULT_EXEMPLARS_PATH
+
 
 class AutoPlantDiseaseDetector:
-    def __init__(self):
+    # Bumped whenever segmentation, rules or report rendering change, so that
+    # cached artifacts (e.g. rendered visual reports) are invalidated.
+    ENGINE_VERSION = "1.1.0"
+
+    # Colors highlighted as diseased areas in visual reports
+    REPORT_DISEASE_COLORS = ['white_mildew', 'orange_rust', 'necrosis_brown', 'water_soaked']
+
+    # Below this identification confidence the plant is reported as 'unknown'
+    MIN_PLANT_CONFIDENCE = 0.4
+
+    def __init__(self, rules_path=None, max_dim=800, grabcut_iterations=3, persist=True, classifier=None,
+                 exemplars_path=None):
         """
         Advanced Plant Disease Detector with Automatic Crop Identification
         Detects both plant type and disease from leaf images
+        
+        rules_path / max_dim / grabcut_iterations select a pipeline variant
+        (e.g. a shadow-mode candidate); persist=False skips the database and
+        feature store so a variant can be evaluated without side effects.
+        classifier: optional OnnxClassifier run alongside (mode 'both') or
+        instead of (mode 'onnx') the rule-based detect_diseases.
+        exemplars_path: labeled leaf exemplars (.npz, see build_plant_exemplars.py)
+        for kNN plant identification; hand-tuned scoring is used without them.
         """
+        self.classifier = classifier
+        self.max_dim = max_dim
+        self.grabcut_iterations = grabcut_iterations
+        self.persist = persist
         
         # Plant identification database - leaf characteristics
         self.plant_database = {
@@ -261,6 +294,9 @@ class AutoPlantDiseaseDetector:
             ]
         }
         
+        # Disease rules: declarative decision table, hot-reloaded when the file changes
+        self.rule_table = DecisionTable(rules_path or os.environ.get('DISEASE_RULES_PATH', DEFAULT_RULES_PATH))
+        
         # Treatment database
         self.treatment_database = {
             'fungal': {
@@ -290,9 +326,25 @@ class AutoPlantDiseaseDetector:
         self._init_extended_database()
         
         # Initialize results database
-        self._init_db()
+        self.feature_store = None
+        if self.persist:
+            self._init_db()
+            
+            # Per-detection feature vectors (for offline re-scoring / analysis)
+            BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            self.feature_store = FeatureStore(os.path.join(BASE_DIR, "database", "features"))
         
         print(f"Extended database: Total {len(self.plant_database)} plant types")
+        
+        # Labeled exemplars for kNN plant identification (optional)
+        self.plant_exemplars = None
+        exemplars_path = exemplars_path or os.environ.get('PLANT_EXEMPLARS_PATH', DEFAULT_EXEMPLARS_PATH)
+        if os.path.exists(exemplars_path):
+            try:
+                self.plant_exemplars = PlantExemplarIndex.load(exemplars_path)
+                print(f"Plant exemplars: {len(self.plant_exemplars)} leaves, {len(self.plant_exemplars.classes)} plants")
+            except Exception as e:
+                print(f"Failed to load plant exemplars: {e}")
 
     def _init_db(self):
         """Initialize SQLite database for storing results"""
@@ -343,11 +395,7 @@ class AutoPlantDiseaseDetector:
             diseases = results.get('disease_diagnosis', [])
             if diseases:
                 primary_diagnosis = diseases[0]['name']
-                health_status = 'Diseased'
-                if diseases[0]['type'] == 'healthy':
-                    health_status = 'Healthy'
-                elif diseases[0]['type'] == 'unknown':
-                    health_status = 'Unknown'
+                health_status = diagnosis_health_status(diseases[0]['type'])
             else:
                 primary_diagnosis = "No Analysis"
                 health_status = "Unknown"
@@ -368,11 +416,14 @@ class AutoPlantDiseaseDetector:
             ))
             
             conn.commit()
+            detection_id = cursor.lastrowid
             conn.close()
-            print(f"Results saved to database (ID: {cursor.lastrowid})")
+            print(f"Results saved to database (ID: {detection_id})")
+            return detection_id
             
         except Exception as e:
             print(f"Failed to save results to DB: {e}")
+            return None
 
     def _init_extended_database(self):
         """Initialize massive extended database using templates"""
@@ -562,7 +613,7 @@ class AutoPlantDiseaseDetector:
         """Preprocess image for analysis"""
         # Resize
         height, width = image.shape[:2]
-        max_dim = 800
+        max_dim = self.max_dim
         if max(height, width) > max_dim:
             scale = max_dim / max(height, width)
             new_width = int(width * scale)
@@ -592,7 +643,7 @@ class AutoPlantDiseaseDetector:
         height, width = image.shape[:2]
         rect = (int(width*0.1), int(height*0.1), int(width*0.8), int(height*0.8))
         
-        cv2.grabCut(image, mask_gc, rect, bgd_model, fgd_model, 3, cv2.GC_INIT_WITH_RECT)
+        cv2.grabCut(image, mask_gc, rect, bgd_model, fgd_model, self.grabcut_iterations, cv2.GC_INIT_WITH_RECT)
         
         grabcut_mask = np.where((mask_gc == 2) | (mask_gc == 0), 0, 1).astype('uint8') * 255
         
@@ -870,6 +921,9 @@ class AutoPlantDiseaseDetector:
     
     def identify_plant(self, shape_features, texture_features):
         """Identify plant type from extracted features"""
+        if self.plant_exemplars is not None:
+            return self.plant_exemplars.classify(shape_features, texture_features)
+        
         scores = {}
         
         for plant_name, plant_info in self.plant_database.items():
@@ -927,115 +981,49 @@ class AutoPlantDiseaseDetector:
         """
         Detect diseases using strict rule-based gating.
         Priority: Red Stress (Nutrient) > Viral (if Curled) > Fungal/Bacterial > Healthy
+        
+        The rules themselves live in logic/disease_rules.json (see DecisionTable);
+        only the top diagnosis is returned for clarity.
         """
-        detected_diseases = []
-        
-        # Extract Key Metrics
-        red_index = color_features.get('red_index', 0)
-        spot_index = color_features.get('spot_index', 0)
-        curl_index = shape_features.get('curl_index', 0)
-        yellow_index = color_features.get('yellowing', 0)
-        white_index = color_features.get('white_mildew', 0)
-        water_soaked_index = color_features.get('water_soaked', 0)
-        
-        # --- RULE 1: LAB-Based Nutrient Deficiency (Red/Purple Stress) ---
-        # "IF red_index > 0.15 AND spot_index < 0.1 AND curl_index < 0.25"
-        if red_index > 0.15 and spot_index < 0.1 and curl_index < 0.25:
-            detected_diseases.append({
-                'name': 'Nutrient Deficiency (Phos/Potassium)',
-                'type': 'nutritional',
-                'confidence': 'High',
-                'score': red_index,
-                'symptoms': ['Purple/Red discoloration', 'No major spots', 'Stunted growth'],
-                'original_symptoms': ['red_pigmentation', 'nutrient_stress']
-            })
-            return detected_diseases # Return immediately as this overrides others
-
-        # --- RULE 2: Viral Disease (Structural Gating) ---
-        # "Viral disease detection must be blocked unless curl_index > 0.25"
-        if curl_index > 0.25:
-            # Check for viral signs
-            score = 0
-            if yellow_index > 0.1: score += 0.4
-            if texture_features.get('edge_density', 0) > 0.2: score += 0.3
-            
-            if score > 0.5:
-                detected_diseases.append({
-                    'name': 'Leaf Curl Virus',
-                    'type': 'viral',
-                    'confidence': 'High' if curl_index > 0.4 else 'Medium',
-                    'score': curl_index,
-                    'symptoms': ['Severe leaf curling', 'Distortion', 'Stunted growth'],
-                    'original_symptoms': ['leaf_curl', 'mosaic']
-                })
-        
-        # --- RULE 3: Fungal/Bacterial (Spot & Color Analysis) ---
-        # Only check if we haven't found a major virus or stress issue yet
-        if not detected_diseases:
-            # Powdery Mildew
-            if white_index > 0.15:
-                detected_diseases.append({
-                    'name': 'Powdery Mildew',
-                    'type': 'fungal',
-                    'confidence': 'High',
-                    'score': white_index,
-                    'symptoms': ['White powdery patches'],
-                    'original_symptoms': ['powdery_mildew']
-                })
-            
-            # Bacterial/Fungal Spots
-            elif spot_index > 0.15 or water_soaked_index > 0.15:
-                # Differentiate based on water-soaked look
-                if water_soaked_index > spot_index:
-                    name = 'Bacterial Blight'
-                    type_ = 'bacterial'
-                else:
-                    name = 'Leaf Spot / Fungal Blight'
-                    type_ = 'fungal'
-                
-                detected_diseases.append({
-                    'name': name,
-                    'type': type_,
-                    'confidence': 'High' if spot_index > 0.25 else 'Medium',
-                    'score': max(spot_index, water_soaked_index),
-                    'symptoms': ['Dark lesions', 'Yellow halos'],
-                    'original_symptoms': ['spots', 'lesions']
-                })
-            
-            # Simple Yellowing (Nitrogen Deficiency) - Only if NOT viral/curled
-            elif yellow_index > 0.25 and curl_index < 0.2:
-                detected_diseases.append({
-                    'name': 'Nitrogen Deficiency',
-                    'type': 'nutritional',
-                    'confidence': 'Medium',
-                    'score': yellow_index,
-                    'symptoms': ['General Yellowing (Chlorosis)'],
-                    'original_symptoms': ['chlorosis']
-                })
-
-        # --- RULE 4: Default Conservative Diagnosis ---
-        # "If no strong rule matches, output Early Stage Stress / Unclear"
-        if not detected_diseases:
-            if color_features.get('healthy_green', 0) > 0.6:
-                detected_diseases.append({
-                    'name': 'Healthy Plant',
-                    'type': 'healthy',
-                    'confidence': 'High',
-                    'score': 0.9,
-                    'symptoms': ['Normal green color', 'Good structural integrity'],
-                    'original_symptoms': ['healthy']
-                })
-            else:
-                detected_diseases.append({
-                    'name': 'Early Stage Stress / Unclear',
-                    'type': 'unknown',
-                    'confidence': 'Low',
-                    'score': 0.3,
-                    'symptoms': ['Mild discoloration', 'No specific pattern detected'],
-                    'original_symptoms': ['unclear_symptoms']
-                })
-        
-        return detected_diseases[:1] # Return top diagnosis only for clarity
+        return self.rule_table.evaluate_one(color_features, shape_features, texture_features)
+    
+    def detect_diseases_batch(self, feature_columns):
+        """
+        Diagnose many leaves in one pass.
+        feature_columns: {feature_name: array of shape (N,)} (e.g. FeatureStore.load_columns)
+        Returns one detect_diseases-style list per leaf.
+        """
+        result = self.rule_table.evaluate_batch(feature_columns)
+        return [[diagnosis_dict(result, i)] for i in range(len(result['diagnosis']))]
+    
+    def classify_leaf(self, img, contour):
+        """ONNX classifier prediction for the leaf crop; None without a classifier or when it fails"""
+        if self.classifier is None:
+            return None
+        
+        x, y, w, h = cv2.boundingRect(contour)
+        try:
+            return self.classifier.classify(img[y:y + h, x:x + w])
+        except Exception as e:
+            # A broken model must not take the rule engine down with it
+            logging.error(f"Classifier failed, using the rule result: {e}")
+            return None
+    
+    def merge_prediction(self, prediction, rule_diseases):
+        """
+        Merge a classifier prediction with the rule results.
+        The classifier goes first in 'onnx' mode, or in 'both' mode when it is
+        at least min_confidence sure; otherwise the rules keep the lead.
+        """
+        if prediction is None:
+            return rule_diseases
+        if self.classifier.mode == 'onnx' or prediction['score'] >= self.classifier.min_confidence:
+            return [prediction] + rule_diseases
+        return rule_diseases + [prediction]
+    
+    def apply_classifier(self, img, contour, rule_diseases):
+        """classify_leaf + merge_prediction; the rule results alone if there is no prediction"""
+        return self.merge_prediction(self.classify_leaf(img, contour), rule_diseases)
     
     def detect_generic_diseases(self, color_features):
         # Deprecated: Unified into detect_diseases with strict rules
@@ -1087,10 +1075,29 @@ class AutoPlantDiseaseDetector:
         
         return "\n".join(recommendations)
     
-    def generate_visualization(self, image, mask, contour, plant_name, diseases, output_path):
-        """Generate visual report with annotations"""
+    def draw_visualization(self, image, mask, contour, plant_name, diseases):
+        """Draw the annotated visual report and return it as a new BGR image"""
         vis_img = image.copy()
         
+        # Highlight disease-colored areas on the leaf.
+        # All color ranges are merged into one mask first so the overlay is
+        # blended in a single pass, only over the affected pixels.
+        if diseases and diseases[0]['type'] != 'healthy':
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            disease_mask = np.zeros(mask.shape, dtype=np.uint8)
+            for color_name in self.REPORT_DISEASE_COLORS:
+                for color_range in self.color_ranges.get(color_name, []):
+                    range_mask = cv2.inRange(hsv, color_range['lower'], color_range['upper'])
+                    disease_mask = cv2.bitwise_or(disease_mask, range_mask)
+            disease_mask = cv2.bitwise_and(disease_mask, mask)
+            
+            affected = disease_mask > 0
+            if np.any(affected):
+                alpha = 0.3
+                red = np.array([0, 0, 255], dtype=np.float32)  # Red for diseased areas
+                blended = vis_img[affected].astype(np.float32) * (1 - alpha) + red * alpha
+                vis_img[affected] = np.clip(blended + 0.5, 0, 255).astype(np.uint8)
+        
         # Draw leaf contour
         cv2.drawContours(vis_img, [contour], -1, (0, 255, 0), 2)
         
@@ -1114,30 +1121,33 @@ class AutoPlantDiseaseDetector:
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
             y_offset += 25
         
-        # Add severity indicators on leaf
-        if diseases and diseases[0]['type'] != 'healthy':
-            # Mark affected areas (simulated)
-            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-            
-            # Highlight disease-colored areas
-            for color_name in ['white_mildew', 'orange_rust', 'necrosis_brown', 'water_soaked']:
-                if color_name in self.color_ranges:
-                    for color_range in self.color_ranges[color_name]:
-                        color_mask = cv2.inRange(hsv, color_range['lower'], color_range['upper'])
-                        color_mask = cv2.bitwise_and(color_mask, mask)
-                        
-                        # Create overlay
-                        overlay = vis_img.copy()
-                        overlay[color_mask > 0] = [0, 0, 255]  # Red for diseased areas
-                        
-                        # Blend
-                        alpha = 0.3
-                        vis_img = cv2.addWeighted(overlay, alpha, vis_img, 1 - alpha, 0)
+        return vis_img
+    
+    def generate_visualization(self, image, mask, contour, plant_name, diseases, output_path):
+        """Generate visual report with annotations"""
+        vis_img = self.draw_visualization(image, mask, contour, plant_name, diseases)
         
         # Save visualization
         cv2.imwrite(output_path, vis_img)
         return output_path
     
+    def render_visual_report(self, img, plant_name, diseases):
+        """
+        Render the annotated report for a previously analyzed image.
+        Used on demand (e.g. history screen) so /predict never pays for it.
+        """
+        if img is None:
+            return None
+        
+        img = self.preprocess_image(img)
+        mask, contour, _ = self.segment_leaf(img)
+        
+        if mask is None:
+            # Nothing to outline; return the plain image rather than failing
+            return img
+        
+        return self.draw_visualization(img, mask, contour, plant_name, diseases)
+    
     def analyze_image(self, img, image_name="uploaded_image"):
         """Analyze image from memory (numpy array)"""
         if img is None:
@@ -1166,7 +1176,7 @@ class AutoPlantDiseaseDetector:
         plant_type, plant_confidence, plant_scores = self.identify_plant(shape_features, texture_features)
         
         # Force unknown if confidence is too low (Prevent bias)
-        if plant_confidence < 0.4:
+        if plant_confidence < self.MIN_PLANT_CONFIDENCE:
             plant_type = "unknown"
             print("Plant confidence low. Defaulting to 'unknown'.")
         
@@ -1176,24 +1186,38 @@ class AutoPlantDiseaseDetector:
         # Re-extracting cleanly here to be sure, although we could reuse existing 'hsv' var
         color_features = self.extract_color_features(hsv, mask) 
         
-        diseases = self.detect_diseases(plant_type, color_features, shape_features, texture_features)
+        # In 'onnx' mode the rules only run when the classifier failed
+        prediction = self.classify_leaf(img, contour)
+        if prediction is not None and self.classifier.mode == 'onnx':
+            diseases = []
+        else:
+            diseases = self.detect_diseases(plant_type, color_features, shape_features, texture_features)
+        diseases = self.merge_prediction(prediction, diseases)
         
-        # Generate visualization
-        # timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # vis_path = f"analysis_report_{timestamp}.jpg"
-        vis_path = "" # Disabled as per user request
-        
-        # Only save visualization if running locally or configured to do so
-        # For API usage, we might want to skip this or save to a temp dir
-        # For now, we'll save it as before, assuming cwd is writeable and appropriate
-        # try:
-        #      self.generate_visualization(img, mask, contour, plant_type, diseases, vis_path)
-        #      vis_path_abs = os.path.abspath(vis_path)
-        # except Exception as e:
-        #      print(f"Visualization generation failed: {e}")
-        #      vis_path = ""
-        #      vis_path_abs = ""
-
+        return self._finish_analysis(image_name, plant_type, plant_confidence, plant_scores,
+                                     shape_features, texture_features, color_features, diseases)
+    
+    def analyze_features(self, shape_features, texture_features, color_features, image_name="on_device"):
+        """
+        Analyze features extracted elsewhere (e.g. on the phone): runs only the
+        identification and rule stages, then stores results like analyze_image.
+        """
+        plant_type, plant_confidence, plant_scores = self.identify_plant(shape_features, texture_features)
+        if plant_confidence < self.MIN_PLANT_CONFIDENCE:
+            plant_type = "unknown"
+        
+        diseases = self.detect_diseases(plant_type, color_features, shape_features, texture_features)
+        results = self._finish_analysis(image_name, plant_type, plant_confidence, plant_scores,
+                                        shape_features, texture_features, color_features, diseases)
+        results["source"] = "features"
+        return results
+    
+    def _finish_analysis(self, image_name, plant_type, plant_confidence, plant_scores,
+                         shape_features, texture_features, color_features, diseases):
+        """Assemble the result report and persist it (detections row + feature vector)"""
+        # Visual reports are rendered lazily (see render_visual_report and the
+        # /detections/{id}/visual endpoint) to keep the prediction path cheap.
+        vis_path = ""
         
         # Prepare comprehensive results
         results = {
@@ -1226,13 +1250,28 @@ class AutoPlantDiseaseDetector:
                                       if k not in ['healthy_green', 'yellowing'] and v > 0.05}
             },
             "disease_diagnosis": diseases,
+            "rules_version": self.rule_table.version,
+            "classifier": self.classifier.info() if self.classifier is not None else None,
             "visual_report": vis_path,
-            "visual_report_path": vis_path_abs if 'vis_path_abs' in locals() else vis_path, 
+            "visual_report_path": vis_path,
             "treatment_recommendations": self.get_treatment_recommendations(plant_type, diseases)
         }
         
+        if not self.persist:
+            results["detection_id"] = None
+            return results
+        
         # Save to database
-        self.save_results_to_db(results)
+        results["detection_id"] = self.save_results_to_db(results)
+        
+        # Keep the raw numeric features so rule changes can be evaluated offline
+        try:
+            self.feature_store.append(
+                results["detection_id"],
+                features_to_vector(shape_features, texture_features, color_features)
+            )
+        except Exception as e:
+            print(f"Failed to store feature vector: {e}")
         
         return results
 
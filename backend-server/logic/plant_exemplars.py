@@ -0,0 +1,113 @@
+import os
+import json
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    from logic.feature_store import SHAPE_FEATURE_KEYS, TEXTURE_FEATURE_KEYS
+except ImportError:  # running from inside logic/
+    from feature_store import SHAPE_FEATURE_KEYS, TEXTURE_FEATURE_KEYS
+
+
+# Plant identity comes from leaf shape and texture; color ratios mostly track disease
+PLANT_FEATURE_KEYS = SHAPE_FEATURE_KEYS + TEXTURE_FEATURE_KEYS
+
+DEFAULT_EXEMPLARS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "plant_exemplars.npz")
+
+
+def plant_feature_vector(shape_features: Dict, texture_features: Dict) -> np.ndarray:
+    merged = dict(texture_features)
+    merged.update(shape_features)
+    return np.array([float(merged.get(key, 0) or 0) for key in PLANT_FEATURE_KEYS], dtype=np.float32)
+
+
+class PlantExemplarIndex:
+    """
+    k-nearest-neighbour plant identifier over labeled leaf exemplars.
+
+    Exemplar vectors are stored pre-standardized in one float32 matrix with
+    their squared norms, so a query is one matrix-vector product plus an
+    argpartition. Neighbours vote with inverse-distance weights and the
+    confidence is the winner's share of the vote. Outputs are plant keys
+    (the same keys as AutoPlantDiseaseDetector.plant_database).
+    """
+
+    def __init__(self, vectors: np.ndarray, labels: np.ndarray, classes: Sequence[str],
+                 mean: np.ndarray, scale: np.ndarray, k: int = 7):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.classes = list(classes)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.k = max(1, min(k, len(self.vectors)))
+
+    @classmethod
+    def build(cls, raw_vectors: np.ndarray, plant_names: Sequence[str], k: int = 7) -> 'PlantExemplarIndex':
+        """Fit the normalization on raw (N, len(PLANT_FEATURE_KEYS)) vectors labeled with plant keys"""
+        raw_vectors = np.asarray(raw_vectors, dtype=np.float32)
+        classes, labels = np.unique(np.asarray(plant_names, dtype=object).astype(str), return_inverse=True)
+        mean = raw_vectors.mean(axis=0)
+        std = raw_vectors.std(axis=0)
+        scale = np.where(std > 1e-6, std, 1.0).astype(np.float32)
+        return cls((raw_vectors - mean) / scale, labels, classes.tolist(), mean, scale, k)
+
+    # --- PERSISTENCE ---
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            vectors=self.vectors, labels=self.labels, mean=self.mean, scale=self.scale,
+            k=np.int32(self.k),
+            classes=np.array(json.dumps(self.classes)),
+            feature_keys=np.array(json.dumps(list(PLANT_FEATURE_KEYS)))
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PlantExemplarIndex':
+        with np.load(path) as data:
+            feature_keys = json.loads(str(data['feature_keys']))
+            if feature_keys != list(PLANT_FEATURE_KEYS):
+                raise ValueError(f"{path} was built for a different feature layout; rebuild the exemplars")
+            return cls(data['vectors'], data['labels'], json.loads(str(data['classes'])),
+                       data['mean'], data['scale'], int(data['k']))
+
+    # --- QUERIES ---
+    def __len__(self):
+        return len(self.vectors)
+
+    def _votes(self, query: np.ndarray) -> np.ndarray:
+        q = (query - self.mean) / self.scale
+        distances = self.sq_norms - 2.0 * (self.vectors @ q) + q @ q
+        nearest = np.argpartition(distances, self.k - 1)[:self.k]
+        weights = 1.0 / (np.sqrt(np.maximum(distances[nearest], 0)) + 1e-3)
+        return np.bincount(self.labels[nearest], weights=weights, minlength=len(self.classes))
+
+    def classify_vector(self, raw_vector: np.ndarray, top: int = 3) -> Tuple[str, float, Dict[str, float]]:
+        """(plant key, confidence, {plant key: vote share} for the top candidates)"""
+        votes = self._votes(np.asarray(raw_vector, dtype=np.float32))
+        shares = votes / votes.sum()
+        order = np.argsort(-shares)[:top]
+        candidates = {self.classes[i]: round(float(shares[i]), 3) for i in order if shares[i] > 0}
+        best = int(order[0])
+        return self.classes[best], float(shares[best]), candidates
+
+    def classify(self, shape_features: Dict, texture_features: Dict) -> Tuple[str, float, Dict[str, float]]:
+        """Same return shape as AutoPlantDiseaseDetector.identify_plant"""
+        return self.classify_vector(plant_feature_vector(shape_features, texture_features))
+
+    def classify_batch(self, raw_vectors: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """Plant keys and confidences for many leaves at once"""
+        q = (np.asarray(raw_vectors, dtype=np.float32) - self.mean) / self.scale
+        distances = self.sq_norms[np.newaxis] - 2.0 * (q @ self.vectors.T) + np.einsum('ij,ij->i', q, q)[:, None]
+        nearest = np.argpartition(distances, self.k - 1, axis=1)[:, :self.k]
+        weights = 1.0 / (np.sqrt(np.maximum(np.take_along_axis(distances, nearest, axis=1), 0)) + 1e-3)
+
+        votes = np.zeros((len(q), len(self.classes)))
+        np.add.at(votes, (np.arange(len(q))[:, None], self.labels[nearest]), weights)
+        best = votes.argmax(axis=1)
+        confidence = votes[np.arange(len(q)), best] / votes.sum(axis=1)
+        return [self.classes[i] for i in best], confidence
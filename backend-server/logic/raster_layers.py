@@ -0,0 +1,293 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:  # optional: georeferenced GeoTIFF sources
+    import rasterio
+except ImportError:
+    rasterio = None
+
+# Multi-region map layers. Each region's map is ingested once (see
+# ingest_layers.py) into fixed-size tiles of uncompressed .npy files per band
+# (e.g. 'bgr', 'classes'); at runtime only a small JSON header per region is
+# read, and tiles are memory-mapped on first use and kept in a byte-capped LRU.
+
+DEFAULT_LAYERS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "layers")
+
+LAYER_FORMAT = 1
+
+
+class RasterLayer:
+    """One region: geographic bounds, pixel grid and tiling of its bands"""
+
+    def __init__(self, layer_dir: str, meta: Dict):
+        self.layer_dir = layer_dir
+        self.name = meta['name']
+        bounds = meta['bounds']
+        self.lat_top = bounds['lat_top']
+        self.lat_bottom = bounds['lat_bottom']
+        self.lon_left = bounds['lon_left']
+        self.lon_right = bounds['lon_right']
+        self.width = meta['width']
+        self.height = meta['height']
+        self.tile_size = meta['tile_size']
+        self.bands = meta['bands']
+        self.meta = meta
+
+    @classmethod
+    def open(cls, layer_dir: str) -> 'RasterLayer':
+        with open(os.path.join(layer_dir, 'layer.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != LAYER_FORMAT:
+            raise ValueError(f"{layer_dir}: unsupported layer format {meta.get('format')}; re-ingest it")
+        return cls(layer_dir, meta)
+
+    @property
+    def area_deg2(self) -> float:
+        return (self.lat_top - self.lat_bottom) * (self.lon_right - self.lon_left)
+
+    def to_pixels(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """int (xs, ys) for points inside the bounds (the bottom/right edge maps to the last pixel)"""
+        xs = ((lons - self.lon_left) / (self.lon_right - self.lon_left) * self.width).astype(np.int64)
+        ys = ((self.lat_top - lats) / (self.lat_top - self.lat_bottom) * self.height).astype(np.int64)
+        return np.minimum(xs, self.width - 1), np.minimum(ys, self.height - 1)
+
+    def tile_path(self, band: str, row: int, col: int) -> str:
+        return os.path.join(self.layer_dir, band, f"{row:04d}_{col:04d}.npy")
+
+
+class RasterLayerRegistry:
+    """
+    Registry of ingested region layers with a bounding-box index.
+
+    A point belongs to the smallest region whose bounds contain it (so a
+    detailed district map can sit on top of its state); points outside every
+    region get None instead of being clamped to some border. Tiles are opened
+    lazily and the least recently used ones are dropped once the resident
+    tiles exceed max_resident_bytes. With class_params (SoilEngine.class_params()),
+    layers whose 'classes' band was built with other settings are skipped.
+    """
+
+    DEFAULT_MAX_RESIDENT_MB = 256
+
+    def __init__(self, root_dir: str = DEFAULT_LAYERS_DIR, max_resident_bytes: int = None,
+                 class_params: Dict = None):
+        self.root_dir = root_dir
+        # Compared in JSON form, as ingestion stored it (tuples become lists)
+        self.class_params = json.loads(json.dumps(class_params)) if class_params is not None else None
+        self.max_resident_bytes = max_resident_bytes or self.DEFAULT_MAX_RESIDENT_MB * 1024 * 1024
+        self.layers: List[RasterLayer] = []
+
+        self._lock = threading.Lock()
+        self._tiles = OrderedDict()  # (layer index, band, row, col) -> array
+        self._resident_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if os.path.isdir(root_dir):
+            for name in sorted(os.listdir(root_dir)):
+                layer_dir = os.path.join(root_dir, name)
+                if not os.path.exists(os.path.join(layer_dir, 'layer.json')):
+                    continue
+                try:
+                    layer = RasterLayer.open(layer_dir)
+                    if self.class_params is not None and layer.meta.get('class_params') != self.class_params:
+                        raise ValueError("land classes changed since ingestion; re-ingest it")
+                    self.layers.append(layer)
+                except Exception as e:
+                    logging.error(f"Skipping raster layer {layer_dir}: {e}")
+
+        # Most specific (smallest) region first, so the first containing region wins
+        self.layers.sort(key=lambda layer: layer.area_deg2)
+        self._bounds = np.array([[l.lat_bottom, l.lat_top, l.lon_left, l.lon_right] for l in self.layers],
+                                dtype=np.float64).reshape(-1, 4)
+        if self.layers:
+            logging.info(f"Raster layers: {', '.join(l.name for l in self.layers)}")
+
+    @classmethod
+    def from_env(cls, class_params: Dict = None) -> 'RasterLayerRegistry':
+        """Layers in RASTER_LAYERS_DIR (default: layers/), tile cache capped at RASTER_TILE_CACHE_MB"""
+        root_dir = os.environ.get('RASTER_LAYERS_DIR', DEFAULT_LAYERS_DIR)
+        cache_mb = int(os.environ.get('RASTER_TILE_CACHE_MB', str(cls.DEFAULT_MAX_RESIDENT_MB)))
+        return cls(root_dir, cache_mb * 1024 * 1024, class_params)
+
+    def __len__(self):
+        return len(self.layers)
+
+    # --- REGION INDEX ---
+    def locate(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """Index into self.layers of the region containing each point, -1 where none does"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if not self.layers:
+            return np.full(lats.shape, -1, dtype=np.int64)
+        b = self._bounds[:, :, np.newaxis]
+        inside = ((b[:, 0] <= lats) & (lats <= b[:, 1]) & (b[:, 2] <= lons) & (lons <= b[:, 3]))
+        return np.where(inside.any(axis=0), inside.argmax(axis=0), -1)
+
+    def _find_index(self, lat: float, lon: float) -> int:
+        for index, layer in enumerate(self.layers):
+            if layer.lat_bottom <= lat <= layer.lat_top and layer.lon_left <= lon <= layer.lon_right:
+                return index
+        return -1
+
+    def find(self, lat: float, lon: float) -> Optional[RasterLayer]:
+        """Region containing the point, or None"""
+        index = self._find_index(lat, lon)
+        return self.layers[index] if index >= 0 else None
+
+    # --- TILES ---
+    def _tile(self, layer_index: int, band: str, row: int, col: int) -> np.ndarray:
+        key = (layer_index, band, row, col)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self._hits += 1
+                return tile
+
+        tile = np.asarray(np.load(self.layers[layer_index].tile_path(band, row, col), mmap_mode='r'))
+        with self._lock:
+            self._misses += 1
+            if key not in self._tiles:
+                self._tiles[key] = tile
+                self._resident_bytes += tile.nbytes
+            while self._resident_bytes > self.max_resident_bytes and len(self._tiles) > 1:
+                _, evicted = self._tiles.popitem(last=False)
+                self._resident_bytes -= evicted.nbytes
+                self._evictions += 1
+        return tile
+
+    # --- SAMPLING ---
+    def sample(self, band: str, lat: float, lon: float):
+        """Band value (scalar or per-channel array) at a point, or None outside every region"""
+        if lat is None or lon is None or not (np.isfinite(lat) and np.isfinite(lon)):
+            return None
+        index = self._find_index(lat, lon)
+        if index < 0 or band not in self.layers[index].bands:
+            return None
+        layer = self.layers[index]
+        xs, ys = layer.to_pixels(np.float64(lat), np.float64(lon))
+        x, y = int(xs), int(ys)
+        tile = self._tile(index, band, y // layer.tile_size, x // layer.tile_size)
+        return tile[y % layer.tile_size, x % layer.tile_size]
+
+    def sample_batch(self, band: str, lats: np.ndarray, lons: np.ndarray,
+                     fill=0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (values, found) for arrays of points: points are grouped by region and
+        tile so each tile is fetched once per call. `fill` marks points outside
+        every region (found == False).
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        regions = self.locate(lats, lons)
+        found = regions >= 0
+
+        values = None
+        for layer_index in np.unique(regions[found]):
+            layer = self.layers[layer_index]
+            if band not in layer.bands:
+                found[regions == layer_index] = False
+                continue
+            points = np.flatnonzero(regions == layer_index)
+            xs, ys = layer.to_pixels(lats[points], lons[points])
+            tile_rows, tile_cols = ys // layer.tile_size, xs // layer.tile_size
+            tile_keys = tile_rows * (layer.width // layer.tile_size + 1) + tile_cols
+
+            order = np.argsort(tile_keys, kind='stable')
+            boundaries = np.flatnonzero(np.diff(tile_keys[order])) + 1
+            for group in np.split(order, boundaries):
+                tile = self._tile(int(layer_index), band, int(tile_rows[group[0]]), int(tile_cols[group[0]]))
+                if values is None:
+                    values = np.full(lats.shape + tile.shape[2:], fill, dtype=tile.dtype)
+                values[points[group]] = tile[ys[group] % layer.tile_size, xs[group] % layer.tile_size]
+
+        if values is None:
+            values = np.full(lats.shape, fill, dtype=np.uint8)
+        return values, found
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'regions': [{'name': l.name, 'width': l.width, 'height': l.height,
+                             'bounds': l.meta['bounds'], 'bands': list(l.bands)} for l in self.layers],
+                'resident_tiles': len(self._tiles),
+                'resident_mb': round(self._resident_bytes / 1e6, 2),
+                'max_resident_mb': round(self.max_resident_bytes / 1e6, 2),
+                'tile_hits': self._hits,
+                'tile_misses': self._misses,
+                'tile_evictions': self._evictions,
+            }
+
+
+# --- INGESTION ---
+def read_source(path: str, bounds: Optional[Dict] = None) -> Tuple[np.ndarray, Dict]:
+    """
+    BGR pixels and geographic bounds of a region map. GeoTIFFs (with rasterio
+    installed) carry their own bounds; plain images need `bounds` with
+    lat_top / lat_bottom / lon_left / lon_right.
+    """
+    if path.lower().endswith(('.tif', '.tiff')) and rasterio is not None:
+        with rasterio.open(path) as dataset:
+            bands = dataset.read(indexes=[1, 2, 3] if dataset.count >= 3 else [1, 1, 1])
+            if bounds is None:
+                if dataset.crs is not None and not dataset.crs.is_geographic:
+                    raise ValueError(f"{path}: GeoTIFF must use geographic (lat/lon) coordinates")
+                bounds = {'lat_top': dataset.bounds.top, 'lat_bottom': dataset.bounds.bottom,
+                          'lon_left': dataset.bounds.left, 'lon_right': dataset.bounds.right}
+        bgr = np.ascontiguousarray(np.transpose(bands[::-1], (1, 2, 0))).astype(np.uint8)
+    else:
+        bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise ValueError(f"Could not read map image {path}")
+
+    if bounds is None:
+        raise ValueError(f"{path}: bounds are required (install rasterio for GeoTIFF bounds)")
+    for key in ('lat_top', 'lat_bottom', 'lon_left', 'lon_right'):
+        if key not in bounds:
+            raise ValueError(f"{path}: bounds missing '{key}'")
+    if not (bounds['lat_top'] > bounds['lat_bottom'] and bounds['lon_right'] > bounds['lon_left']):
+        raise ValueError(f"{path}: empty or inverted bounds")
+    return bgr, {key: float(bounds[key]) for key in ('lat_top', 'lat_bottom', 'lon_left', 'lon_right')}
+
+
+def write_layer(layer_dir: str, name: str, bounds: Dict, bands: Dict[str, np.ndarray],
+                tile_size: int = 256, extra: Dict = None) -> Dict:
+    """Split full-resolution band arrays (same height/width) into tiles and write layer.json last"""
+    height, width = next(iter(bands.values())).shape[:2]
+    band_meta = {}
+    for band, array in bands.items():
+        if array.shape[:2] != (height, width):
+            raise ValueError(f"Band {band} is {array.shape[:2]}, expected {(height, width)}")
+        os.makedirs(os.path.join(layer_dir, band), exist_ok=True)
+        for row in range(0, (height + tile_size - 1) // tile_size):
+            for col in range(0, (width + tile_size - 1) // tile_size):
+                tile = array[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size]
+                path = os.path.join(layer_dir, band, f"{row:04d}_{col:04d}.npy")
+                np.save(path + ".tmp.npy", np.ascontiguousarray(tile))
+                os.replace(path + ".tmp.npy", path)
+        band_meta[band] = {'dtype': str(array.dtype), 'channels': int(array.shape[2]) if array.ndim == 3 else 1}
+
+    meta = {
+        'format': LAYER_FORMAT,
+        'name': name,
+        'bounds': bounds,
+        'width': int(width),
+        'height': int(height),
+        'tile_size': tile_size,
+        'bands': band_meta,
+    }
+    meta.update(extra or {})
+    tmp_path = os.path.join(layer_dir, 'layer.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(layer_dir, 'layer.json'))
+    return meta
@@ -0,0 +1,249 @@
+import os
+import json
+import gzip
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+try:
+    from logic.disease_rules import CONFIDENCE_LEVELS, CONFIDENCE_SCORES
+    from logic.feature_store import (
+        FEATURE_SCHEMA_VERSION, SHAPE_FEATURE_KEYS, TEXTURE_FEATURE_KEYS, COLOR_FEATURE_KEYS, _FileLock
+    )
+except ImportError:  # running from inside logic/
+    from disease_rules import CONFIDENCE_LEVELS, CONFIDENCE_SCORES
+    from feature_store import (
+        FEATURE_SCHEMA_VERSION, SHAPE_FEATURE_KEYS, TEXTURE_FEATURE_KEYS, COLOR_FEATURE_KEYS, _FileLock
+    )
+
+# Offline diagnosis bundles for the mobile app: everything the rule-based
+# pipeline needs after feature extraction (decision table, HSV color ranges,
+# plant knowledge base, treatments), split into keyed sections so that a
+# client holding an older version can be sent only the entries that changed.
+
+BUNDLE_FORMAT = 1
+
+SECTIONS = ('meta', 'rules', 'color_ranges', 'plants', 'treatments')
+
+
+def _canonical(obj) -> bytes:
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), default=_to_json).encode('utf-8')
+
+
+def _to_json(value):
+    # numpy arrays / scalars inside the engine's tables
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def build_bundle(detector) -> Dict[str, Dict]:
+    """Export the detector's current knowledge as {section: {key: value}} (JSON types only)"""
+    spec = detector.rule_table.spec
+    sections = {
+        'meta': {
+            'rules_version': str(spec['version']),
+            'engine_version': detector.ENGINE_VERSION,
+            'feature_schema_version': FEATURE_SCHEMA_VERSION,
+            'feature_keys': {
+                'shape': list(SHAPE_FEATURE_KEYS),
+                'texture': list(TEXTURE_FEATURE_KEYS),
+                'color': list(COLOR_FEATURE_KEYS),
+            },
+            'confidence_levels': list(CONFIDENCE_LEVELS),
+            'confidence_scores': dict(CONFIDENCE_SCORES),
+            'min_plant_confidence': detector.MIN_PLANT_CONFIDENCE,
+            'report_disease_colors': list(detector.REPORT_DISEASE_COLORS),
+        },
+        'rules': {rule['id']: rule for rule in spec['rules']},
+        'color_ranges': {
+            name: [[r['lower'], r['upper']] for r in ranges] for name, ranges in detector.color_ranges.items()
+        },
+        'plants': detector.plant_database,
+        'treatments': detector.treatment_database,
+    }
+    # Round-trip so tuples / numpy values compare equal to what clients get back
+    return json.loads(_canonical(sections))
+
+
+def section_digests(sections: Dict[str, Dict]) -> Dict[str, Dict[str, str]]:
+    """Per-entry content hashes, used to diff two bundle versions without loading both"""
+    return {
+        name: {key: hashlib.sha1(_canonical(value)).hexdigest()[:16] for key, value in entries.items()}
+        for name, entries in sections.items()
+    }
+
+
+class RuleBundleStore:
+    """
+    Versioned on-disk history of offline diagnosis bundles.
+
+    Each published version is a gzipped JSON file (bundle_00001.json.gz, ...)
+    plus an entry in manifest.json with its per-entry digests. publish() only
+    writes a new version when the content changed, so it is cheap to call on
+    every startup or rule reload. Deltas are computed from the digests and
+    contain the changed/added entries of the target version and the removed
+    keys, per section. The manifest is re-read whenever it changed on disk,
+    so every worker process sees versions published by the others, and
+    publishing holds an exclusive lock file so two workers never claim the
+    same version number.
+    """
+
+    # Versions kept on disk; clients older than this get a full bundle
+    KEEP_VERSIONS = 50
+
+    def __init__(self, bundle_dir: str):
+        self.bundle_dir = bundle_dir
+        os.makedirs(bundle_dir, exist_ok=True)
+        self.manifest_path = os.path.join(bundle_dir, 'manifest.json')
+        self._lock = threading.Lock()
+        self._cache = {}  # version -> sections
+        self._manifest_stat = None
+        self._manifest = {'format': BUNDLE_FORMAT, 'versions': []}
+        self._refresh_manifest()
+
+    def _refresh_manifest(self):
+        """Re-read manifest.json if another process replaced it since our last read"""
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return
+        stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stat == self._manifest_stat:
+            return
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('format') == BUNDLE_FORMAT:
+            self._manifest = manifest
+        self._manifest_stat = stat
+
+    def _bundle_path(self, version: int) -> str:
+        return os.path.join(self.bundle_dir, f"bundle_{version:05d}.json.gz")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # --- PUBLISHING ---
+    def publish(self, sections: Dict[str, Dict]) -> int:
+        """Store `sections` as a new version unless identical to the latest; returns the latest version"""
+        digests = section_digests(sections)
+        with self._lock, _FileLock(os.path.join(self.bundle_dir, '.lock')):
+            self._refresh_manifest()
+            versions = self._manifest['versions']
+            if versions and versions[-1]['digests'] == digests:
+                return versions[-1]['version']
+
+            version = versions[-1]['version'] + 1 if versions else 1
+            payload = {'format': BUNDLE_FORMAT, 'version': version, 'sections': sections}
+            self._write_atomic(self._bundle_path(version), gzip.compress(_canonical(payload)))
+
+            versions.append({
+                'version': version,
+                'rules_version': sections['meta']['rules_version'],
+                'digests': digests,
+            })
+            for old in versions[:-self.KEEP_VERSIONS]:
+                self._cache.pop(old['version'], None)
+                if os.path.exists(self._bundle_path(old['version'])):
+                    os.remove(self._bundle_path(old['version']))
+            del versions[:-self.KEEP_VERSIONS]
+            self._write_atomic(self.manifest_path, json.dumps(self._manifest).encode('utf-8'))
+            st = os.stat(self.manifest_path)
+            self._manifest_stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+            return version
+
+    def publish_from(self, detector) -> int:
+        """
+        Publish the detector's current tables if its rules differ in content from
+        the latest bundle's (an edit that keeps the version string still counts).
+        """
+        spec = detector.rule_table.spec
+        rules = section_digests({'rules': {rule['id']: rule for rule in spec['rules']}})['rules']
+        latest = self.latest_entry()
+        if latest is not None and latest['digests']['rules'] == rules and latest['rules_version'] == str(spec['version']):
+            return latest['version']
+        return self.publish(build_bundle(detector))
+
+    # --- READS ---
+    def latest_entry(self) -> Optional[Dict]:
+        with self._lock:
+            self._refresh_manifest()
+            versions = self._manifest['versions']
+            return versions[-1] if versions else None
+
+    @property
+    def latest_version(self) -> Optional[int]:
+        entry = self.latest_entry()
+        return entry['version'] if entry else None
+
+    def versions(self) -> List[int]:
+        with self._lock:
+            self._refresh_manifest()
+            return [entry['version'] for entry in self._manifest['versions']]
+
+    def _entry(self, version: int) -> Optional[Dict]:
+        for entry in self._manifest['versions']:
+            if entry['version'] == version:
+                return entry
+        return None
+
+    def load(self, version: int) -> Dict[str, Dict]:
+        """Sections of one stored version"""
+        sections = self._cache.get(version)
+        if sections is None:
+            with gzip.open(self._bundle_path(version), 'rb') as f:
+                sections = json.load(f)['sections']
+            self._cache[version] = sections
+        return sections
+
+    def raw(self, version: int) -> bytes:
+        """The stored gzipped payload, for serving with Content-Encoding: gzip"""
+        with open(self._bundle_path(version), 'rb') as f:
+            return f.read()
+
+    def delta(self, since: int) -> Optional[Dict]:
+        """
+        Changes from version `since` to the latest:
+        {section: {"set": {key: value}, "remove": [key]}} for the sections that
+        changed. Returns None if `since` is not (or no longer) on disk.
+        """
+        latest = self.latest_entry()
+        with self._lock:
+            base = self._entry(since)
+        if latest is None or base is None:
+            return None
+
+        changes = {}
+        target = None
+        for name, digests in latest['digests'].items():
+            old_digests = base['digests'].get(name, {})
+            changed = [key for key, digest in digests.items() if old_digests.get(key) != digest]
+            removed = sorted(key for key in old_digests if key not in digests)
+            if not changed and not removed:
+                continue
+            if target is None:
+                target = self.load(latest['version'])
+            changes[name] = {'set': {key: target[name][key] for key in changed}, 'remove': removed}
+
+        return {
+            'format': BUNDLE_FORMAT,
+            'since': since,
+            'version': latest['version'],
+            'rules_version': latest['rules_version'],
+            'sections': changes,
+        }
+
+
+def apply_delta(sections: Dict[str, Dict], delta: Dict) -> Dict[str, Dict]:
+    """Client-side update (reference for the app): returns the sections of delta['version']"""
+    updated = {name: dict(entries) for name, entries in sections.items()}
+    for name, change in delta['sections'].items():
+        entries = updated.setdefault(name, {})
+        for key in change['remove']:
+            entries.pop(key, None)
+        entries.update(change['set'])
+    return updated
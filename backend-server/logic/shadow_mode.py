@@ -0,0 +1,261 @@
+import os
+import time
+import queue
+import random
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+
+def _lower_thread_priority():
+    """Best effort: on Linux, setpriority on the thread id only renices this thread"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+def _timed_analysis(detector, image_data, image_name):
+    """Decode and analyze one image; returns (result, analysis wall time in ms)"""
+    img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    started = time.perf_counter()
+    result = detector.analyze_image(img, image_name=image_name)
+    return result, (time.perf_counter() - started) * 1000
+
+
+# --- CANDIDATE PROCESS ---
+_process_candidate = None
+
+
+def _init_candidate_process(options):
+    """Child process initializer: lowest priority, then build the candidate once"""
+    global _process_candidate
+    try:
+        os.nice(19)
+    except (AttributeError, OSError):
+        pass
+    from logic.plant_detection_engine import AutoPlantDiseaseDetector
+    from logic.onnx_classifier import OnnxClassifier
+
+    # Same ONNX_* / CLASSIFIER_MODE environment as the primary, so both see the same model
+    _process_candidate = AutoPlantDiseaseDetector(classifier=OnnxClassifier.from_env(), persist=False, **options)
+
+
+def _analyze_in_process(image_data, image_name):
+    return _timed_analysis(_process_candidate, image_data, image_name)
+
+
+class CandidateUnavailable(RuntimeError):
+    """The candidate process is broken and waiting to be restarted"""
+
+
+class CandidateProcess:
+    """
+    Candidate detector living in one niced child process, so shadow analysis
+    does not compete with request threads for the GIL. The process is
+    spawned (not forked from the threaded server) and builds its detector on
+    first use. If it dies (crash, OOM kill, failing initializer) the pool is
+    rebuilt, waiting restart_backoff seconds after the first failure and twice
+    as long after each further one in a row (up to MAX_BACKOFF_S).
+    """
+
+    MAX_BACKOFF_S = 600.0
+
+    def __init__(self, options, restart_backoff=5.0):
+        self.options = options
+        self.restart_backoff = restart_backoff
+        self.restarts = 0
+        self._failures = 0  # consecutive broken pools
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_candidate_process,
+            initargs=(self.options,)
+        )
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if time.monotonic() < self._retry_at:
+                    raise CandidateUnavailable("candidate process is restarting")
+                self._pool = self._new_pool()
+                self.restarts += 1
+            return self._pool
+
+    def _discard(self, pool, error):
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            self._failures += 1
+            delay = min(self.restart_backoff * 2 ** (self._failures - 1), self.MAX_BACKOFF_S)
+            self._retry_at = time.monotonic() + delay
+        pool.shutdown(wait=False, cancel_futures=True)
+        logging.error(f"Shadow candidate process died ({error}); restarting in {delay:.0f}s")
+
+    def evaluate(self, image_data, image_name):
+        pool = self._get_pool()
+        try:
+            result = pool.submit(_analyze_in_process, image_data, image_name).result()
+        except BrokenProcessPool as e:
+            self._discard(pool, e)
+            raise CandidateUnavailable(str(e)) from e
+        self._failures = 0
+        return result
+
+
+class ShadowEvaluator:
+    """
+    Shadow-mode evaluation of a candidate detector configuration.
+
+    A sampled fraction of /predict requests is queued (raw image bytes plus the
+    primary result) and re-analyzed by the candidate: a CandidateProcess, or a
+    detector run directly on the low-priority daemon worker thread. Outcomes are
+    written to the `shadow_results` table. The queue is bounded and submit()
+    never blocks: when the worker falls behind, samples are dropped instead of
+    delaying the user's response.
+    """
+
+    def __init__(self, candidate, get_db_connection, name="candidate", sample_rate=0.05, max_queue=8):
+        self.candidate = candidate
+        if isinstance(candidate, CandidateProcess):
+            self._analyze = candidate.evaluate
+            self.rules_version = None  # known after the first evaluation
+        else:
+            self._analyze = lambda image_data, image_name: _timed_analysis(candidate, image_data, image_name)
+            self.rules_version = candidate.rule_table.version
+        self.get_db_connection = get_db_connection
+        self.name = name
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=max_queue)
+
+        self._stats_lock = threading.Lock()
+        self.counters = {'sampled': 0, 'dropped': 0, 'processed': 0, 'failed': 0}
+
+        self._worker = threading.Thread(target=self._run, name="shadow-worker", daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_env(cls, get_db_connection, classifier=None):
+        """
+        Build from SHADOW_* environment variables; None when shadow mode is off.
+        `classifier` is the primary's; with SHADOW_PROCESS=0 the candidate runs
+        in-process and shares it, otherwise the child process loads the same
+        model from the ONNX_* settings.
+        """
+        sample_rate = float(os.environ.get('SHADOW_SAMPLE_RATE', '0'))
+        if sample_rate <= 0:
+            return None
+
+        options = {
+            'rules_path': os.environ.get('SHADOW_RULES_PATH') or None,
+            'max_dim': int(os.environ.get('SHADOW_MAX_DIM', '800')),
+            'grabcut_iterations': int(os.environ.get('SHADOW_GRABCUT_ITERATIONS', '3'))
+        }
+        if os.environ.get('SHADOW_PROCESS', '1') == '1':
+            candidate = CandidateProcess(options)
+        else:
+            # Imported here so the engine module stays importable as a script
+            from logic.plant_detection_engine import AutoPlantDiseaseDetector
+            candidate = AutoPlantDiseaseDetector(classifier=classifier, persist=False, **options)
+        return cls(
+            candidate,
+            get_db_connection,
+            name=os.environ.get('SHADOW_NAME', 'candidate'),
+            sample_rate=min(sample_rate, 1.0),
+            max_queue=int(os.environ.get('SHADOW_QUEUE_SIZE', '8'))
+        )
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.counters[key] += 1
+
+    # --- HOT PATH ---
+    def submit(self, image_data, primary_result, primary_ms):
+        """Maybe queue one request for shadow evaluation. Returns True if queued."""
+        if random.random() >= self.sample_rate or primary_result.get('status') != 'success':
+            return False
+
+        self._count('sampled')
+        try:
+            self._queue.put_nowait((image_data, primary_result, primary_ms))
+            return True
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+    # --- WORKER ---
+    def _run(self):
+        _lower_thread_priority()
+        while True:
+            image_data, primary_result, primary_ms = self._queue.get()
+            try:
+                self._evaluate(image_data, primary_result, primary_ms)
+                self._count('processed')
+            except CandidateUnavailable:
+                self._count('failed')  # already logged when the process died
+            except Exception as e:
+                self._count('failed')
+                logging.error(f"Shadow evaluation failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _evaluate(self, image_data, primary_result, primary_ms):
+        # Both latencies cover analyze_image alone (no queueing or decoding)
+        candidate_result, candidate_ms = self._analyze(image_data, primary_result.get('image', 'shadow'))
+        self.rules_version = candidate_result.get('rules_version', self.rules_version)
+
+        primary_diagnosis = _primary_diagnosis(primary_result)
+        candidate_diagnosis = _primary_diagnosis(candidate_result)
+        primary_plant = primary_result.get('plant_identification', {}).get('identified_as')
+        candidate_plant = candidate_result.get('plant_identification', {}).get('identified_as')
+
+        conn = self.get_db_connection()
+        conn.execute('''
+            INSERT INTO shadow_results (
+                detection_id, candidate, primary_rules_version, candidate_rules_version,
+                primary_diagnosis, candidate_diagnosis, diagnosis_agrees,
+                primary_plant, candidate_plant, plant_agrees,
+                primary_ms, candidate_ms, delta_ms
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            primary_result.get('detection_id'), self.name,
+            primary_result.get('rules_version'), candidate_result.get('rules_version'),
+            primary_diagnosis, candidate_diagnosis, int(primary_diagnosis == candidate_diagnosis),
+            primary_plant, candidate_plant, int(primary_plant == candidate_plant),
+            round(primary_ms, 2), round(candidate_ms, 2), round(candidate_ms - primary_ms, 2)
+        ))
+        conn.commit()
+        conn.close()
+
+    def join(self):
+        """Wait until every queued sample has been evaluated (tests / shutdown)"""
+        self._queue.join()
+
+    def stats(self):
+        with self._stats_lock:
+            counters = dict(self.counters)
+        counters['queued'] = self._queue.qsize()
+        return {
+            'candidate': self.name,
+            'sample_rate': self.sample_rate,
+            'rules_version': self.rules_version,
+            **counters
+        }
+
+
+def _primary_diagnosis(result):
+    diseases = result.get('disease_diagnosis') or []
+    if diseases:
+        return diseases[0]['name']
+    return result.get('status', 'unknown')
@@ -0,0 +1,265 @@
+import time
+import threading
+import numpy as np
+from typing import List, Optional, Tuple
+
+try:
+    from logic.feature_store import FEATURE_KEYS
+except ImportError:  # running from inside logic/
+    from feature_store import FEATURE_KEYS
+
+
+class SimilarityIndex:
+    """
+    In-process nearest-neighbour index over detection feature vectors.
+
+    Vectors are standardized per feature (so hue in degrees and ratios in
+    [0, 1] weigh alike) and L2-normalized, then kept in one contiguous float32
+    matrix: cosine similarity is a single matrix-vector product. Below
+    IVF_MIN_ROWS every query scans all rows; above it the rows are partitioned
+    by spherical k-means (IVF) and a query only scans the NPROBE closest
+    clusters. Rows are appended incrementally, either with add() or by
+    tailing a FeatureStore with sync(). Queries call refresh(), which only
+    re-reads the store after an append through it or, for rows written by
+    other processes, once SYNC_INTERVAL seconds have passed.
+    """
+
+    IVF_MIN_ROWS = 50000
+    NPROBE = 16
+    KMEANS_ITERATIONS = 10
+    KMEANS_SAMPLE = 50000
+    # Standardization stats are refit until this many rows have been seen
+    STATS_MIN_ROWS = 1000
+    # Seconds between store re-reads when no in-process append was seen
+    SYNC_INTERVAL = 5.0
+
+    def __init__(self, dim: int = len(FEATURE_KEYS), ivf_min_rows: int = None, seed: int = 0):
+        self.dim = dim
+        self.ivf_min_rows = ivf_min_rows or self.IVF_MIN_ROWS
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.RLock()
+
+        self._capacity = 1024
+        self._size = 0
+        self._ids = np.zeros(self._capacity, dtype=np.int64)
+        self._raw = np.zeros((self._capacity, dim), dtype=np.float32)     # as stored
+        self._vectors = np.zeros((self._capacity, dim), dtype=np.float32)  # normalized
+        self._row_of = {}
+
+        self._mean = np.zeros(dim, dtype=np.float32)
+        self._scale = np.ones(dim, dtype=np.float32)
+        self._stats_rows = 0
+
+        self._centroids = None  # (nlist, dim) when IVF is active
+        self._lists = []        # per cluster: list of row-number arrays
+        self._list_arrays = []  # per cluster: cached np.array of the above (None = stale)
+
+        self._store = None
+        self._position = (0, 0)
+        self._dirty = False
+        self._synced_at = 0.0
+
+    @classmethod
+    def from_store(cls, feature_store, **kwargs) -> 'SimilarityIndex':
+        index = cls(**kwargs)
+        index.attach(feature_store)
+        return index
+
+    # --- NORMALIZATION ---
+    def _normalize(self, raw: np.ndarray) -> np.ndarray:
+        with self._lock:  # _mean/_scale are replaced by _fit_stats
+            vectors = (np.asarray(raw, dtype=np.float32) - self._mean) / self._scale
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _fit_stats(self):
+        raw = self._raw[:self._size]
+        self._mean = raw.mean(axis=0)
+        std = raw.std(axis=0)
+        self._scale = np.where(std > 1e-6, std, 1.0).astype(np.float32)
+        self._stats_rows = self._size
+        self._vectors[:self._size] = self._normalize(raw)
+
+    # --- WRITES ---
+    def _grow(self, needed: int):
+        if needed <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        for name in ('_ids', '_raw', '_vectors'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+        self._capacity = capacity
+
+    def add(self, detection_ids, raw_vectors):
+        """Add (or replace) one or many detections' raw feature vectors"""
+        detection_ids = np.atleast_1d(np.asarray(detection_ids, dtype=np.int64))
+        raw_vectors = np.atleast_2d(np.asarray(raw_vectors, dtype=np.float32))
+        if len(detection_ids) == 0:
+            return
+
+        # Within one batch the last vector of a repeated id wins
+        detection_ids, last = np.unique(detection_ids[::-1], return_index=True)
+        raw_vectors = raw_vectors[::-1][last]
+
+        with self._lock:
+            self._grow(self._size + len(detection_ids))
+            # Replaced ids (re-appended detections) keep their slot, new ids go to the end
+            rows = np.fromiter((self._row_of.get(i, -1) for i in detection_ids.tolist()),
+                               dtype=np.int64, count=len(detection_ids))
+            is_new = rows < 0
+            rows[is_new] = np.arange(self._size, self._size + int(is_new.sum()))
+            self._row_of.update(zip(detection_ids[is_new].tolist(), rows[is_new].tolist()))
+            self._size += int(is_new.sum())
+
+            self._ids[rows] = detection_ids
+            self._raw[rows] = raw_vectors
+            if self._stats_rows < self.STATS_MIN_ROWS:
+                self._fit_stats()
+            else:
+                self._vectors[rows] = self._normalize(raw_vectors)
+
+            if self._centroids is None:
+                if self._size >= self.ivf_min_rows:
+                    self._train_ivf()
+            else:
+                self._assign(rows)
+
+    def attach(self, feature_store):
+        """
+        Tail `feature_store`: every sync() picks up rows appended since the last
+        one. Nothing is read until the first refresh() or sync().
+        """
+        self._store = feature_store
+        self._position = (0, 0)
+        self._dirty = True
+        feature_store.add_listener(self._on_append)
+
+    def _on_append(self, detection_id):
+        self._dirty = True
+
+    def sync(self):
+        if self._store is None:
+            return
+        with self._lock:
+            self._dirty = False
+            self._synced_at = time.monotonic()
+            ids, matrix, self._position = self._store.read_since(self._position)
+            self.add(ids, matrix)
+
+    def refresh(self):
+        """sync() if the store was appended to here, or SYNC_INTERVAL has passed"""
+        if self._dirty or time.monotonic() - self._synced_at >= self.SYNC_INTERVAL:
+            self.sync()
+
+    # --- IVF ---
+    def _train_ivf(self):
+        """Spherical k-means on a sample, then assign every row to its cluster"""
+        vectors = self._vectors[:self._size]
+        nlist = int(np.clip(np.sqrt(self._size), 16, 4096))
+        sample_size = min(self._size, self.KMEANS_SAMPLE)
+        sample = vectors[self._rng.choice(self._size, sample_size, replace=False)]
+
+        centroids = sample[self._rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.KMEANS_ITERATIONS):
+            labels = self._nearest_centroid(sample, centroids)
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(centroids)
+            present = counts > 0
+            sums[present] = np.add.reduceat(sample[order], starts[present], axis=0)
+            sums[~present] = sample[self._rng.choice(sample_size, int((~present).sum()))]  # reseed empty clusters
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        self._centroids = centroids.astype(np.float32)
+        self._lists = [[] for _ in range(nlist)]
+        self._list_arrays = [None] * nlist
+        self._assign(np.arange(self._size))
+
+    @staticmethod
+    def _nearest_centroid(vectors, centroids, batch=65536):
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch):
+            labels[start:start + batch] = np.argmax(vectors[start:start + batch] @ centroids.T, axis=1)
+        return labels
+
+    def _assign(self, rows: np.ndarray):
+        labels = self._nearest_centroid(self._vectors[rows], self._centroids)
+        order = np.argsort(labels, kind='stable')
+        present, starts = np.unique(labels[order], return_index=True)
+        for label, group in zip(present.tolist(), np.split(rows[order], starts[1:])):
+            self._lists[label].append(group)
+            self._list_arrays[label] = None
+
+    def _cluster_rows(self, label: int) -> np.ndarray:
+        rows = self._list_arrays[label]
+        if rows is None:
+            # A replaced row may sit in an old cluster too; search() dedupes by id
+            parts = self._lists[label]
+            rows = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+            self._lists[label] = [rows]
+            self._list_arrays[label] = rows
+        return rows
+
+    # --- QUERIES ---
+    def __len__(self):
+        return self._size
+
+    @property
+    def mode(self) -> str:
+        return 'ivf' if self._centroids is not None else 'flat'
+
+    def vector(self, detection_id: int) -> Optional[np.ndarray]:
+        """Raw stored feature vector of a detection, or None"""
+        with self._lock:
+            row = self._row_of.get(int(detection_id))
+            return None if row is None else self._raw[row].copy()
+
+    def search(self, raw_vector, k: int = 10, exclude_id: int = None,
+               nprobe: int = None) -> List[Tuple[int, float]]:
+        """k most similar detections to a raw feature vector: [(detection_id, cosine similarity)]"""
+        with self._lock:
+            query = self._normalize(raw_vector)
+            if self._size == 0:
+                return []
+            if self._centroids is None:
+                rows = None
+                sims = self._vectors[:self._size] @ query
+            else:
+                nprobe = min(nprobe or self.NPROBE, len(self._centroids))
+                probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+                rows = np.concatenate([self._cluster_rows(p) for p in probes])
+                sims = self._vectors[rows] @ query
+            ids = self._ids[:self._size] if rows is None else self._ids[rows]
+
+            if exclude_id is not None:
+                sims = np.where(ids == exclude_id, -np.inf, sims)
+            # Over-fetch: a replaced row can be listed in two clusters
+            fetch = min(2 * k if rows is not None else k, len(sims))
+            if fetch <= 0:
+                return []
+            top = np.argpartition(-sims, fetch - 1)[:fetch]
+            top = top[np.argsort(-sims[top])]
+
+            results, seen = [], set()
+            for i in top:
+                detection_id = int(ids[i])
+                if detection_id in seen or not np.isfinite(sims[i]):
+                    continue
+                seen.add(detection_id)
+                results.append((detection_id, float(sims[i])))
+                if len(results) == k:
+                    break
+            return results
+
+    def search_id(self, detection_id: int, k: int = 10, nprobe: int = None) -> Optional[List[Tuple[int, float]]]:
+        """Neighbours of a stored detection (itself excluded); None if it is not indexed"""
+        self.refresh()
+        raw = self.vector(detection_id)
+        if raw is None:
+            return None
+        return self.search(raw, k, exclude_id=detection_id, nprobe=nprobe)
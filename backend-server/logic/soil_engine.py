@@ -1,11 +1,91 @@
 
 import os
 import cv2
+import time
 import numpy as np
 import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from typing import Dict, List, Optional, Tuple
 
+try:
+    from logic.raster_cache import RasterCache
+    from logic.raster_layers import RasterLayerRegistry
+    from logic.hwsd import HwsdSoilDatabase
+    from logic.crowd_prior import CrowdSoilPrior
+except ImportError:  # running from inside logic/
+    from raster_cache import RasterCache
+    from raster_layers import RasterLayerRegistry
+    from hwsd import HwsdSoilDatabase
+    from crowd_prior import CrowdSoilPrior
+
+# Grain detection: blob pixels with a 4-neighbour outside the blob form its outline
+GRAIN_CROSS_KERNEL = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+GRAIN_STEP_KERNEL = np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]], dtype=np.float32)
+
+class SoilDecisionBatch:
+    """
+    Row-wise determine_soil_type results for N samples (arrays over
+    SOIL_TYPES). Reasons are only generated for the rows asked for.
+    """
+
+    def __init__(self, engine, image_scores, map_scores, adjustments, final_scores, land_classes=None,
+                 hwsd_units=None, crowd_units=None):
+        self.engine = engine
+        self.image_scores = image_scores
+        self.map_scores = map_scores
+        self.adjustments = adjustments
+        self.final_scores = final_scores
+        self.land_classes = land_classes
+        self.hwsd_units = hwsd_units
+        self.crowd_units = crowd_units
+        self.winners = np.argmax(final_scores, axis=1)
+        self.confidence = np.round(final_scores[np.arange(len(final_scores)), self.winners] * 0.5, 2)
+
+    def __len__(self):
+        return len(self.final_scores)
+
+    @property
+    def soil_types(self) -> List[str]:
+        return [self.engine.SOIL_TYPES[i] for i in self.winners]
+
+    def _row(self, matrix, i) -> Dict[str, float]:
+        return {t: float(v) for t, v in zip(self.engine.SOIL_TYPES, matrix[i])}
+
+    def reasons(self, i: int) -> List[str]:
+        """generate_reasons() for row i"""
+        return self.engine.generate_reasons(
+            soil_scores=self._row(self.image_scores, i),
+            map_data={'land_class': self.land_classes[i] if self.land_classes is not None else 'Unknown'},
+            weather_data={'adjustments': dict(zip(self.engine.WEATHER_ADJUSTMENT_KEYS, self.adjustments[i].tolist()))},
+            final_scores=self._row(self.final_scores, i),
+            winning_type=self.engine.SOIL_TYPES[self.winners[i]],
+            hwsd_unit=self.hwsd_units[i] if self.hwsd_units is not None else None,
+            crowd_prior=self.crowd_units[i] if self.crowd_units is not None else None
+        )
+
+    def result(self, i: int, reasons: bool = False) -> Dict:
+        """Row i shaped like determine_soil_type()'s result (without location / map color)"""
+        result = {
+            'soil_type': self.engine.SOIL_TYPES[self.winners[i]],
+            'confidence': float(self.confidence[i]),
+            'land_class': self.land_classes[i] if self.land_classes is not None else 'Unknown',
+            'final_scores': {k: round(v, 3) for k, v in self._row(self.final_scores, i).items()},
+            'image_scores': {k: round(v, 3) for k, v in self._row(self.image_scores, i).items()},
+            'map_bias': {k: round(v, 3) for k, v in self._row(self.map_scores, i).items()},
+            'weather_adjustments': dict(zip(self.engine.WEATHER_ADJUSTMENT_KEYS, self.adjustments[i].tolist()))
+        }
+        if reasons:
+            result['reason'] = self.reasons(i)
+        return result
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Rows divided by their sum; rows summing to 0 are left as they are"""
+    totals = matrix.sum(axis=1, keepdims=True)
+    return np.divide(matrix, totals, out=matrix.copy(), where=totals > 0)
+
+
 class SoilEngine:
     # --- CONFIG ---
     # Map boundaries for Telangana
@@ -13,10 +93,19 @@ class SoilEngine:
     LAT_BOTTOM = 15.8361
     LON_LEFT = 77.2356
     LON_RIGHT = 81.3211
+    
+    # Region covered by TS.png; other regions come from the raster layer registry
+    HOME_REGION = 'telangana'
 
     # OpenWeatherMap API
     OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY', '0eb1b6f980c80a0423e9c9cb1f13d9b0')
     OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
+    
+    # Both weather calls of a request share this budget (seconds); past it the
+    # request continues with the fallback weather below
+    WEATHER_DEADLINE_S = float(os.environ.get('SOIL_WEATHER_DEADLINE_S', '5'))
+    FALLBACK_WEATHER = {'temperature': 25, 'humidity': 50, 'description': 'Unknown'}
+    FALLBACK_RAINFALL_MM = 10.0
 
     # Color to Land Class Mapping with ±20 tolerance
     COLOR_CLASSES = {
@@ -52,12 +141,53 @@ class SoilEngine:
         }
     }
 
-    def __init__(self):
-        """Initialize the SoilEngine with resources"""
+    # Window averaged around a GPS pixel before classifying its color
+    REGION_SIZE = 7
+
+    # Soil types scored from images; order of the precomputed bias vectors
+    SOIL_TYPES = ('Sandy', 'Clay', 'Loamy')
+
+    # Class id of pixels matching no COLOR_CLASSES range
+    UNKNOWN_CLASS = 255
+
+    # Neighbourhood sizes (km across) for multi-scale soil priors
+    PRIOR_SCALES_KM = {'field': 0.5, 'village': 5.0, 'mandal': 25.0}
+    
+    # Longest side (px) soil photos are analyzed at; larger photos are downscaled
+    ANALYSIS_MAX_SIDE = int(os.environ.get('SOIL_ANALYSIS_MAX_SIDE', '1024'))
+    
+    # Columns of the adjustment matrix in determine_soil_type_batch, with the
+    # value used when a sample has no such adjustment
+    WEATHER_ADJUSTMENT_KEYS = ('sandy_reduction', 'clay_crack_increase', 'texture_reliability',
+                               'color_bias_reliability')
+    WEATHER_ADJUSTMENT_DEFAULTS = (0.0, 0.0, 1.0, 1.0)
+    
+    # Patch sampling: smallest patch side (px, at working resolution), most patches,
+    # share of earthy pixels a patch needs, share trimmed at each end by trimmed_mean
+    PATCH_MIN_SIDE = 48
+    PATCH_MAX_COUNT = 64
+    PATCH_SOIL_FRACTION = 0.6
+    PATCH_TRIM = 0.2
+    
+    # Share of the 0.3 map weight given to the HWSD2 survey prior when one is ingested
+    HWSD_PRIOR_WEIGHT = 0.2
+
+    def __init__(self, crowd: CrowdSoilPrior = None):
+        """
+        Initialize the SoilEngine with resources.
+        crowd: CrowdSoilPrior fed by record_crowd_sample (e.g.
+        CrowdSoilPrior.from_env()); without one no crowd prior is used or recorded.
+        """
         # Load Map
         current_dir = os.path.dirname(os.path.abspath(__file__))
         self.map_path = os.path.join(current_dir, 'TS.png')
-        self.map_image = cv2.imread(self.map_path)
+        
+        # Decoded map and derived rasters live in memmapped .npy files shared by all
+        # worker processes; the PNG is only decoded when the cache is missing or stale
+        cache_dir = os.environ.get('SOIL_RASTER_CACHE_DIR',
+                                   os.path.join(os.path.dirname(current_dir), 'cache', 'rasters'))
+        self.raster_cache = RasterCache(self.map_path, cache_dir)
+        self.map_image = self.raster_cache.get('bgr', lambda: cv2.imread(self.map_path))
         
         if self.map_image is None:
             logging.warning(f"Map file {self.map_path} not found. Using reduced functionality.")
@@ -65,6 +195,185 @@ class SoilEngine:
         else:
             self.height, self.width = self.map_image.shape[:2]
             logging.info(f"Soil Map loaded: {self.width}x{self.height}")
+        
+        self._build_class_tables()
+        self._build_rasters()
+        
+        # Other states' maps, ingested with ingest_layers.py (tiles load lazily);
+        # layers classified with other COLOR_CLASSES are skipped
+        self.layers = RasterLayerRegistry.from_env(self.class_params())
+        
+        # Surveyed soil units (ingest_hwsd.py); optional
+        self.hwsd = HwsdSoilDatabase.from_env()
+        
+        # Soil class counts from earlier located results (record_crowd_sample)
+        self.crowd = crowd
+        
+        # Weather requests run here while process() analyzes the image
+        self.weather_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('SOIL_WEATHER_WORKERS', '8')),
+                                               thread_name_prefix='soil-weather')
+        
+        # Patch scoring for analyze_soil_patches (CPU-bound, GIL released inside OpenCV)
+        self.patch_pool = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('SOIL_PATCH_WORKERS', str(min(4, os.cpu_count() or 1)))),
+            thread_name_prefix='soil-patch')
+        
+        # Whole images of a process_batch call; separate from patch_pool, which
+        # patch-sampled images wait on
+        self.sample_pool = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('SOIL_SAMPLE_WORKERS', str(min(4, os.cpu_count() or 1)))),
+            thread_name_prefix='soil-sample')
+
+    # --- PRECOMPUTED LOOKUPS ---
+    def _build_class_tables(self):
+        """Per-class results and normalized soil-bias vectors, indexed by class id"""
+        self.class_names = list(self.COLOR_CLASSES)
+        self.class_results = []
+        for class_name, class_info in self.COLOR_CLASSES.items():
+            self.class_results.append({
+                'color_class': class_name,
+                'land_class': class_info['land_class'],
+                'soil_bias': class_info['soil_bias']
+            })
+        self.unknown_result = {'color_class': 'unknown', 'land_class': 'Unknown', 'soil_bias': {'Mixed': 1.0}}
+        # Class id of each class_bias_vectors / composition row
+        self.row_class_ids = list(range(len(self.class_names))) + [self.UNKNOWN_CLASS]
+        
+        # Row i = class i, last row = unknown; each row is convert_map_bias() normalized to sum 1
+        # (all zeros when the bias names no scored soil type, e.g. {'Mixed': 1.0})
+        biases = [info['soil_bias'] for info in self.COLOR_CLASSES.values()] + [self.unknown_result['soil_bias']]
+        self.class_bias_vectors = np.zeros((len(biases), len(self.SOIL_TYPES)), dtype=np.float64)
+        for i, bias in enumerate(biases):
+            converted = self.convert_map_bias(bias, self.SOIL_TYPES)
+            total = sum(converted.values())
+            if total > 0:
+                self.class_bias_vectors[i] = [converted[t] / total for t in self.SOIL_TYPES]
+        self.class_bias_vectors.setflags(write=False)
+    
+    def _build_rasters(self):
+        """
+        Window-averaged map (same values as get_pixel_color_region, including the
+        clipped windows at the edges) and its uint8 land-class raster, so a GPS
+        lookup is a single array index.
+        """
+        self.avg_raster = None
+        self.class_raster = None
+        self.color_sat = None
+        self.class_sat = None
+        self.pixel_classes = None
+        if self.map_image is None:
+            return
+        
+        params = {'region_size': self.REGION_SIZE}
+        self.avg_raster = self.raster_cache.get('avg', lambda: self.window_average(self.map_image), params)
+        params = self.class_params()
+        self.class_raster = self.raster_cache.get('classes', lambda: self.classify_raster(self.avg_raster), params)
+        
+        # Class of every map pixel as a class_bias_vectors row (last = unknown), for area histograms
+        self.pixel_classes = self.raster_cache.get(
+            'pixel_classes', lambda: np.minimum(self.classify_raster(self.map_image), len(self.class_names)), params)
+        
+        # Summed-area tables: window sums of any size in O(1)
+        self.color_sat = self.raster_cache.get('color_sat', lambda: cv2.integral(self.map_image, sdepth=cv2.CV_32S))
+        self.class_sat = self.raster_cache.get('class_sat', self._class_count_integrals, params)
+        
+        # Ground area of one pixel in each map row (km^2); pixels shrink with cos(latitude)
+        row_lats = self.LAT_TOP - (np.arange(self.height) + 0.5) * (self.LAT_TOP - self.LAT_BOTTOM) / self.height
+        km_per_deg = 111.32
+        pixel_h_km = (self.LAT_TOP - self.LAT_BOTTOM) / self.height * km_per_deg
+        pixel_w_km = (self.LON_RIGHT - self.LON_LEFT) / self.width * km_per_deg * np.cos(np.radians(row_lats))
+        self.row_pixel_area_km2 = pixel_h_km * pixel_w_km
+    
+    def class_params(self) -> Dict:
+        """Settings the class rasters depend on (cache stamp of TS.png, recorded in ingested layers)"""
+        return {'region_size': self.REGION_SIZE,
+                'classes': [(name, info['range']) for name, info in self.COLOR_CLASSES.items()]}
+    
+    def _class_count_integrals(self) -> np.ndarray:
+        """(H+1, W+1, classes+1) int32 integrals of per-pixel class indicators (last = unknown)"""
+        rows = self.pixel_classes
+        integrals = np.empty((self.height + 1, self.width + 1, len(self.class_names) + 1), dtype=np.int32)
+        for row in range(integrals.shape[2]):
+            integrals[:, :, row] = cv2.integral((rows == row).astype(np.uint8), sdepth=cv2.CV_32S)
+        return integrals
+    
+    def window_average(self, bgr: np.ndarray) -> np.ndarray:
+        """REGION_SIZE window mean of every pixel of a map, windows clipped at the edges"""
+        ksize = (self.REGION_SIZE, self.REGION_SIZE)
+        sums = cv2.boxFilter(bgr, cv2.CV_64F, ksize, normalize=False, borderType=cv2.BORDER_CONSTANT)
+        counts = cv2.boxFilter(np.ones(bgr.shape[:2], np.float64), -1, ksize,
+                               normalize=False, borderType=cv2.BORDER_CONSTANT)
+        # int() of the mean truncates; means are non-negative so floor is the same
+        return np.floor(sums / counts[:, :, np.newaxis]).astype(np.uint8)
+    
+    def classify_raster(self, bgr: np.ndarray) -> np.ndarray:
+        """Vectorized classify_color over an (..., 3) BGR array -> uint8 class ids"""
+        b, g, r = bgr[..., 0], bgr[..., 1], bgr[..., 2]
+        classes = np.full(bgr.shape[:-1], self.UNKNOWN_CLASS, dtype=np.uint8)
+        # Reverse order so the first matching class (as in classify_color) is written last
+        for class_id in reversed(range(len(self.class_names))):
+            low_range, high_range = self.COLOR_CLASSES[self.class_names[class_id]]['range']
+            match = ((low_range[0] <= r) & (r <= high_range[0]) &
+                     (low_range[1] <= g) & (g <= high_range[1]) &
+                     (low_range[2] <= b) & (b <= high_range[2]))
+            classes[match] = class_id
+        return classes
+    
+    def lookup_class(self, lat: float, lon: float) -> Tuple[int, np.ndarray]:
+        """
+        (class id, normalized soil-bias vector over SOIL_TYPES) for a GPS point.
+        The vector is a read-only row of class_bias_vectors; nothing is allocated.
+        """
+        if self.class_raster is not None and self.in_home_region(lat, lon):
+            x, y = self.gps_to_pixel(lat, lon)
+            class_id = int(self.class_raster[y, x])
+        else:
+            class_id = self.layers.sample('classes', lat, lon)
+            class_id = self.UNKNOWN_CLASS if class_id is None else int(class_id)
+        return class_id, self.class_bias_vectors[min(class_id, len(self.class_names))]
+    
+    def in_home_region(self, lat: float, lon: float) -> bool:
+        return self.LAT_BOTTOM <= lat <= self.LAT_TOP and self.LON_LEFT <= lon <= self.LON_RIGHT
+    
+    def lookup_class_batch(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """
+        uint8 class ids for arrays of coordinates (UNKNOWN_CLASS outside every
+        mapped region or where lat/lon is not finite). Soil-bias vectors:
+        class_bias_vectors[np.minimum(ids, len(class_names))].
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        home = ((self.LAT_BOTTOM <= lats) & (lats <= self.LAT_TOP) &
+                (self.LON_LEFT <= lons) & (lons <= self.LON_RIGHT))
+        if self.class_raster is None:
+            home[:] = False
+        
+        class_ids = np.full(lats.shape, self.UNKNOWN_CLASS, dtype=np.uint8)
+        if home.any():
+            xs, ys = self.gps_to_pixel_batch(lats[home], lons[home])
+            class_ids[home] = self.class_raster[ys, xs]
+        
+        away = ~home & np.isfinite(lats) & np.isfinite(lons)
+        if len(self.layers) and away.any():
+            class_ids[away], _ = self.layers.sample_batch('classes', lats[away], lons[away], fill=self.UNKNOWN_CLASS)
+        return class_ids
+    
+    def land_class_legend(self) -> List[Dict]:
+        """Per-class-id descriptions for the batch lookups (includes the unknown class)"""
+        legend = []
+        for row, class_id in enumerate(self.row_class_ids):
+            result = self.class_result(class_id)
+            legend.append({
+                'class_id': class_id,
+                'color_class': result['color_class'],
+                'land_class': result['land_class'],
+                'soil_bias': result['soil_bias'],
+                'bias_vector': [round(float(v), 6) for v in self.class_bias_vectors[row]]
+            })
+        return legend
+    
+    def class_result(self, class_id: int) -> Dict:
+        return self.class_results[class_id] if class_id < len(self.class_results) else self.unknown_result
 
     # --- MAP LOGIC ---
     def gps_to_pixel(self, lat: float, lon: float) -> Tuple[int, int]:
@@ -86,10 +395,33 @@ class SoilEngine:
         
         return x, y
     
+    def gps_to_pixel_batch(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized gps_to_pixel (same clamping and truncation) -> int32 (xs, ys)"""
+        lats = np.clip(np.asarray(lats, dtype=np.float64), self.LAT_BOTTOM, self.LAT_TOP)
+        lons = np.clip(np.asarray(lons, dtype=np.float64), self.LON_LEFT, self.LON_RIGHT)
+        if self.map_image is None:
+            return np.zeros(lats.shape, np.int32), np.zeros(lats.shape, np.int32)
+        
+        # Coordinates are clamped to the map bounds, so truncation == floor
+        xs = ((lons - self.LON_LEFT) / (self.LON_RIGHT - self.LON_LEFT) * self.width).astype(np.int32)
+        ys = ((self.LAT_TOP - lats) / (self.LAT_TOP - self.LAT_BOTTOM) * self.height).astype(np.int32)
+        np.clip(xs, 0, self.width - 1, out=xs)
+        np.clip(ys, 0, self.height - 1, out=ys)
+        return xs, ys
+    
     def get_pixel_color_region(self, x: int, y: int, region_size: int = 7) -> Tuple[int, int, int]:
         """Get average color of a region around the pixel"""
         if self.map_image is None:
             return (0, 0, 0)
+        
+        if region_size == self.REGION_SIZE and self.avg_raster is not None:
+            return tuple(int(c) for c in self.avg_raster[y, x])
+        
+        if self.color_sat is not None:
+            sums, area = self._window_sums(self.color_sat, x, y, region_size)
+            if area == 0:
+                return (0, 0, 0)
+            return tuple(int(v / area) for v in sums.tolist())
 
         half_size = region_size // 2
         
@@ -110,6 +442,259 @@ class SoilEngine:
         
         return tuple(map(int, avg_color))
     
+    def _window_sums(self, sat: np.ndarray, xs, ys, region_size: int):
+        """
+        Sums over the region_size windows centred on (xs, ys), clipped to the map
+        like get_pixel_color_region, from a summed-area table. Works on scalars
+        or arrays; returns (sums, pixel counts).
+        """
+        half_size = region_size // 2
+        if np.ndim(xs) == 0:
+            # Scalar path: plain int bounds avoid NumPy's per-call overhead
+            x1, x2 = max(0, xs - half_size), min(self.width, xs + half_size + 1)
+            y1, y2 = max(0, ys - half_size), min(self.height, ys + half_size + 1)
+            top, bottom = sat[y1], sat[y2]
+            sums = bottom[x2].astype(np.int64) - top[x2] - bottom[x1] + top[x1]
+            return sums, (x2 - x1) * (y2 - y1)
+        
+        x1 = np.clip(np.asarray(xs) - half_size, 0, self.width)
+        x2 = np.clip(np.asarray(xs) + half_size + 1, 0, self.width)
+        y1 = np.clip(np.asarray(ys) - half_size, 0, self.height)
+        y2 = np.clip(np.asarray(ys) + half_size + 1, 0, self.height)
+        sums = (sat[y2, x2].astype(np.int64) - sat[y1, x2] - sat[y2, x1] + sat[y1, x1])
+        return sums, (x2 - x1) * (y2 - y1)
+    
+    def get_region_composition(self, xs, ys, region_size: int) -> np.ndarray:
+        """
+        Fraction of map pixels of each class (columns as class_bias_vectors rows,
+        last = unknown) in the region_size windows around (xs, ys).
+        """
+        counts, area = self._window_sums(self.class_sat, xs, ys, region_size)
+        if np.ndim(xs) == 0:
+            return counts / max(area, 1)
+        return counts / np.maximum(area, 1)[..., np.newaxis]
+    
+    def scale_region_size(self, size_km: float) -> int:
+        """Window size in map pixels (odd, >= 1) covering about size_km across"""
+        km_per_pixel = (self.LAT_TOP - self.LAT_BOTTOM) * 111.32 / max(self.height, 1)
+        pixels = max(1, int(round(size_km / km_per_pixel)))
+        return pixels if pixels % 2 else pixels + 1
+    
+    def get_multiscale_prior(self, lat: float, lon: float, scales: List[str] = None) -> Dict:
+        """
+        Land composition and soil prior (over SOIL_TYPES) around a point at each
+        PRIOR_SCALES_KM scale; every scale costs the same few table reads.
+        Outside TS.png the raster layers are sampled instead, and a point in
+        no region has no prior ({}) rather than the map border's.
+        """
+        if self.map_image is not None and not self.in_home_region(lat, lon):
+            return self._get_layer_multiscale_prior(lat, lon, scales)
+        if self.class_sat is None:
+            return {}
+        
+        x, y = self.gps_to_pixel(lat, lon)
+        priors = {}
+        for name in scales or self.PRIOR_SCALES_KM:
+            region_size = self.scale_region_size(self.PRIOR_SCALES_KM[name])
+            composition = self.get_region_composition(x, y, region_size)
+            prior = composition @ self.class_bias_vectors
+            total = prior.sum()
+            if total > 0:
+                prior = prior / total
+            b, g, r = self.get_pixel_color_region(x, y, region_size)
+            priors[name] = {
+                'region_size_px': region_size,
+                'average_color_rgb': (r, g, b),
+                'composition': {
+                    self.class_result(class_id)['color_class']: round(float(share), 4)
+                    for class_id, share in zip(self.row_class_ids, composition)
+                    if share > 0
+                },
+                'soil_prior': {t: round(float(v), 4) for t, v in zip(self.SOIL_TYPES, prior)}
+            }
+        return priors
+    
+    # Samples per side of the grid that stands in for a window in raster layers
+    LAYER_PRIOR_GRID = 15
+    
+    def _get_layer_multiscale_prior(self, lat: float, lon: float, scales: List[str] = None) -> Dict:
+        """
+        get_multiscale_prior outside TS.png: each window is approximated by a
+        LAYER_PRIOR_GRID^2 grid of registry samples (outside every region counts
+        as unknown). {} when no region contains the point itself.
+        """
+        layer = self.layers.find(lat, lon)
+        if layer is None:
+            return {}
+        
+        steps = np.linspace(-0.5, 0.5, self.LAYER_PRIOR_GRID)
+        km_per_deg_lon = 111.32 * max(np.cos(np.radians(lat)), 1e-6)
+        priors = {}
+        for name in scales or self.PRIOR_SCALES_KM:
+            size_km = self.PRIOR_SCALES_KM[name]
+            lats, lons = np.meshgrid(lat + steps * size_km / 111.32, lon + steps * size_km / km_per_deg_lon)
+            class_ids, _ = self.layers.sample_batch('classes', lats.ravel(), lons.ravel(), fill=self.UNKNOWN_CLASS)
+            rows = np.minimum(class_ids, len(self.class_names))
+            composition = np.bincount(rows, minlength=len(self.class_names) + 1) / rows.size
+            prior = composition @ self.class_bias_vectors
+            total = prior.sum()
+            if total > 0:
+                prior = prior / total
+            priors[name] = {
+                'region': layer.name,
+                'samples': int(rows.size),
+                'composition': {
+                    self.class_result(class_id)['color_class']: round(float(share), 4)
+                    for class_id, share in zip(self.row_class_ids, composition)
+                    if share > 0
+                },
+                'soil_prior': {t: round(float(v), 4) for t, v in zip(self.SOIL_TYPES, prior)}
+            }
+            avg, found = self.layers.sample_batch('avg', lats.ravel(), lons.ravel())
+            if found.any() and avg.ndim == 2:
+                b, g, r = (int(c) for c in avg[found].mean(axis=0))
+                priors[name]['average_color_rgb'] = (r, g, b)
+        return priors
+    
+    # Sub-pixel precision of rasterized polygons (cv2.fillPoly fixed-point bits)
+    POLYGON_SHIFT = 4
+    
+    # Polygons whose bounding box is at most this many map pixels are rasterized
+    # at POLYGON_SUPERSAMPLE x resolution, so partly covered edge pixels count
+    # by their covered fraction; larger ones use one sample per map pixel
+    POLYGON_SUPERSAMPLE = 4
+    POLYGON_SUPERSAMPLE_MAX_PIXELS = 256 * 256
+    
+    def _rasterize_polygon(self, px: np.ndarray, py: np.ndarray, width: int, height: int):
+        """
+        Pixels of a width x height grid covered by a polygon in continuous pixel
+        coordinates (pixel i spans [i, i + 1)). Returns (ys, xs, covered
+        fraction), or None if the polygon misses the grid. Work is limited to
+        the polygon's bounding box. fillPoly's fill is closed, so coverage runs
+        up to one sample wide too large along the boundary. A polygon thinner
+        than the sampling grid gets the pixel under its vertices' centre.
+        """
+        x0 = max(0, int(np.floor(px.min())))
+        x1 = min(width, int(np.ceil(px.max())))
+        y0 = max(0, int(np.floor(py.min())))
+        y1 = min(height, int(np.ceil(py.max())))
+        if x0 >= x1 or y0 >= y1:
+            return None
+        
+        h, w = y1 - y0, x1 - x0
+        factor = self.POLYGON_SUPERSAMPLE if h * w <= self.POLYGON_SUPERSAMPLE_MAX_PIXELS else 1
+        # fillPoly fills samples whose centres fall inside; sample j's centre is at j + 0.5
+        vertices = np.round(np.stack([(px - x0) * factor - 0.5, (py - y0) * factor - 0.5], axis=1)
+                            * (1 << self.POLYGON_SHIFT)).astype(np.int32)
+        mask = np.zeros((h * factor, w * factor), dtype=np.uint8)
+        cv2.fillPoly(mask, [vertices], 1, lineType=cv2.LINE_8, shift=self.POLYGON_SHIFT)
+        
+        if factor > 1:
+            coverage = mask.reshape(h, factor, w, factor).sum(axis=(1, 3), dtype=np.int32) / float(factor * factor)
+        else:
+            coverage = mask
+        ys, xs = np.nonzero(coverage)
+        if ys.size == 0:
+            cx, cy = int(np.floor(px.mean())), int(np.floor(py.mean()))
+            if not (0 <= cx < width and 0 <= cy < height):
+                return None
+            return np.array([cy]), np.array([cx]), np.array([1.0])
+        return ys + y0, xs + x0, coverage[ys, xs].astype(np.float64)
+    
+    def get_polygon_prior(self, boundary: List[Tuple[float, float]]) -> Optional[Dict]:
+        """
+        Area-weighted land-class histogram and blended soil bias inside a field
+        boundary given as [(lat, lon), ...], in one weighted bincount over the
+        per-pixel class raster. Boundaries missing TS.png are rasterized onto
+        the ingested region containing their vertices' centre, using its
+        window-averaged 'classes' band. Returns None if no map covers it.
+        """
+        points = np.asarray(boundary, dtype=np.float64)
+        if self.pixel_classes is not None:
+            px = (points[:, 1] - self.LON_LEFT) / (self.LON_RIGHT - self.LON_LEFT) * self.width
+            py = (self.LAT_TOP - points[:, 0]) / (self.LAT_TOP - self.LAT_BOTTOM) * self.height
+            covered = self._rasterize_polygon(px, py, self.width, self.height)
+            if covered is not None:
+                ys, xs, fraction = covered
+                # Field area from the boundary itself (shoelace, pixel area at the centroid row)
+                centroid_row = int(np.clip(py.mean(), 0, self.height - 1))
+                return self._polygon_summary(self.pixel_classes[ys, xs], self.row_pixel_area_km2[ys] * fraction,
+                                             fraction, self._shoelace(px, py) * self.row_pixel_area_km2[centroid_row],
+                                             self.HOME_REGION)
+        
+        return self._get_layer_polygon_prior(points)
+    
+    def _get_layer_polygon_prior(self, points: np.ndarray) -> Optional[Dict]:
+        """get_polygon_prior on the pixel grid of an ingested region"""
+        layer = self.layers.find(float(points[:, 0].mean()), float(points[:, 1].mean()))
+        if layer is None or 'classes' not in layer.bands:
+            return None
+        
+        lat_span, lon_span = layer.lat_top - layer.lat_bottom, layer.lon_right - layer.lon_left
+        px = (points[:, 1] - layer.lon_left) / lon_span * layer.width
+        py = (layer.lat_top - points[:, 0]) / lat_span * layer.height
+        covered = self._rasterize_polygon(px, py, layer.width, layer.height)
+        if covered is None:
+            return None
+        ys, xs, fraction = covered
+        
+        # Pixel centres back to coordinates; the registry reads each tile once
+        class_ids, _ = self.layers.sample_batch('classes', layer.lat_top - (ys + 0.5) / layer.height * lat_span,
+                                                layer.lon_left + (xs + 0.5) / layer.width * lon_span,
+                                                fill=self.UNKNOWN_CLASS)
+        
+        centroid_row = int(np.clip(py.mean(), 0, layer.height - 1))
+        return self._polygon_summary(np.minimum(class_ids, len(self.class_names)),
+                                     self._layer_pixel_area_km2(layer, ys) * fraction, fraction,
+                                     self._shoelace(px, py) * self._layer_pixel_area_km2(layer, centroid_row),
+                                     layer.name)
+    
+    @staticmethod
+    def _layer_pixel_area_km2(layer, rows):
+        """Ground area (km^2) of one pixel in the given rows of a region layer"""
+        lat_span, lon_span = layer.lat_top - layer.lat_bottom, layer.lon_right - layer.lon_left
+        row_lats = layer.lat_top - (np.asarray(rows) + 0.5) * lat_span / layer.height
+        km_per_deg = 111.32
+        return (lat_span / layer.height * km_per_deg) * (lon_span / layer.width * km_per_deg) * np.cos(np.radians(row_lats))
+    
+    @staticmethod
+    def _shoelace(px: np.ndarray, py: np.ndarray) -> float:
+        """Polygon area in square pixels"""
+        return 0.5 * abs(np.dot(px, np.roll(py, -1)) - np.dot(py, np.roll(px, -1)))
+    
+    def _polygon_summary(self, rows: np.ndarray, weights: np.ndarray, fraction: np.ndarray,
+                         area_km2: float, region: str) -> Dict:
+        """get_polygon_prior's result from the class_bias_vectors rows and area weights of covered pixels"""
+        area = np.bincount(rows, weights=weights, minlength=len(self.class_bias_vectors))
+        composition = area / area.sum()
+        
+        prior = composition @ self.class_bias_vectors
+        if prior.sum() > 0:
+            prior = prior / prior.sum()
+        
+        # Blend the raw per-class soil_bias dicts like get_land_info reports them
+        soil_bias = {}
+        for class_id, share in zip(self.row_class_ids, composition):
+            if share > 0:
+                for soil, weight in self.class_result(class_id)['soil_bias'].items():
+                    soil_bias[soil] = soil_bias.get(soil, 0.0) + float(share) * weight
+        
+        dominant = self.class_result(self.row_class_ids[int(np.argmax(area))])
+        return {
+            'pixels': round(float(fraction.sum()), 2),  # covered map pixels (partial edge pixels count fractionally)
+            'area_km2': round(float(area_km2), 4),
+            'region': region,
+            'land_class': dominant['land_class'],
+            'color_class': dominant['color_class'],
+            'composition': {
+                self.class_result(class_id)['color_class']: round(float(share), 4)
+                for class_id, share in zip(self.row_class_ids, composition)
+                if share > 0
+            },
+            'soil_bias': {soil: round(weight, 4) for soil, weight in soil_bias.items()},
+            'soil_prior': {t: round(float(v), 4) for t, v in zip(self.SOIL_TYPES, prior)}
+        }
+    
     def classify_color(self, color: Tuple[int, int, int]) -> Dict:
         """Classify color into land class with tolerance"""
         b, g, r = color  # OpenCV uses BGR format
@@ -142,8 +727,24 @@ class SoilEngine:
         """Main function to get land information from GPS"""
         if lat is None or lon is None:
              return {'soil_bias': {'Mixed': 1.0}, 'land_class': 'Unknown'}
+        
+        if self.map_image is not None and not self.in_home_region(lat, lon):
+            return self._get_layer_land_info(lat, lon)
 
         x, y = self.gps_to_pixel(lat, lon)
+        
+        if self.class_raster is not None:
+            b, g, r = self.avg_raster[y, x]
+            classification = self.class_result(int(self.class_raster[y, x]))
+            return {
+                'pixel_coords': {'x': x, 'y': y},
+                'average_color_rgb': (int(r), int(g), int(b)),
+                'land_class': classification['land_class'],
+                'soil_bias': classification['soil_bias'],
+                'color_class': classification['color_class'],
+                'region': self.HOME_REGION
+            }
+        
         avg_color = self.get_pixel_color_region(x, y)
         classification = self.classify_color(avg_color)
         
@@ -155,8 +756,30 @@ class SoilEngine:
             'color_class': classification['color_class']
         }
 
+    def _get_layer_land_info(self, lat: float, lon: float) -> Dict:
+        """get_land_info outside TS.png: the registry's region, or unknown (not clamped to a border)"""
+        layer = self.layers.find(lat, lon)
+        class_id = self.layers.sample('classes', lat, lon)
+        if layer is None or class_id is None:
+            result = dict(self.unknown_result)
+            result['region'] = None
+            return result
+        
+        classification = self.class_result(int(class_id))
+        info = {
+            'land_class': classification['land_class'],
+            'soil_bias': classification['soil_bias'],
+            'color_class': classification['color_class'],
+            'region': layer.name
+        }
+        avg = self.layers.sample('avg', lat, lon)
+        if avg is not None:
+            b, g, r = (int(c) for c in avg)
+            info['average_color_rgb'] = (r, g, b)
+        return info
+
     # --- WEATHER LOGIC ---
-    def get_current_weather(self, lat: float, lon: float) -> Optional[Dict]:
+    def get_current_weather(self, lat: float, lon: float, timeout: float = 5) -> Optional[Dict]:
         """Get current weather data"""
         try:
             url = f"{self.OPENWEATHER_BASE_URL}/weather"
@@ -167,7 +790,7 @@ class SoilEngine:
                 'units': 'metric'
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            response = requests.get(url, params=params, timeout=timeout)
             # Note: We don't raise error here to allow fallback
             if response.status_code != 200:
                 raise Exception(f"API Error: {response.status_code}")
@@ -186,7 +809,7 @@ class SoilEngine:
             logging.error(f"Error fetching current weather: {str(e)}")
             return None # Return None to indicate failure/fallback needed upstream
 
-    def get_historical_rainfall(self, lat: float, lon: float, days: int = 5) -> float:
+    def get_historical_rainfall(self, lat: float, lon: float, days: int = 5, timeout: float = 5) -> float:
         """Get historical rainfall data estimate"""
         try:
             url = f"{self.OPENWEATHER_BASE_URL}/forecast"
@@ -198,9 +821,9 @@ class SoilEngine:
                 'cnt': 40 # 5 days * 8 intervals
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            response = requests.get(url, params=params, timeout=timeout)
             if response.status_code != 200:
-                 return 10.0 # Default fallback
+                 return self.FALLBACK_RAINFALL_MM
 
             data = response.json()
             
@@ -218,7 +841,7 @@ class SoilEngine:
             
         except Exception as e:
             logging.error(f"Error fetching rainfall data: {str(e)}")
-            return 10.0 # Default value
+            return self.FALLBACK_RAINFALL_MM
 
     def get_weather_adjustments(self, lat: float, lon: float) -> Dict:
         """Get weather-based adjustment factors for soil analysis"""
@@ -227,7 +850,45 @@ class SoilEngine:
 
         current_weather = self.get_current_weather(lat, lon)
         avg_rainfall = self.get_historical_rainfall(lat, lon, days=5)
+        return self.compute_weather_adjustments(current_weather, avg_rainfall)
+    
+    def start_weather_fetch(self, lat: float, lon: float):
+        """
+        Submit both weather calls to the weather pool; returns a handle for
+        collect_weather_adjustments(), or None without coordinates.
+        """
+        if lat is None or lon is None:
+            return None
+        deadline = time.monotonic() + self.WEATHER_DEADLINE_S
+        return deadline, (
+            self.weather_pool.submit(self.get_current_weather, lat, lon, self.WEATHER_DEADLINE_S),
+            self.weather_pool.submit(self.get_historical_rainfall, lat, lon, 5, self.WEATHER_DEADLINE_S)
+        )
+    
+    def collect_weather_adjustments(self, pending) -> Dict:
+        """Adjustments from start_weather_fetch() results, using the fallbacks for calls past the deadline"""
+        if pending is None:
+            return {'adjustments': {}, 'weather_data': {}}
         
+        deadline, (weather_future, rainfall_future) = pending
+        results, timed_out = [], []
+        for name, future, fallback in (('current_weather', weather_future, None),
+                                       ('rainfall', rainfall_future, self.FALLBACK_RAINFALL_MM)):
+            try:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                future.cancel()
+                timed_out.append(name)
+                results.append(fallback)
+        
+        weather = self.compute_weather_adjustments(*results)
+        if timed_out:
+            logging.warning(f"Weather deadline ({self.WEATHER_DEADLINE_S}s) passed for {', '.join(timed_out)}; using fallbacks")
+            weather['timed_out'] = timed_out
+        return weather
+    
+    def compute_weather_adjustments(self, current_weather: Optional[Dict], avg_rainfall: float) -> Dict:
+        """Adjustment factors from fetched weather (current_weather None = fetch failed)"""
         adjustments = {
             'sandy_reduction': 0.0,
             'clay_crack_increase': 0.0,
@@ -256,7 +917,7 @@ class SoilEngine:
                 adjustments['color_bias_reliability'] = 0.7
         else:
              # Fallback mock weather if API fails
-             current_weather = {'temperature': 25, 'humidity': 50, 'description': 'Unknown'}
+             current_weather = dict(self.FALLBACK_WEATHER)
 
         return {
             'adjustments': adjustments,
@@ -265,19 +926,31 @@ class SoilEngine:
         }
 
     # --- IMAGE ANALYSIS LOGIC ---
+    def working_image(self, img: np.ndarray) -> np.ndarray:
+        """img downscaled (INTER_AREA) so its longest side is at most ANALYSIS_MAX_SIDE"""
+        height, width = img.shape[:2]
+        scale = self.ANALYSIS_MAX_SIDE / max(height, width)
+        if scale >= 1.0:
+            return img
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    
     def analyze_image_texture(self, gray_img: np.ndarray) -> Dict[str, float]:
         """Analyze texture features"""
         # Calculate gradient magnitude
-        sobelx = cv2.Sobel(gray_img, cv2.CV_64F, 1, 0, ksize=3)
-        sobely = cv2.Sobel(gray_img, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_magnitude = np.sqrt(sobelx**2 + sobely**2)
+        sobelx = cv2.Sobel(gray_img, cv2.CV_32F, 1, 0, ksize=3)
+        sobely = cv2.Sobel(gray_img, cv2.CV_32F, 0, 1, ksize=3)
+        # Plain float32 sqrt: cv2.magnitude's last bit differs with the calling
+        # thread, which made patch scores from the pool unreproducible
+        gradient_magnitude = np.sqrt(sobelx * sobelx + sobely * sobely)
         
         # Coarseness measure
-        coarseness = np.std(gradient_magnitude) / 255.0
+        _, std = cv2.meanStdDev(gradient_magnitude)
+        coarseness = std[0, 0] / 255.0
         
         # Homogeneity measure
         _, binary = cv2.threshold(gray_img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        homogeneity = np.sum(binary == 255) / (binary.shape[0] * binary.shape[1])
+        homogeneity = cv2.countNonZero(binary) / binary.size
         
         return {
             'coarseness': float(coarseness),
@@ -294,11 +967,9 @@ class SoilEngine:
         
         crack_score = 0.0
         if lines is not None:
-            total_line_length = 0
-            for line in lines:
-                x1, y1, x2, y2 = line[0]
-                length = np.sqrt((x2-x1)**2 + (y2-y1)**2)
-                total_line_length += length
+            # (N, 1, 4) or (N, 4) depending on the OpenCV version
+            x1, y1, x2, y2 = lines.reshape(-1, 4).astype(np.float64).T
+            total_line_length = np.hypot(x2 - x1, y2 - y1).sum()
             
             # Normalize by image diagonal
             img_diag = np.sqrt(gray_img.shape[0]**2 + gray_img.shape[1]**2)
@@ -307,7 +978,7 @@ class SoilEngine:
         return crack_score
     
     def detect_grains(self, gray_img: np.ndarray) -> float:
-        """Detect sand grains using contour analysis"""
+        """Detect sand grains from connected-component statistics"""
         # Enhance contrast
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
         enhanced = clahe.apply(gray_img)
@@ -315,21 +986,40 @@ class SoilEngine:
         # Threshold
         _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
-        # Find contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        grain_count = 0
-        
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            perimeter = cv2.arcLength(contour, True)
-            
-            # Circularity measure
-            if perimeter > 0:
-                circularity = 4 * np.pi * area / (perimeter ** 2)
-                # Typical grain size range
-                if 0.3 < circularity < 1.0 and 10 < area < 1000:
-                    grain_count += 1
+        # Fill holes (dark pixels not reachable from the image border) so a blob
+        # covers everything inside its outer outline, like an external contour
+        height, width = thresh.shape
+        padded = cv2.copyMakeBorder(thresh, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        cv2.floodFill(padded, np.zeros((height + 4, width + 4), np.uint8), (0, 0), 128)
+        filled = cv2.compare(padded[1:-1, 1:-1], 128, cv2.CMP_NE)
+        
+        # Label bright blobs; area and perimeter of every blob at once instead of
+        # tracing a contour per blob. Boundary pixels: blob pixels with a
+        # 4-neighbour outside the blob.
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(filled, connectivity=8)
+        eroded = cv2.erode(filled, GRAIN_CROSS_KERNEL, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        _, boundary = cv2.threshold(cv2.subtract(filled, eroded), 0, 1, cv2.THRESH_BINARY)
+        pixels = np.flatnonzero(boundary)
+        boundary_labels = labels.ravel()[pixels]
+        
+        # Outline length: each boundary pixel links to two neighbours along the
+        # outline, straight (1) when they are 4-neighbours, diagonal (sqrt 2) otherwise
+        neighbours = cv2.filter2D(boundary, -1, GRAIN_STEP_KERNEL, borderType=cv2.BORDER_CONSTANT)
+        straight = np.minimum(neighbours.ravel()[pixels], 2).astype(np.float64)
+        steps = straight / 2 + (2.0 - straight) / 2 * np.sqrt(2)
+        boundary_count = np.bincount(boundary_labels, minlength=count).astype(np.float64)
+        perimeter = np.bincount(boundary_labels, weights=steps, minlength=count)
+        
+        # Area enclosed by the outline through boundary pixel centres (Pick's
+        # theorem), comparable to contourArea
+        area = np.maximum(stats[:, cv2.CC_STAT_AREA] - boundary_count / 2 - 1, 0.0)
+        
+        # Circularity measure
+        circularity = 4 * np.pi * area / np.maximum(perimeter, 1e-9) ** 2
+        # Typical grain size range
+        grains = (perimeter > 0) & (0.3 < circularity) & (circularity < 1.0) & (10 < area) & (area < 1000)
+        grains[0] = False  # background
+        grain_count = int(np.count_nonzero(grains))
         
         # Normalize score
         grain_score = min(grain_count / 50.0, 1.0)
@@ -343,6 +1033,11 @@ class SoilEngine:
         if img is None:
             raise ValueError("Invalid image data")
 
+        # Analyze at a bounded resolution; photos within it are used as-is
+        return self.score_soil_image(self.working_image(img))
+    
+    def score_soil_image(self, img: np.ndarray) -> Dict[str, float]:
+        """Soil type scores of a BGR image (or patch) at its own resolution"""
         # Convert to HSV for better color analysis
         hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
         
@@ -403,6 +1098,98 @@ class SoilEngine:
         
         return scores
 
+    # --- PATCH SAMPLING ---
+    def patch_boxes(self, height: int, width: int, patches: int, layout: str = 'grid',
+                    seed: int = None) -> List[Tuple[int, int, int, int]]:
+        """
+        (x0, y0, x1, y1) patches: `patches` grid cells covering the image, or
+        `patches` random squares. When `patches` does not fill a rows x cols
+        grid, the first rows get one cell more, so the count is exact.
+        """
+        if layout == 'grid':
+            rows = min(patches, max(1, int(round(np.sqrt(patches * height / width)))))
+            ys = np.linspace(0, height, rows + 1).astype(int)
+            boxes = []
+            for r in range(rows):
+                cols = patches // rows + (r < patches % rows)
+                xs = np.linspace(0, width, cols + 1).astype(int)
+                boxes.extend((xs[c], ys[r], xs[c + 1], ys[r + 1]) for c in range(cols))
+        else:
+            side = int(min(height, width, np.sqrt(height * width / patches)))
+            rng = np.random.default_rng(seed)
+            x0s = rng.integers(0, width - side + 1, patches)
+            y0s = rng.integers(0, height - side + 1, patches)
+            boxes = [(x, y, x + side, y + side) for x, y in zip(x0s.tolist(), y0s.tolist())]
+        return [(int(x0), int(y0), int(x1), int(y1)) for x0, y0, x1, y1 in boxes
+                if min(x1 - x0, y1 - y0) >= self.PATCH_MIN_SIDE]
+    
+    def is_soil_patch(self, hsv_patch: np.ndarray) -> bool:
+        """Cheap color test: enough earthy (red-yellow or greyish), not too dark or blown-out pixels"""
+        earthy = cv2.inRange(hsv_patch, (0, 0, 40), (30, 255, 245))
+        earthy |= cv2.inRange(hsv_patch, (165, 0, 40), (180, 255, 245))
+        earthy |= cv2.inRange(hsv_patch, (0, 0, 40), (180, 50, 245))
+        return cv2.countNonZero(earthy) >= self.PATCH_SOIL_FRACTION * earthy.size
+    
+    def analyze_soil_patches(self, img: np.ndarray, patches: int = 16, layout: str = 'grid',
+                             seed: int = None, aggregate: str = 'median') -> Tuple[Dict[str, float], Dict]:
+        """
+        Soil scores from many patches instead of the whole photo: patches failing
+        is_soil_patch (grass, shadow, shoes) are dropped, the rest are scored in
+        the patch pool and combined per soil type with a median or trimmed mean.
+        Falls back to the whole-image analysis when no patch looks like soil.
+        Returns (scores, sampling info).
+        """
+        if img is None:
+            raise ValueError("Invalid image data")
+        if layout not in ('grid', 'random'):
+            raise ValueError("layout must be 'grid' or 'random'")
+        if aggregate not in ('median', 'trimmed_mean'):
+            raise ValueError("aggregate must be 'median' or 'trimmed_mean'")
+        if not 1 <= patches <= self.PATCH_MAX_COUNT:
+            raise ValueError(f"patches must be between 1 and {self.PATCH_MAX_COUNT}")
+        
+        img = self.working_image(img)
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        boxes = self.patch_boxes(img.shape[0], img.shape[1], patches, layout, seed)
+        soil_boxes = [box for box in boxes if self.is_soil_patch(hsv[box[1]:box[3], box[0]:box[2]])]
+        info = {
+            'layout': layout,
+            'aggregate': aggregate,
+            'patches': len(boxes),
+            'used': len(soil_boxes),
+            'rejected': len(boxes) - len(soil_boxes),
+        }
+        if not soil_boxes:
+            info['fallback'] = 'whole_image'
+            return self.score_soil_image(img), info
+        
+        # OpenCV releases the GIL, so patches score concurrently
+        patch_scores = list(self.patch_pool.map(
+            lambda box: self.score_soil_image(img[box[1]:box[3], box[0]:box[2]]), soil_boxes))
+        scores, info['spread'] = self.combine_scores(patch_scores, aggregate)
+        return scores, info
+    
+    def combine_scores(self, score_list: List[Dict[str, float]], aggregate: str = 'median') -> Tuple[Dict, Dict]:
+        """
+        Per-soil-type median or trimmed mean of several score dicts, normalized
+        to sum 1; returns (scores, per-type standard deviation)
+        """
+        if aggregate not in ('median', 'trimmed_mean'):
+            raise ValueError("aggregate must be 'median' or 'trimmed_mean'")
+        matrix = np.array([[scores[t] for t in self.SOIL_TYPES] for scores in score_list])
+        
+        if aggregate == 'median':
+            combined = np.median(matrix, axis=0)
+        else:
+            trim = int(len(matrix) * self.PATCH_TRIM)
+            combined = np.sort(matrix, axis=0)[trim:len(matrix) - trim].mean(axis=0)
+        total = combined.sum()
+        if total > 0:
+            combined = combined / total
+        
+        spread = {t: round(float(v), 3) for t, v in zip(self.SOIL_TYPES, matrix.std(axis=0))}
+        return {t: float(v) for t, v in zip(self.SOIL_TYPES, combined)}, spread
+
     # --- DECISION ENGINE ---
     def determine_soil_type(
         self,
@@ -416,6 +1203,10 @@ class SoilEngine:
         # Extract data
         map_bias = map_data.get('soil_bias', {'Mixed': 1.0})
         weather_adjustments = weather_data.get('adjustments', {})
+        location = location or {}
+        hwsd_unit = self.hwsd.get_prior(location.get('lat'), location.get('lon'))
+        hwsd_prior = hwsd_unit.get('soil_prior') if hwsd_unit else None
+        crowd_prior = self.crowd.get_prior(location.get('lat'), location.get('lon')) if self.crowd else None
         
         # Apply weather adjustments
         adjusted_soil_scores = soil_scores.copy()
@@ -454,14 +1245,20 @@ class SoilEngine:
             for key in map_scores:
                 map_scores[key] /= total_map
         
-        # Combine scores with weights
+        # Combine scores with weights; a surveyed HWSD2 unit takes most of the
+        # color map's share, since the map only guesses soil from land cover
+        map_weight = 0.3 if hwsd_prior is None else 0.3 - self.HWSD_PRIOR_WEIGHT
         final_scores = {}
         for soil_type in adjusted_soil_scores.keys():
             final_scores[soil_type] = (
                 0.5 * adjusted_soil_scores.get(soil_type, 0) +
-                0.3 * map_scores.get(soil_type, 0) +
+                map_weight * map_scores.get(soil_type, 0) +
                 0.2 * (1.0 / len(adjusted_soil_scores))
             )
+            if hwsd_prior is not None:
+                final_scores[soil_type] += self.HWSD_PRIOR_WEIGHT * hwsd_prior.get(soil_type, 0)
+            if crowd_prior is not None:
+                final_scores[soil_type] += crowd_prior['weight'] * crowd_prior['soil_prior'].get(soil_type, 0)
         
         # Normalize final scores
         total_final = sum(final_scores.values())
@@ -478,7 +1275,9 @@ class SoilEngine:
             map_data=map_data,
             weather_data=weather_data,
             final_scores=final_scores,
-            winning_type=soil_type[0]
+            winning_type=soil_type[0],
+            hwsd_unit=hwsd_unit,
+            crowd_prior=crowd_prior
         )
         
         # Prepare result
@@ -494,9 +1293,101 @@ class SoilEngine:
             'weather_adjustments': weather_adjustments,
             'reason': reasons
         }
+        if hwsd_unit is not None:
+            result['hwsd'] = hwsd_unit
+        if crowd_prior is not None:
+            result['crowd_prior'] = crowd_prior
         
         return result
     
+    def determine_soil_type_batch(
+        self,
+        image_scores: np.ndarray,
+        map_bias: np.ndarray,
+        adjustments: np.ndarray = None,
+        hwsd_prior: np.ndarray = None,
+        land_classes: List[str] = None,
+        hwsd_units: List[Optional[Dict]] = None,
+        crowd_prior: np.ndarray = None,
+        crowd_units: List[Optional[Dict]] = None
+    ) -> SoilDecisionBatch:
+        """
+        determine_soil_type for N samples at once. image_scores and map_bias are
+        N x 3 over SOIL_TYPES (map_bias as returned by convert_map_bias, see
+        map_bias_matrix); adjustments is N x 4 over WEATHER_ADJUSTMENT_KEYS
+        (see adjustment_matrix); hwsd_prior is N x 3 with NaN rows where no
+        survey unit applies; crowd_prior is N x 3 weighted crowd priors (see
+        crowd_prior_matrix). land_classes / hwsd_units / crowd_units are only
+        used for reasons.
+        """
+        image_scores = np.asarray(image_scores, dtype=np.float64).reshape(-1, len(self.SOIL_TYPES))
+        count = len(image_scores)
+        map_bias = np.asarray(map_bias, dtype=np.float64).reshape(count, len(self.SOIL_TYPES))
+        if adjustments is None:
+            adjustments = np.tile(self.WEATHER_ADJUSTMENT_DEFAULTS, (count, 1))
+        adjustments = np.asarray(adjustments, dtype=np.float64).reshape(count, len(self.WEATHER_ADJUSTMENT_KEYS))
+        sandy_reduction, clay_crack_increase, texture_reliability, color_reliability = adjustments.T
+        
+        # Apply weather adjustments and normalize soil scores
+        factors = np.ones_like(image_scores)
+        factors[:, self.SOIL_TYPES.index('Sandy')] = 1.0 - sandy_reduction
+        factors[:, self.SOIL_TYPES.index('Clay')] = 1.0 + clay_crack_increase
+        adjusted = _normalize_rows(image_scores * factors * texture_reliability[:, np.newaxis])
+        
+        # Apply reliability to map scores and normalize
+        uniform = 1.0 / len(self.SOIL_TYPES)
+        reliability = color_reliability[:, np.newaxis]
+        map_scores = _normalize_rows(map_bias * reliability + (1.0 - reliability) * uniform)
+        
+        # Combine scores with weights (HWSD2 prior takes part of the map weight where present)
+        final_scores = 0.5 * adjusted + 0.3 * map_scores + 0.2 * uniform
+        if hwsd_prior is not None:
+            hwsd_prior = np.asarray(hwsd_prior, dtype=np.float64).reshape(count, len(self.SOIL_TYPES))
+            surveyed = ~np.isnan(hwsd_prior).any(axis=1)
+            final_scores[surveyed] += self.HWSD_PRIOR_WEIGHT * (hwsd_prior[surveyed] - map_scores[surveyed])
+        if crowd_prior is not None:
+            final_scores += np.asarray(crowd_prior, dtype=np.float64).reshape(count, len(self.SOIL_TYPES))
+        final_scores = _normalize_rows(final_scores)
+        
+        return SoilDecisionBatch(self, image_scores, map_scores, adjustments, final_scores,
+                                 land_classes=land_classes, hwsd_units=hwsd_units, crowd_units=crowd_units)
+    
+    def crowd_prior_matrix(self, crowd_units: List[Optional[Dict]]) -> np.ndarray:
+        """N x 3 weight-scaled rows of CrowdSoilPrior.get_prior results (zeros where None)"""
+        matrix = np.zeros((len(crowd_units), len(self.SOIL_TYPES)))
+        for i, unit in enumerate(crowd_units):
+            if unit is not None:
+                matrix[i] = [unit['weight'] * unit['soil_prior'].get(t, 0) for t in self.SOIL_TYPES]
+        return matrix
+    
+    def record_crowd_sample(self, lat: float, lon: float, result: Dict) -> bool:
+        """
+        Add a located result to the crowd prior. Image scores are recorded, not
+        the final decision, so the prior never feeds back into its own counts.
+        False when nothing was recorded (no crowd prior, no location).
+        """
+        if self.crowd is None:
+            return False
+        return self.crowd.record(lat, lon, result.get('image_scores', {}))
+    
+    def map_bias_matrix(self, map_biases: List[Dict]) -> np.ndarray:
+        """N x 3 convert_map_bias rows for determine_soil_type_batch (each distinct bias converted once)"""
+        converted = {}
+        rows = []
+        for bias in map_biases:
+            key = tuple(sorted(bias.items()))
+            if key not in converted:
+                scores = self.convert_map_bias(bias, self.SOIL_TYPES)
+                converted[key] = [scores[t] for t in self.SOIL_TYPES]
+            rows.append(converted[key])
+        return np.array(rows, dtype=np.float64).reshape(-1, len(self.SOIL_TYPES))
+    
+    def adjustment_matrix(self, adjustments: List[Dict]) -> np.ndarray:
+        """N x 4 weather adjustment rows for determine_soil_type_batch (missing keys get their defaults)"""
+        return np.array([[a.get(key, default) for key, default in zip(self.WEATHER_ADJUSTMENT_KEYS,
+                                                                       self.WEATHER_ADJUSTMENT_DEFAULTS)]
+                         for a in adjustments], dtype=np.float64).reshape(-1, len(self.WEATHER_ADJUSTMENT_KEYS))
+    
     def convert_map_bias(self, map_bias: Dict, target_soil_types: List[str]) -> Dict[str, float]:
         """Convert map bias to match available soil types"""
         converted = {soil_type: 0.0 for soil_type in target_soil_types}
@@ -520,7 +1411,9 @@ class SoilEngine:
         map_data: Dict,
         weather_data: Dict,
         final_scores: Dict,
-        winning_type: str
+        winning_type: str,
+        hwsd_unit: Dict = None,
+        crowd_prior: Dict = None
     ) -> List[str]:
         """Generate human-readable reasons for the decision"""
         reasons = []
@@ -533,6 +1426,20 @@ class SoilEngine:
         land_class = map_data.get('land_class', 'Unknown')
         reasons.append(f"Location classified as {land_class} based on satellite data")
         
+        if hwsd_unit and hwsd_unit.get('texture_class'):
+            details = []
+            if hwsd_unit.get('ph') is not None:
+                details.append(f"pH {hwsd_unit['ph']}")
+            if hwsd_unit.get('organic_carbon') is not None:
+                details.append(f"{hwsd_unit['organic_carbon']}% organic carbon")
+            reasons.append(f"Soil survey (HWSD2) maps {hwsd_unit['texture_class']} topsoil here"
+                           + (f" ({', '.join(details)})" if details else ""))
+        
+        if crowd_prior:
+            crowd_top = max(crowd_prior['soil_prior'].items(), key=lambda x: x[1])
+            reasons.append(f"Earlier soil tests nearby lean {crowd_top[0]} "
+                           f"({crowd_prior['samples']:.0f} recent samples)")
+        
         # Weather-based reasons
         adjustments = weather_data.get('adjustments', {})
         
@@ -551,18 +1458,59 @@ class SoilEngine:
         return reasons
 
     # --- MAIN ENTRY POINT ---
-    def process(self, image: np.ndarray, lat: float = None, lon: float = None) -> Dict:
-        """Process a soil analysis request"""
-        # 1. Analyze Image
-        soil_scores = self.analyze_soil_image(image)
+    def process(self, image: np.ndarray, lat: float = None, lon: float = None, sampling: Dict = None) -> Dict:
+        """Process a soil analysis request (sampling: analyze_soil_patches options, or None for the whole photo)"""
+        # 1. Start both weather calls (if lat/lon provided); they overlap the CPU work below
+        pending_weather = self.start_weather_fetch(lat, lon)
+        
+        # 2. Analyze Image
+        sampling_info = None
+        if sampling:
+            soil_scores, sampling_info = self.analyze_soil_patches(image, **sampling)
+        else:
+            soil_scores = self.analyze_soil_image(image)
         
-        # 2. Get Map Data (if lat/lon provided)
+        # 3. Get Map Data (if lat/lon provided)
         map_data = self.get_land_info(lat, lon)
         
-        # 3. Get Weather Data (if lat/lon provided)
-        weather_data = self.get_weather_adjustments(lat, lon)
+        # 4. Wait for the weather, at most until the shared deadline
+        weather_data = self.collect_weather_adjustments(pending_weather)
+        
+        # 5. Determine Soil Type
+        result = self.determine_soil_type(
+            soil_scores=soil_scores,
+            map_data=map_data,
+            weather_data=weather_data,
+            location={'lat': lat, 'lon': lon}
+        )
+        if sampling_info is not None:
+            result['image_sampling'] = sampling_info
+        
+        return result
+    
+    def process_batch(self, images: List[np.ndarray], lat: float = None, lon: float = None,
+                      aggregate: str = 'median', sampling: Dict = None) -> Dict:
+        """
+        One decision for several photos of the same field: map and weather are
+        fetched once, the photos are scored in parallel and their scores fused
+        (median / trimmed mean) before a single determine_soil_type call.
+        """
+        if not images:
+            raise ValueError("At least one image is required")
+        if aggregate not in ('median', 'trimmed_mean'):
+            raise ValueError("aggregate must be 'median' or 'trimmed_mean'")
+        
+        pending_weather = self.start_weather_fetch(lat, lon)
         
-        # 4. Determine Soil Type
+        def score(image):
+            if sampling:
+                return self.analyze_soil_patches(image, **sampling)[0]
+            return self.analyze_soil_image(image)
+        sample_scores = list(self.sample_pool.map(score, images))
+        soil_scores, spread = self.combine_scores(sample_scores, aggregate)
+        
+        map_data = self.get_land_info(lat, lon)
+        weather_data = self.collect_weather_adjustments(pending_weather)
         result = self.determine_soil_type(
             soil_scores=soil_scores,
             map_data=map_data,
@@ -570,4 +1518,18 @@ class SoilEngine:
             location={'lat': lat, 'lon': lon}
         )
         
+        samples = []
+        for index, scores in enumerate(sample_scores):
+            samples.append({
+                'index': index,
+                'image_scores': {k: round(v, 3) for k, v in scores.items()},
+                'top_type': max(scores.items(), key=lambda x: x[1])[0]
+            })
+        result['samples'] = samples
+        result['sample_count'] = len(samples)
+        result['sample_aggregate'] = aggregate
+        result['sample_spread'] = spread
+        # Share of photos whose own best guess matches the field decision
+        result['sample_agreement'] = round(
+            sum(sample['top_type'] == result['soil_type'] for sample in samples) / len(samples), 3)
         return result
@@ -0,0 +1,107 @@
+import os
+import glob
+import json
+import hashlib
+import cv2
+from typing import Optional
+
+
+class VisualReportStore:
+    """
+    On-disk storage for detection source images and their rendered visual reports.
+
+    /predict only drops the uploaded bytes here (as a background task); the
+    annotated report is rendered the first time it is requested and cached
+    under a key made of the detection id, the engine version and a digest of
+    the rules table plus the diagnoses drawn. A rule edit or a re-scored
+    detection therefore renders afresh; older renders of the id are removed.
+    """
+
+    # Output formats supported by the visual report endpoint
+    FORMATS = {
+        'jpg': ('.jpg', [cv2.IMWRITE_JPEG_QUALITY, 85]),
+        'webp': ('.webp', [cv2.IMWRITE_WEBP_QUALITY, 80]),
+    }
+    MEDIA_TYPES = {'jpg': 'image/jpeg', 'webp': 'image/webp'}
+
+    SOURCE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+    def __init__(self, base_dir: str):
+        self.source_dir = os.path.join(base_dir, 'uploads', 'detections')
+        self.cache_dir = os.path.join(base_dir, 'cache', 'visual_reports')
+        os.makedirs(self.source_dir, exist_ok=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # --- SOURCE IMAGES ---
+    def save_source(self, detection_id: int, image_data: bytes, filename: str = None):
+        """Persist the original upload bytes as-is (no re-encoding)"""
+        if detection_id is None:
+            return None
+
+        ext = os.path.splitext(filename or '')[1].lower()
+        if ext not in self.SOURCE_EXTENSIONS:
+            ext = '.jpg'
+
+        path = os.path.join(self.source_dir, f"{detection_id}{ext}")
+        self._write_atomic(path, image_data)
+        return path
+
+    def source_path(self, detection_id: int) -> Optional[str]:
+        # Checked per extension: a glob would also match in-flight or orphaned .tmp files
+        for ext in sorted(self.SOURCE_EXTENSIONS):
+            path = os.path.join(self.source_dir, f"{detection_id}{ext}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    # --- RENDERED REPORTS ---
+    @staticmethod
+    def report_key(detector, plant_name: str, diseases: list) -> str:
+        """Engine version plus a digest of the rules table and the diagnoses drawn"""
+        content = json.dumps([detector.rule_table.digest, plant_name, diseases], sort_keys=True, default=str)
+        return f"{detector.ENGINE_VERSION}_{hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]}"
+
+    def report_path(self, detection_id: int, report_key: str, fmt: str = 'jpg') -> str:
+        ext, _ = self.FORMATS[fmt]
+        return os.path.join(self.cache_dir, f"{detection_id}_v{report_key}{ext}")
+
+    def get_or_render(self, detector, detection_id: int, plant_name: str, diseases: list,
+                      fmt: str = 'jpg') -> Optional[str]:
+        """Return the cached report path, rendering and caching it on a miss"""
+        path = self.report_path(detection_id, self.report_key(detector, plant_name, diseases), fmt)
+        if os.path.exists(path):
+            return path
+
+        source = self.source_path(detection_id)
+        if source is None:
+            return None
+
+        img = cv2.imread(source, cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+
+        vis_img = detector.render_visual_report(img, plant_name, diseases)
+        ext, params = self.FORMATS[fmt]
+        ok, encoded = cv2.imencode(ext, vis_img, params)
+        if not ok:
+            return None
+
+        self._write_atomic(path, encoded.tobytes())
+
+        # Renders under an older key are never served again
+        ext, _ = self.FORMATS[fmt]
+        for stale in glob.glob(os.path.join(self.cache_dir, f"{detection_id}_v*{ext}")):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        return path
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        # Write to a temp file first so readers never see a half-written image
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
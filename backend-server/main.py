@@ -1,10 +1,13 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 import sqlite3
 import os
+import time
 from datetime import datetime
+from typing import Dict, List
 
 import cv2
 import numpy as np
@@ -13,6 +16,10 @@ import sys
 
 # Import new logic engine
 from logic.plant_detection_engine import AutoPlantDiseaseDetector
+from logic.disease_rules import CONFIDENCE_SCORES
+from logic.feature_store import (
+    FEATURE_SCHEMA_VERSION, SHAPE_FEATURE_KEYS, TEXTURE_FEATURE_KEYS, COLOR_FEATURE_KEYS, validate_features
+)
 from utils import calculate_distance
 
 app = FastAPI()
@@ -74,6 +81,15 @@ class PaymentProcess(BaseModel):
     payment_method: str  # 'cod' or 'full'
     amount: float
 
+class FeaturePrediction(BaseModel):
+    # Leaf features computed on the device (see GET /predict/features/schema)
+    schema_version: int
+    user_id: int
+    shape: Dict[str, float] = {}
+    texture: Dict[str, float] = {}
+    color: Dict[str, float] = {}
+    image_name: str = "on_device"
+
 
 # --- Paths ---
 # --- Paths ---
@@ -82,7 +98,30 @@ class PaymentProcess(BaseModel):
 
 
 # --- Initialize Plant Detector Engine ---
-plant_detector = AutoPlantDiseaseDetector()
+# Optional ONNX classifier (ONNX_MODEL_PATH); the rule engine is used alone without it.
+# Concurrent requests share forward passes through the micro-batcher (BATCH_MAX_SIZE / BATCH_MAX_WAIT_MS)
+from logic.onnx_classifier import OnnxClassifier
+from logic.micro_batcher import BatchedClassifier
+plant_detector = AutoPlantDiseaseDetector(classifier=BatchedClassifier.from_env(OnnxClassifier.from_env()))
+
+# Source images + lazily rendered visual reports (see detection_endpoints.py)
+from logic.visual_reports import VisualReportStore
+report_store = VisualReportStore(BASE_DIR)
+
+# Nearest-neighbour search over past detections' feature vectors (tails the feature store;
+# loaded on the first /similar query, not at startup)
+from logic.similarity_index import SimilarityIndex
+similarity_index = SimilarityIndex.from_store(plant_detector.feature_store)
+
+# Optional shadow evaluation of a candidate pipeline (SHADOW_SAMPLE_RATE > 0 enables it)
+from logic.shadow_mode import ShadowEvaluator
+shadow_evaluator = ShadowEvaluator.from_env(get_db_connection, plant_detector.classifier)
+
+# Versioned offline diagnosis bundles for the mobile app (see bundle_endpoints.py);
+# a new version is written only when the exported tables changed
+from logic.rule_bundle import RuleBundleStore, build_bundle
+bundle_store = RuleBundleStore(os.path.join(BASE_DIR, "bundles"))
+bundle_store.publish(build_bundle(plant_detector))
 
 # --- Disease Model Setup ---
 # --- Disease Model Setup ---
@@ -97,9 +136,11 @@ plant_detector = AutoPlantDiseaseDetector()
 
 # --- Soil Engine Setup ---
 from logic.soil_engine import SoilEngine
+from logic.crowd_prior import CrowdSoilPrior
 
 try:
-    soil_engine = SoilEngine()
+    # Crowd-sourced soil prior in the app database (soil_crowd_cells, see init_db)
+    soil_engine = SoilEngine(crowd=CrowdSoilPrior.from_env())
     print("Soil Engine initialized successfully.")
 except Exception as e:
     print(f"Error initializing Soil Engine: {e}")
@@ -208,8 +249,61 @@ def login(user: UserLogin):
 
 # --- Prediction Endpoints ---
 
+def save_disease_test(user_id, analysis_result):
+    """Record a disease analysis in test_results; returns (primary disease, confidence, plant)"""
+    # Extract keys for API response/DB
+    # The engine returns a rich structure. We default to:
+    # result='Healthy' or Disease Name
+    # confidence=float
+    
+    diseases = analysis_result.get("disease_diagnosis", [])
+    plant_type = analysis_result.get("plant_identification", {}).get("identified_as", "Unknown")
+    
+    primary_disease = "Unknown"
+    confidence = 0.0
+    diagnosis_source = 'rules'
+    
+    if diseases:
+         primary_disease = diseases[0]['name']
+         diagnosis_source = diseases[0].get('source') or 'rules'
+         # Confidence might be a string "High"/"Medium" or float depending on engine logic
+         # Engine logic: confidence: "High" or "Medium". 
+         # Let's map it to float for DB compatibility if needed, or keep string?
+         # Old DB expected confidence as REAL (float).
+         # Let's try to parse or just assign 0.9 for High, 0.5 for Medium
+         
+         conf_str = diseases[0].get('confidence', 'Low')
+         if diseases[0].get('source') == 'onnx': confidence = float(diseases[0]['score'])  # class probability
+         elif conf_str in CONFIDENCE_SCORES: confidence = CONFIDENCE_SCORES[conf_str]
+         elif isinstance(conf_str, (int, float)): confidence = float(conf_str)
+         else: confidence = 0.42
+    else:
+         primary_disease = "Healthy"
+         confidence = 0.48
+         
+    # Save to DB (Legacy table for compatibility with history)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO test_results (user_id, test_type, result, confidence, detection_id, diagnosis_source) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, 'disease', primary_disease, confidence, analysis_result.get("detection_id"), diagnosis_source)
+    )
+    conn.commit()
+    conn.close()
+
+    return primary_disease, confidence, plant_type
+
+
+def timed_analysis(img, image_name):
+    """analyze_image plus its own wall time in ms, measured inside the worker thread"""
+    started = time.perf_counter()
+    result = plant_detector.analyze_image(img, image_name=image_name)
+    return result, (time.perf_counter() - started) * 1000
+
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...), user_id: int = Form(...)):
+async def predict(background_tasks: BackgroundTasks, file: UploadFile = File(...), user_id: int = Form(...)):
     try:
         # Read image
         image_data = await file.read()
@@ -223,46 +317,19 @@ async def predict(file: UploadFile = File(...), user_id: int = Form(...)):
 
         # Analyze using the new engine
         # We pass the filename for logging purposes in the engine
-        analysis_result = plant_detector.analyze_image(img, image_name=file.filename)
-        
-        # Extract keys for API response/DB
-        # The engine returns a rich structure. We default to:
-        # result='Healthy' or Disease Name
-        # confidence=float
-        
-        diseases = analysis_result.get("disease_diagnosis", [])
-        plant_type = analysis_result.get("plant_identification", {}).get("identified_as", "Unknown")
+        # Runs in the threadpool so concurrent requests overlap (and can be micro-batched);
+        # primary_ms excludes time spent waiting for a free thread
+        analysis_result, primary_ms = await run_in_threadpool(timed_analysis, img, file.filename)
         
-        primary_disease = "Unknown"
-        confidence = 0.0
-        
-        if diseases:
-             primary_disease = diseases[0]['name']
-             # Confidence might be a string "High"/"Medium" or float depending on engine logic
-             # Engine logic: confidence: "High" or "Medium". 
-             # Let's map it to float for DB compatibility if needed, or keep string?
-             # Old DB expected confidence as REAL (float).
-             # Let's try to parse or just assign 0.9 for High, 0.5 for Medium
-             
-             conf_str = diseases[0].get('confidence', 'Low')
-             if conf_str == 'High': confidence = 0.50
-             elif conf_str == 'Medium': confidence = 0.45
-             elif conf_str == 'Low': confidence = 0.40
-             elif isinstance(conf_str, (int, float)): confidence = float(conf_str)
-             else: confidence = 0.42
-        else:
-             primary_disease = "Healthy"
-             confidence = 0.48
-             
-        # Save to DB (Legacy table for compatibility with history)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO test_results (user_id, test_type, result, confidence) VALUES (?, ?, ?, ?)",
-            (user_id, 'disease', primary_disease, confidence)
+        primary_disease, confidence, plant_type = save_disease_test(user_id, analysis_result)
+
+        # Keep the upload so the visual report can be rendered on demand later.
+        # Runs after the response is sent, so prediction latency is unaffected.
+        background_tasks.add_task(
+            report_store.save_source, analysis_result.get("detection_id"), image_data, file.filename
         )
-        conn.commit()
-        conn.close()
+        if shadow_evaluator:
+            shadow_evaluator.submit(image_data, analysis_result, primary_ms)
 
         # We return the simple response as before, OR the full rich response?
         # The frontend likely expects {disease, confidence}.
@@ -280,15 +347,76 @@ async def predict(file: UploadFile = File(...), user_id: int = Form(...)):
         print(f"Error in prediction: {e}")
         return {"error": str(e)}
 
+@app.get("/predict/features/schema")
+def predict_features_schema():
+    """Feature keys the app must send to /predict/features"""
+    return {
+        "schema_version": FEATURE_SCHEMA_VERSION,
+        "shape": list(SHAPE_FEATURE_KEYS),
+        "texture": list(TEXTURE_FEATURE_KEYS),
+        "color": list(COLOR_FEATURE_KEYS),
+        "required": plant_detector.rule_table.required_features
+    }
+
+@app.post("/predict/features")
+def predict_features(payload: FeaturePrediction):
+    """Diagnose from features extracted on the device: rules only, no image processing"""
+    if payload.schema_version != FEATURE_SCHEMA_VERSION:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported feature schema version {payload.schema_version} (server expects {FEATURE_SCHEMA_VERSION})"
+        )
+
+    errors = validate_features(payload.shape, payload.texture, payload.color,
+                               required=plant_detector.rule_table.required_features)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+    analysis_result = plant_detector.analyze_features(
+        payload.shape, payload.texture, payload.color, image_name=payload.image_name
+    )
+    primary_disease, confidence, plant_type = save_disease_test(payload.user_id, analysis_result)
+
+    return {
+        "disease": primary_disease,
+        "confidence": confidence,
+        "plant": plant_type,
+        "details": analysis_result
+    }
+
+def save_soil_result(user_id, result, lat, lon):
+    """test_results row for one soil decision; located results also feed the crowd-sourced soil prior"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO test_results (user_id, test_type, result, confidence) VALUES (?, ?, ?, ?)",
+        (user_id, 'soil', result['soil_type'], result['confidence'])
+    )
+    conn.commit()
+    conn.close()
+    try:
+        soil_engine.record_crowd_sample(lat, lon, result)
+    except Exception as e:  # the result is saved; the crowd prior is best effort
+        print(f"Error recording crowd soil sample: {e}")
+
 @app.post("/predict_soil")
 async def predict_soil(
     file: UploadFile = File(...), 
     user_id: int = Form(...),
     lat: float = Form(None),
-    lon: float = Form(None)
+    lon: float = Form(None),
+    patches: int = Form(0),
+    patch_layout: str = Form("grid"),
+    patch_seed: int = Form(None),
+    aggregate: str = Form("median")
 ):
     if not soil_engine:
         return {"error": "Soil Engine not initialized."}
+    
+    # patches > 0: score that many soil patches instead of the whole photo
+    sampling = None
+    if patches:
+        sampling = {"patches": patches, "layout": patch_layout, "seed": patch_seed, "aggregate": aggregate}
         
     try:
         # Read image
@@ -299,25 +427,73 @@ async def predict_soil(
         if img is None:
              return {"error": "Could not decode image"}
 
-        # Process using Soil Engine
-        result = soil_engine.process(img, lat, lon)
+        # Process using Soil Engine; image analysis, map/weather lookups and the
+        # DB writes all block, so they run in the threadpool
+        result = await run_in_threadpool(soil_engine.process, img, lat, lon, sampling)
+        await run_in_threadpool(save_soil_result, user_id, result, lat, lon)
         
-        soil_type = result['soil_type']
-        confidence = result['confidence']
+        return result
+    except Exception as e:
+        print(f"Error in soil prediction: {e}")
+        return {"error": str(e)}
 
-        # Save to DB
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO test_results (user_id, test_type, result, confidence) VALUES (?, ?, ?, ?)",
-            (user_id, 'soil', soil_type, confidence)
-        )
-        conn.commit()
+# Photos accepted by one /predict_soil/batch request
+SOIL_BATCH_MAX_IMAGES = int(os.environ.get('SOIL_BATCH_MAX_IMAGES', '20'))
+
+def save_soil_batch(user_id, result, filenames):
+    """One test_results row for the fused decision plus one soil_samples row per photo, in one transaction"""
+    conn = get_db_connection()
+    try:
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO test_results (user_id, test_type, result, confidence) VALUES (?, ?, ?, ?)",
+                (user_id, 'soil', result['soil_type'], result['confidence'])
+            )
+            test_result_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO soil_samples (test_result_id, sample_index, filename, top_type, "
+                "sandy_score, clay_score, loamy_score) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(test_result_id, sample['index'], filenames[sample['index']], sample['top_type'],
+                  sample['image_scores'].get('Sandy'), sample['image_scores'].get('Clay'),
+                  sample['image_scores'].get('Loamy'))
+                 for sample in result['samples']]
+            )
+    finally:
         conn.close()
+    return test_result_id
+
+@app.post("/predict_soil/batch")
+async def predict_soil_batch(
+    files: List[UploadFile] = File(...),
+    user_id: int = Form(...),
+    lat: float = Form(None),
+    lon: float = Form(None),
+    aggregate: str = Form("median"),
+    patches: int = Form(0)
+):
+    """Several photos of one field: fused image scores, one soil decision"""
+    if not soil_engine:
+        return {"error": "Soil Engine not initialized."}
+    if len(files) > SOIL_BATCH_MAX_IMAGES:
+        return {"error": f"At most {SOIL_BATCH_MAX_IMAGES} images per batch"}
+    
+    try:
+        images = []
+        for index, upload in enumerate(files):
+            img = cv2.imdecode(np.frombuffer(await upload.read(), np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                return {"error": f"Could not decode image {index} ({upload.filename})"}
+            images.append(img)
         
+        sampling = {"patches": patches} if patches else None
+        result = await run_in_threadpool(soil_engine.process_batch, images, lat, lon, aggregate, sampling)
+        result['test_result_id'] = await run_in_threadpool(
+            save_soil_batch, user_id, result, [upload.filename for upload in files])
+        # One field, one crowd sample (fused image scores)
+        await run_in_threadpool(soil_engine.record_crowd_sample, lat, lon, result)
         return result
     except Exception as e:
-        print(f"Error in soil prediction: {e}")
+        print(f"Error in batch soil prediction: {e}")
         return {"error": str(e)}
 
 @app.get("/recommend_fertilizer")
@@ -825,3 +1001,27 @@ def get_payment_status(order_id: int, user_id: int):
 # ===========================
 from community_endpoints import register_community_endpoints
 register_community_endpoints(app, get_db_connection, HTTPException)
+
+# ===========================
+# DETECTION ENDPOINTS
+# ===========================
+from detection_endpoints import register_detection_endpoints
+register_detection_endpoints(app, get_db_connection, HTTPException, plant_detector, report_store, similarity_index)
+
+# ===========================
+# SHADOW MODE ENDPOINTS
+# ===========================
+from shadow_endpoints import register_shadow_endpoints
+register_shadow_endpoints(app, get_db_connection, shadow_evaluator)
+
+# ===========================
+# OFFLINE BUNDLE ENDPOINTS
+# ===========================
+from bundle_endpoints import register_bundle_endpoints
+register_bundle_endpoints(app, HTTPException, plant_detector, bundle_store)
+
+# ===========================
+# SOIL MAP ENDPOINTS
+# ===========================
+from soil_endpoints import register_soil_endpoints
+register_soil_endpoints(app, HTTPException, soil_engine)
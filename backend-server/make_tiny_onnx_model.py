@@ -0,0 +1,83 @@
+"""
+Build a tiny, randomly initialized leaf classifier in ONNX format.
+
+It has the same interface as a real export (Nx3xHxW float32 input, softmax
+over the disease classes, labels stored in the model metadata), so the ONNX
+Runtime path, quantization and benchmarks can run without a trained model.
+
+Usage:
+    python make_tiny_onnx_model.py                       # models/tiny_leaf_classifier.onnx
+    python make_tiny_onnx_model.py --output /tmp/m.onnx --size 64
+"""
+import os
+import json
+import argparse
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper, TensorProto
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, "models", "tiny_leaf_classifier.onnx")
+
+DEFAULT_LABELS = [
+    {"name": "Healthy Plant", "type": "healthy"},
+    {"name": "Leaf Spot / Fungal Blight", "type": "fungal"},
+    {"name": "Bacterial Blight", "type": "bacterial"},
+    {"name": "Powdery Mildew", "type": "fungal"},
+    {"name": "Leaf Curl Virus", "type": "viral"},
+    {"name": "Nitrogen Deficiency", "type": "nutritional"},
+]
+
+
+def build_model(size=64, channels=16, labels=DEFAULT_LABELS, seed=0):
+    """Conv -> ReLU -> Conv -> ReLU -> global pool -> MatMul -> softmax"""
+    rng = np.random.default_rng(seed)
+    n_classes = len(labels)
+
+    def weight(name, shape):
+        return numpy_helper.from_array((rng.standard_normal(shape) * 0.1).astype(np.float32), name)
+
+    initializers = [
+        weight("conv1_w", (channels, 3, 3, 3)), weight("conv1_b", (channels,)),
+        weight("conv2_w", (channels, channels, 3, 3)), weight("conv2_b", (channels,)),
+        weight("fc_w", (channels, n_classes)), weight("fc_b", (n_classes,)),
+    ]
+    nodes = [
+        helper.make_node("Conv", ["input", "conv1_w", "conv1_b"], ["c1"], pads=[1, 1, 1, 1], strides=[2, 2]),
+        helper.make_node("Relu", ["c1"], ["r1"]),
+        helper.make_node("Conv", ["r1", "conv2_w", "conv2_b"], ["c2"], pads=[1, 1, 1, 1], strides=[2, 2]),
+        helper.make_node("Relu", ["c2"], ["r2"]),
+        helper.make_node("GlobalAveragePool", ["r2"], ["pooled"]),
+        helper.make_node("Flatten", ["pooled"], ["flat"]),
+        helper.make_node("MatMul", ["flat", "fc_w"], ["logits_mm"]),
+        helper.make_node("Add", ["logits_mm", "fc_b"], ["logits"]),
+        helper.make_node("Softmax", ["logits"], ["probabilities"], axis=1),
+    ]
+    graph = helper.make_graph(
+        nodes, "tiny_leaf_classifier",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", 3, size, size])],
+        [helper.make_tensor_value_info("probabilities", TensorProto.FLOAT, ["batch", n_classes])],
+        initializers
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8  # readable by older onnxruntime releases too
+    helper.set_model_props(model, {"labels": json.dumps(labels)})
+    onnx.checker.check_model(model)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a tiny ONNX leaf classifier for tests and benchmarks")
+    parser.add_argument("--output", type=str, default=DEFAULT_OUTPUT, help="Output .onnx path")
+    parser.add_argument("--size", type=int, default=64, help="Input image size")
+    parser.add_argument("--channels", type=int, default=16, help="Conv channels")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    onnx.save(build_model(args.size, args.channels), args.output)
+    print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
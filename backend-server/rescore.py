@@ -0,0 +1,172 @@
+"""
+Re-score historical plant detections with the current disease decision table.
+
+Reads the stored feature vectors (logic/feature_store.py), evaluates the rules
+for every past detection at once (logic/disease_rules.json), writes a CSV diff of
+the diagnoses that changed and, with --apply, updates `detections` and the
+linked `test_results` rows in batched transactions. Detections whose primary
+diagnosis came from the ONNX classifier are not rule decisions; they are
+counted separately and never overwritten.
+
+Usage:
+    python rescore.py                      # dry run, writes rescore_report.csv
+    python rescore.py --apply              # also update the database
+"""
+import os
+import csv
+import json
+import time
+import sqlite3
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from logic.feature_store import FeatureStore
+from logic.disease_rules import (
+    DecisionTable, DEFAULT_RULES_PATH, CONFIDENCE_LEVELS, CONFIDENCE_SCORES, diagnosis_dict, health_status
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, "database", "farmx.db")
+FEATURES_DIR = os.path.join(BASE_DIR, "database", "features")
+
+
+def load_current_diagnoses(conn, detection_ids):
+    """
+    Current primary_diagnosis and its source ('rules' / 'onnx') for the given
+    ids, aligned with detection_ids (None if missing). The source comes from
+    test_results.diagnosis_source, or for rows stored before that column from
+    the first entry of disease_details.
+    """
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(test_results)").fetchall()]
+    stored_source = ("(SELECT MAX(t.diagnosis_source) FROM test_results t "
+                     "WHERE t.detection_id = d.id AND t.test_type = 'disease')"
+                     if 'diagnosis_source' in columns else "NULL")
+    cursor = conn.execute(f"""
+        SELECT d.id, d.primary_diagnosis,
+               COALESCE({stored_source},
+                        CASE WHEN json_valid(d.disease_details) THEN json_extract(d.disease_details, '$[0].source') END,
+                        'rules')
+        FROM detections d ORDER BY d.id
+    """)
+    rows = cursor.fetchall()
+
+    db_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    db_names = np.array([r[1] or "" for r in rows], dtype=object)
+    db_sources = np.array([r[2] for r in rows], dtype=object)
+
+    aligned = np.full(len(detection_ids), None, dtype=object)
+    sources = np.full(len(detection_ids), None, dtype=object)
+    if len(db_ids):
+        pos = np.clip(np.searchsorted(db_ids, detection_ids), 0, len(db_ids) - 1)
+        found = db_ids[pos] == detection_ids
+        aligned[found] = db_names[pos[found]]
+        sources[found] = db_sources[pos[found]]
+    return aligned, sources
+
+
+def rescore(features_dir=FEATURES_DIR, db_path=DB_PATH, report_path="rescore_report.csv",
+            apply=False, batch_size=20000, rules_path=DEFAULT_RULES_PATH):
+    started = time.time()
+
+    rule_table = DecisionTable(rules_path)
+    print(f"Re-scoring with decision table v{rule_table.version}")
+
+    store = FeatureStore(features_dir)
+    detection_ids, columns = store.load_columns(rule_table.required_features)
+    print(f"Loaded {len(detection_ids)} feature vectors in {time.time() - started:.2f}s")
+
+    if len(detection_ids) == 0:
+        print("Nothing to re-score.")
+        return {'total': 0, 'changed': 0}
+
+    # A detection may have been appended twice (e.g. a retried request); keep the latest
+    detection_ids, first = np.unique(detection_ids[::-1], return_index=True)
+    last = len(next(iter(columns.values()))) - 1 - first
+    columns = {name: col[last] for name, col in columns.items()}
+
+    result = rule_table.evaluate_batch(columns)
+    new_names = np.array([o['name'] for o in result['outputs']], dtype=object)[result['diagnosis']]
+
+    conn = sqlite3.connect(db_path)
+    old_names, sources = load_current_diagnoses(conn, detection_ids)
+
+    known = old_names != None  # noqa: E711 (element-wise comparison)
+    classifier_led = known & (sources == 'onnx')
+    changed = known & ~classifier_led & (old_names != new_names)
+    changed_idx = np.flatnonzero(changed)
+
+    # --- Diff report ---
+    with open(report_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['detection_id', 'old_diagnosis', 'new_diagnosis', 'new_confidence', 'score'])
+        writer.writerows(zip(
+            detection_ids[changed_idx].tolist(),
+            old_names[changed_idx],
+            new_names[changed_idx],
+            np.array(CONFIDENCE_LEVELS, dtype=object)[result['confidence'][changed_idx]],
+            np.round(result['score'][changed_idx], 4).tolist()
+        ))
+
+    transitions = {
+        f"{old} -> {new}": count
+        for (old, new), count in Counter(zip(old_names[changed_idx], new_names[changed_idx])).items()
+    }
+
+    summary = {
+        'rules_version': result['version'],
+        'total': int(len(detection_ids)),
+        'missing_in_db': int((~known).sum()),
+        'classifier_decided': int(classifier_led.sum()),
+        'changed': int(len(changed_idx)),
+        'transitions': dict(sorted(transitions.items(), key=lambda x: x[1], reverse=True)),
+        'report': os.path.abspath(report_path)
+    }
+
+    # --- Optional write-back ---
+    if apply and len(changed_idx):
+        for start in range(0, len(changed_idx), batch_size):
+            batch = changed_idx[start:start + batch_size]
+            detection_rows = []
+            result_rows = []
+            for i in batch:
+                details = diagnosis_dict(result, i)
+                detection_id = int(detection_ids[i])
+                detection_rows.append((
+                    details['name'], json.dumps([details]), health_status(details['type']), detection_id
+                ))
+                result_rows.append((details['name'], CONFIDENCE_SCORES[details['confidence']], detection_id))
+
+            with conn:  # one transaction per batch
+                conn.executemany(
+                    "UPDATE detections SET primary_diagnosis = ?, disease_details = ?, health_status = ? WHERE id = ?",
+                    detection_rows
+                )
+                conn.executemany(
+                    "UPDATE test_results SET result = ?, confidence = ? WHERE detection_id = ? AND test_type = 'disease'",
+                    result_rows
+                )
+        summary['applied'] = True
+
+    conn.close()
+    summary['seconds'] = round(time.time() - started, 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score historical detections with the current disease rules")
+    parser.add_argument("--apply", action="store_true", help="Write the new diagnoses back to the database")
+    parser.add_argument("--report", type=str, default="rescore_report.csv", help="CSV diff report path")
+    parser.add_argument("--batch-size", type=int, default=20000, help="Rows per write transaction")
+    parser.add_argument("--db", type=str, default=DB_PATH, help="SQLite database path")
+    parser.add_argument("--features", type=str, default=FEATURES_DIR, help="Feature store directory")
+    parser.add_argument("--rules", type=str, default=DEFAULT_RULES_PATH, help="Decision table to evaluate")
+    args = parser.parse_args()
+
+    summary = rescore(args.features, args.db, args.report, args.apply, args.batch_size, args.rules)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# ===========================
+# SHADOW MODE ENDPOINTS
+# ===========================
+# Reports how a candidate pipeline configuration compares with the primary
+# one on sampled live traffic (see logic/shadow_mode.py). Registered from main.py
+
+
+def register_shadow_endpoints(app, get_db_connection, shadow_evaluator):
+    """Register shadow mode endpoints with the FastAPI app"""
+
+    @app.get("/shadow/stats")
+    def get_shadow_stats(candidate: str = None):
+        """Agreement rate and latency deltas per candidate, plus live worker counters"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        query = '''
+            SELECT candidate,
+                   candidate_rules_version,
+                   COUNT(*) AS samples,
+                   AVG(diagnosis_agrees) AS diagnosis_agreement,
+                   AVG(plant_agrees) AS plant_agreement,
+                   AVG(primary_ms) AS avg_primary_ms,
+                   AVG(candidate_ms) AS avg_candidate_ms,
+                   AVG(delta_ms) AS avg_delta_ms,
+                   MIN(created_at) AS first_sample,
+                   MAX(created_at) AS last_sample
+            FROM shadow_results
+        '''
+        params = ()
+        if candidate:
+            query += " WHERE candidate = ?"
+            params = (candidate,)
+        query += " GROUP BY candidate, candidate_rules_version ORDER BY last_sample DESC"
+        cursor.execute(query, params)
+        summaries = [dict(row) for row in cursor.fetchall()]
+
+        # Most frequent disagreements, to see what the candidate changes
+        cursor.execute(f'''
+            SELECT candidate, primary_diagnosis, candidate_diagnosis, COUNT(*) AS count
+            FROM shadow_results
+            WHERE diagnosis_agrees = 0 {"AND candidate = ?" if candidate else ""}
+            GROUP BY candidate, primary_diagnosis, candidate_diagnosis
+            ORDER BY count DESC
+            LIMIT 20
+        ''', params)
+        disagreements = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        for summary in summaries:
+            for key in ('diagnosis_agreement', 'plant_agreement'):
+                summary[key] = round(summary[key], 4) if summary[key] is not None else None
+            for key in ('avg_primary_ms', 'avg_candidate_ms', 'avg_delta_ms'):
+                summary[key] = round(summary[key], 1) if summary[key] is not None else None
+
+        return {
+            "enabled": shadow_evaluator is not None,
+            "worker": shadow_evaluator.stats() if shadow_evaluator else None,
+            "candidates": summaries,
+            "top_disagreements": disagreements
+        }
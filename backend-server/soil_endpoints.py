@@ -0,0 +1,226 @@
+# ===========================
+# SOIL MAP ENDPOINTS
+# ===========================
+# Land class / soil prior lookups straight from the precomputed map rasters
+# (see SoilEngine.lookup_class_batch), without a soil image. Registered from main.py
+
+import os
+import json
+import time
+
+import numpy as np
+
+
+# Points per NDJSON line
+BULK_CHUNK_POINTS = 10000
+
+BINARY_DTYPES = {'f8': '<f8', 'f4': '<f4'}
+
+
+def parse_points(body: bytes, content_type: str, dtype: str = 'f8'):
+    """
+    (lats, lons) float64 arrays from a bulk request body:
+    JSON {"lat": [...], "lon": [...]} or application/octet-stream with
+    little-endian (lat, lon) pairs of `dtype` ('f8' or 'f4'). JSON nulls become
+    NaN (an unmapped point). Raises ValueError on malformed input, TypeError
+    on JSON values that are not numbers (e.g. objects).
+    """
+    if content_type.startswith('application/octet-stream'):
+        if dtype not in BINARY_DTYPES:
+            raise ValueError("dtype must be 'f8' or 'f4'")
+        item_size = np.dtype(BINARY_DTYPES[dtype]).itemsize
+        if len(body) % (2 * item_size):
+            raise ValueError(f"Body length must be a multiple of {2 * item_size} bytes (lat, lon pairs)")
+        pairs = np.frombuffer(body, dtype=BINARY_DTYPES[dtype]).reshape(-1, 2).astype(np.float64)
+        return pairs[:, 0], pairs[:, 1]
+
+    payload = json.loads(body)
+    if not isinstance(payload, dict) or 'lat' not in payload or 'lon' not in payload:
+        raise ValueError("JSON body must be {\"lat\": [...], \"lon\": [...]}")
+    lats = np.asarray(payload['lat'], dtype=np.float64)
+    lons = np.asarray(payload['lon'], dtype=np.float64)
+    if lats.ndim != 1 or lats.shape != lons.shape:
+        raise ValueError("lat and lon must be flat arrays of the same length")
+    return lats, lons
+
+
+# Vertex limit for field boundaries
+MAX_POLYGON_VERTICES = 10000
+
+
+def parse_boundary(payload) -> np.ndarray:
+    """
+    (N, 2) float64 (lat, lon) vertices from {"boundary": [[lat, lon], ...]} or a
+    GeoJSON Polygon / Feature ([lon, lat] order, outer ring only).
+    Raises ValueError on malformed input.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Body must be a JSON object")
+    if payload.get('type') == 'Feature':
+        payload = payload.get('geometry') or {}
+
+    if 'boundary' in payload:
+        points = np.asarray(payload['boundary'], dtype=np.float64)
+    elif payload.get('type') == 'Polygon':
+        ring = np.asarray(payload['coordinates'][0], dtype=np.float64)
+        points = ring[:, ::-1] if ring.ndim == 2 else ring
+    else:
+        raise ValueError("Expected {\"boundary\": [[lat, lon], ...]} or a GeoJSON Polygon")
+
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError("Vertices must be [lat, lon] pairs")
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]  # closed ring
+    if not 3 <= len(points) <= MAX_POLYGON_VERTICES:
+        raise ValueError(f"A boundary needs 3 to {MAX_POLYGON_VERTICES} vertices")
+    if not np.isfinite(points).all():
+        raise ValueError("Vertices must be finite numbers")
+    return points
+
+
+def register_soil_endpoints(app, HTTPException, soil_engine):
+    """Register soil map endpoints with the FastAPI app"""
+
+    from fastapi import Request, Response
+    from fastapi.responses import StreamingResponse
+    from fastapi.concurrency import run_in_threadpool
+
+    max_points = int(os.environ.get('SOIL_BULK_MAX_POINTS', '5000000'))
+
+    def require_engine():
+        if soil_engine is None:
+            raise HTTPException(status_code=503, detail="Soil Engine not initialized.")
+
+    def require_crowd():
+        require_engine()
+        if soil_engine.crowd is None:
+            raise HTTPException(status_code=404, detail="Crowd soil prior is not enabled.")
+        return soil_engine.crowd
+
+    @app.get("/soil/land-classes")
+    def get_land_classes():
+        """Legend for class ids returned by the bulk lookup"""
+        require_engine()
+        return {"soil_types": list(soil_engine.SOIL_TYPES), "classes": soil_engine.land_class_legend()}
+
+    @app.get("/soil/layers")
+    def get_soil_layers():
+        """Ingested region layers and tile cache usage (TS.png itself is always served)"""
+        require_engine()
+        stats = soil_engine.layers.stats()
+        stats["home_region"] = soil_engine.HOME_REGION
+        return stats
+
+    @app.get("/soil/prior")
+    def get_soil_prior(lat: float, lon: float, scales: str = None):
+        """Land composition and soil prior around a point at field / village / mandal scale"""
+        require_engine()
+        names = [name.strip() for name in scales.split(",")] if scales else None
+        unknown = [name for name in names or [] if name not in soil_engine.PRIOR_SCALES_KM]
+        if unknown:
+            raise HTTPException(status_code=400,
+                                detail=f"Unknown scales {unknown}; choose from {list(soil_engine.PRIOR_SCALES_KM)}")
+        return {
+            "location": {"lat": lat, "lon": lon},
+            "scales_km": soil_engine.PRIOR_SCALES_KM,
+            "priors": soil_engine.get_multiscale_prior(lat, lon, names)
+        }
+
+    @app.get("/soil/crowd-prior")
+    def get_crowd_prior(lat: float, lon: float):
+        """Decayed soil-class counts of the grid cell around a point, from earlier located soil tests"""
+        crowd = require_crowd()
+        counts = crowd.counts(lat, lon)
+        return {
+            "location": {"lat": lat, "lon": lon},
+            "cell": list(crowd.cell(lat, lon)),
+            "cell_deg": crowd.cell_deg,
+            "counts": dict(zip(soil_engine.SOIL_TYPES, [round(float(c), 3) for c in counts]))
+                      if counts is not None else None,
+            "prior": crowd.get_prior(lat, lon)
+        }
+
+    @app.get("/soil/crowd-prior/export")
+    async def export_crowd_prior(format: str = "binary", since: float = None, min_samples: float = 0.0):
+        """
+        Every grid cell of the crowd prior (or those updated after `since`, a
+        unix time) for offline use. format=binary returns packed EXPORT_DTYPE
+        records (15 bytes per cell); format=json returns
+        [row, col, samples, sandy, clay, loamy] rows.
+        """
+        crowd = require_crowd()
+        if format not in ("binary", "json"):
+            raise HTTPException(status_code=400, detail="format must be 'binary' or 'json'")
+        as_of = time.time()
+        records = await run_in_threadpool(crowd.export, since, min_samples, as_of)
+
+        if format == "binary":
+            return Response(records.tobytes(), media_type="application/octet-stream", headers={
+                "X-Cell-Count": str(len(records)),
+                "X-Cell-Deg": str(crowd.cell_deg),
+                "X-As-Of": str(as_of),
+                "X-Soil-Types": ",".join(soil_engine.SOIL_TYPES),
+                "X-Record-Format": "row:<i4,col:<i4,samples:<f4,prior:3xu1(/255)"
+            })
+
+        priors = np.round(records['prior'] / 255.0, 3).tolist()
+        return {
+            "cell_deg": crowd.cell_deg,
+            "as_of": as_of,
+            "half_life_days": crowd.half_life_days,
+            "soil_types": list(soil_engine.SOIL_TYPES),
+            "cells": [[int(row), int(col), round(float(samples), 2)] + prior
+                      for row, col, samples, prior in zip(records['row'], records['col'], records['samples'], priors)]
+        }
+
+    @app.post("/soil/land-info/polygon")
+    async def polygon_land_info(request: Request):
+        """Area-weighted land-class mix and blended soil bias inside a field boundary"""
+        require_engine()
+        try:
+            boundary = parse_boundary(json.loads(await request.body()))
+        except (ValueError, TypeError, KeyError, IndexError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid boundary: {e}")
+
+        result = await run_in_threadpool(soil_engine.get_polygon_prior, boundary)
+        if result is None:
+            raise HTTPException(status_code=422, detail="Boundary does not overlap the soil map or an ingested region")
+        result["vertices"] = len(boundary)
+        return result
+
+    @app.post("/soil/land-info/bulk")
+    async def bulk_land_info(request: Request, format: str = "ndjson", dtype: str = "f8"):
+        """
+        Land class ids for many coordinates at once (no image needed).
+        format=ndjson streams a legend line, then {"offset", "class_id": [...]}
+        lines; format=binary returns one uint8 class id per point.
+        """
+        require_engine()
+        if format not in ("ndjson", "binary"):
+            raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'binary'")
+
+        body = await request.body()
+        try:
+            lats, lons = await run_in_threadpool(parse_points, body, request.headers.get("content-type", ""), dtype)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid coordinates: {e}")
+        if len(lats) > max_points:
+            raise HTTPException(status_code=413, detail=f"At most {max_points} points per request")
+
+        class_ids = await run_in_threadpool(soil_engine.lookup_class_batch, lats, lons)
+
+        if format == "binary":
+            return Response(class_ids.tobytes(), media_type="application/octet-stream",
+                            headers={"X-Point-Count": str(len(class_ids))})
+
+        def stream():
+            yield json.dumps({
+                "count": len(class_ids),
+                "soil_types": list(soil_engine.SOIL_TYPES),
+                "classes": soil_engine.land_class_legend()
+            }) + "\n"
+            for offset in range(0, len(class_ids), BULK_CHUNK_POINTS):
+                chunk = class_ids[offset:offset + BULK_CHUNK_POINTS].tolist()
+                yield json.dumps({"offset": offset, "class_id": chunk}, separators=(',', ':')) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,134 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+import database
+from logic.crowd_prior import CrowdSoilPrior, EXPORT_DTYPE
+from logic.soil_engine import SoilEngine
+
+DAY = 86400.0
+NOW = 1760000000.0
+
+
+class TestCrowdPrior(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.crowd = CrowdSoilPrior(self.app_db("farmx.db"), cell_deg=0.01, half_life_days=30, min_samples=3)
+
+    def app_db(self, name):
+        """A fresh app database with the tables init_db creates"""
+        path = os.path.join(self.tmp_dir, name)
+        with mock.patch.object(database, "DB_PATH", path):
+            database.init_db()
+        return path
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_counts_accumulate_per_cell(self):
+        for _ in range(4):
+            self.crowd.record(17.3851, 78.4867, {"Sandy": 0.2, "Clay": 0.6, "Loamy": 0.2}, timestamp=NOW)
+        self.crowd.record(17.3899, 78.4801, {"Sandy": 2.0, "Clay": 0.0, "Loamy": 0.0}, timestamp=NOW)  # same cell
+        self.crowd.record(17.3951, 78.4867, {"Sandy": 1.0, "Clay": 0.0, "Loamy": 0.0}, timestamp=NOW)  # next cell
+
+        np.testing.assert_allclose(self.crowd.counts(17.385, 78.485, now=NOW), [1.8, 2.4, 0.8])
+        prior = self.crowd.get_prior(17.385, 78.485, now=NOW)
+        self.assertEqual(prior["cell"], [1738, 7848])
+        self.assertEqual(prior["samples"], 5.0)
+        self.assertEqual(prior["soil_prior"], {"Sandy": 0.36, "Clay": 0.48, "Loamy": 0.16})
+        self.assertAlmostEqual(prior["weight"], CrowdSoilPrior.MAX_WEIGHT * 5 / 15, places=4)
+
+        self.assertIsNone(self.crowd.get_prior(17.395, 78.485, now=NOW))  # one sample < min_samples
+        self.assertIsNone(self.crowd.counts(18.0, 79.0, now=NOW))
+        self.assertFalse(self.crowd.record(None, 78.0, {"Sandy": 1.0}))
+
+    def test_time_decay(self):
+        for _ in range(8):
+            self.crowd.record(17.0, 78.0, {"Clay": 1.0}, timestamp=NOW - 60 * DAY)
+        self.crowd.record(17.0, 78.0, {"Sandy": 1.0}, timestamp=NOW)
+
+        counts = self.crowd.counts(17.0, 78.0, now=NOW)
+        np.testing.assert_allclose(counts, [1.0, 2.0, 0.0])  # two half-lives
+        np.testing.assert_allclose(self.crowd.counts(17.0, 78.0, now=NOW + 30 * DAY), counts / 2)
+        self.assertIsNone(self.crowd.get_prior(17.0, 78.0, now=NOW + 30 * DAY))
+
+        # A sample arriving late is decayed to the cell's newer update time
+        self.crowd.record(17.0, 78.0, {"Loamy": 1.0}, timestamp=NOW - 30 * DAY)
+        np.testing.assert_allclose(self.crowd.counts(17.0, 78.0, now=NOW), [1.0, 2.0, 0.5])
+
+    def test_short_half_life(self):
+        crowd = CrowdSoilPrior(self.app_db("short.db"), half_life_days=0.001, min_samples=1)
+        self.assertTrue(crowd.record(17.0, 78.0, {"Clay": 1.0}, timestamp=NOW - 365 * DAY))
+        self.assertTrue(crowd.record(17.0, 78.0, {"Sandy": 1.0}, timestamp=NOW))
+        np.testing.assert_allclose(crowd.counts(17.0, 78.0, now=NOW), [1.0, 0.0, 0.0])
+        self.assertEqual(crowd.get_prior(17.0, 78.0, now=NOW)["soil_prior"]["Sandy"], 1.0)
+        self.assertEqual(len(crowd.export(min_samples=0.5, now=NOW)), 1)
+        self.assertEqual(len(crowd.export(min_samples=0.5, now=NOW + DAY)), 0)  # decayed away
+
+    def test_invalid_points_not_recorded(self):
+        for lat, lon in ((float("nan"), 78.0), (17.0, float("inf")), (1e300, 78.0), (17.0, -181.0), (None, 78.0)):
+            self.assertFalse(self.crowd.record(lat, lon, {"Clay": 1.0}, timestamp=NOW), (lat, lon))
+            self.assertIsNone(self.crowd.counts(lat, lon, now=NOW))
+        self.assertFalse(self.crowd.record(17.0, 78.0, {"Clay": float("inf")}, timestamp=NOW))
+        self.assertEqual(len(self.crowd.export(now=NOW)), 0)
+
+    def test_export(self):
+        self.crowd.record(17.0, 78.0, {"Sandy": 0.5, "Clay": 0.5}, timestamp=NOW - 10 * DAY)
+        self.crowd.record(-12.345, 130.0, {"Loamy": 1.0}, timestamp=NOW)
+
+        records = self.crowd.export(now=NOW)
+        self.assertEqual(records.dtype, EXPORT_DTYPE)
+        self.assertEqual(EXPORT_DTYPE.itemsize, 15)
+        by_cell = {(int(r["row"]), int(r["col"])): r for r in records}
+        self.assertEqual(set(by_cell), {(1700, 7800), (-1235, 13000)})
+        self.assertEqual(by_cell[(1700, 7800)]["prior"].tolist(), [128, 128, 0])
+        self.assertAlmostEqual(float(by_cell[(1700, 7800)]["samples"]), 0.5 ** (10 / 30), places=5)
+
+        recent = self.crowd.export(since=NOW - DAY, now=NOW)
+        self.assertEqual(recent["row"].tolist(), [-1235])
+        self.assertEqual(len(self.crowd.export(min_samples=0.9, now=NOW)), 1)
+
+    def test_engine_without_crowd_prior(self):
+        engine = SoilEngine()
+        self.assertIsNone(engine.crowd)
+        self.assertFalse(engine.record_crowd_sample(17.0, 78.0, {"image_scores": {"Clay": 1.0}}))
+        result = engine.determine_soil_type({"Sandy": 0.2, "Clay": 0.6, "Loamy": 0.2},
+                                            {"soil_bias": {"Mixed": 1.0}}, {}, {"lat": 17.0, "lon": 78.0})
+        self.assertNotIn("crowd_prior", result)
+
+    def test_prior_in_soil_decision(self):
+        engine = SoilEngine(crowd=self.crowd)
+        scores = {"Sandy": 0.34, "Clay": 0.33, "Loamy": 0.33}
+        map_data = {"soil_bias": {"Mixed": 1.0}, "land_class": "Unknown"}
+        location = {"lat": 17.001, "lon": 78.001}
+        without = engine.determine_soil_type(scores, map_data, {}, location)
+        self.assertNotIn("crowd_prior", without)
+
+        for _ in range(10):
+            engine.record_crowd_sample(17.0, 78.0, {"image_scores": {"Sandy": 0.1, "Clay": 0.8, "Loamy": 0.1}})
+        result = engine.determine_soil_type(scores, map_data, {}, location)
+        self.assertEqual(result["soil_type"], "Clay")
+        self.assertGreater(result["final_scores"]["Clay"], without["final_scores"]["Clay"])
+        self.assertTrue(any("Earlier soil tests nearby lean Clay" in reason for reason in result["reason"]))
+
+        units = [engine.crowd.get_prior(17.001, 78.001), None]
+        batch = engine.determine_soil_type_batch(
+            [[0.34, 0.33, 0.33]] * 2, engine.map_bias_matrix([{"Mixed": 1.0}] * 2),
+            crowd_prior=engine.crowd_prior_matrix(units), crowd_units=units)
+        for soil_type, score in zip(SoilEngine.SOIL_TYPES, batch.final_scores[0]):
+            self.assertAlmostEqual(score, result["final_scores"][soil_type], places=3)
+        self.assertEqual(batch.reasons(0), result["reason"])
+        self.assertAlmostEqual(batch.final_scores[1, 0], without["final_scores"]["Sandy"], places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
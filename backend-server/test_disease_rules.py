@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.disease_rules import DecisionTable, DEFAULT_RULES_PATH
+from logic.plant_detection_engine import AutoPlantDiseaseDetector
+from logic.feature_store import FeatureStore, FEATURE_KEYS, FEATURE_INDEX
+from rescore import rescore
+
+
+def reference_diagnosis(f):
+    """The hand-written gating detect_diseases used before the decision table: (name, confidence, score)"""
+    red, spot, curl = f['red_index'], f['spot_index'], f['curl_index']
+    yellow, white, water = f['yellowing'], f['white_mildew'], f['water_soaked']
+
+    if red > 0.15 and spot < 0.1 and curl < 0.25:
+        return 'Nutrient Deficiency (Phos/Potassium)', 'High', red
+    if curl > 0.25 and (0.4 if yellow > 0.1 else 0) + (0.3 if f['edge_density'] > 0.2 else 0) > 0.5:
+        return 'Leaf Curl Virus', 'High' if curl > 0.4 else 'Medium', curl
+    if white > 0.15:
+        return 'Powdery Mildew', 'High', white
+    if spot > 0.15 or water > 0.15:
+        name = 'Bacterial Blight' if water > spot else 'Leaf Spot / Fungal Blight'
+        return name, 'High' if spot > 0.25 else 'Medium', max(spot, water)
+    if yellow > 0.25 and curl < 0.2:
+        return 'Nitrogen Deficiency', 'Medium', yellow
+    if f['healthy_green'] > 0.6:
+        return 'Healthy Plant', 'High', 0.9
+    return 'Early Stage Stress / Unclear', 'Low', 0.3
+
+
+def random_features(rng, features, n):
+    # Values around the rule thresholds so every branch is exercised
+    columns = {key: rng.uniform(0, 0.45, n) for key in features}
+    columns['healthy_green'] = rng.uniform(0, 1, n)
+    return columns
+
+
+class TestDiseaseRules(unittest.TestCase):
+
+    def setUp(self):
+        self.table = DecisionTable()
+
+    def test_table_matches_reference_rules(self):
+        rng = np.random.default_rng(42)
+        columns = random_features(rng, self.table.required_features, 2000)
+        result = self.table.evaluate_batch(columns)
+        names = [o['name'] for o in result['outputs']]
+
+        seen = set()
+        for i in range(2000):
+            row = {key: float(columns[key][i]) for key in columns}
+            name, confidence, score = reference_diagnosis(row)
+            self.assertEqual(names[result['diagnosis'][i]], name)
+            self.assertAlmostEqual(float(result['score'][i]), score)
+
+            single = self.table.evaluate_one(row, row, row)[0]
+            self.assertEqual(single['name'], name)
+            self.assertEqual(single['confidence'], confidence)
+            seen.add(name)
+
+        self.assertEqual(len(seen), len(names))
+
+    def test_analyze_features_runs_rules_only(self):
+        detector = AutoPlantDiseaseDetector(persist=False)
+        color = {'white_mildew': 0.3, 'healthy_green': 0.7}
+        result = detector.analyze_features({'curl_index': 0.1}, {'edge_density': 0.1}, color)
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['source'], 'features')
+        self.assertEqual(result['disease_diagnosis'][0]['name'], 'Powdery Mildew')
+        self.assertEqual(result['rules_version'], self.table.version)
+        self.assertIsNone(result['detection_id'])
+
+    def test_hot_reload_keeps_last_good_table(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "rules.json")
+            with open(DEFAULT_RULES_PATH) as f:
+                spec = json.load(f)
+            with open(path, 'w') as f:
+                json.dump(spec, f)
+
+            table = DecisionTable(path)
+            table.RELOAD_CHECK_INTERVAL = 0
+            table._next_check = 0.0
+            mildew = {'white_mildew': 0.2, 'healthy_green': 0.9}
+            self.assertEqual(table.evaluate_one(mildew, {}, {})[0]['name'], 'Powdery Mildew')
+
+            # Raise the mildew threshold: the next evaluation picks up the new version
+            for rule in spec['rules']:
+                if rule['id'] == 'powdery_mildew':
+                    rule['when'] = ['white_mildew', '>', 0.3]
+            spec['version'] = 'test-2'
+            with open(path, 'w') as f:
+                json.dump(spec, f)
+            os.utime(path, (time.time() + 5, time.time() + 5))
+
+            self.assertEqual(table.evaluate_one(mildew, {}, {})[0]['name'], 'Healthy Plant')
+            self.assertEqual(table.version, 'test-2')
+
+            # A broken edit is ignored
+            with open(path, 'w') as f:
+                f.write('{"version": "broken", "rules": [')
+            os.utime(path, (time.time() + 10, time.time() + 10))
+            self.assertEqual(table.version, 'test-2')
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def test_default_rule_required(self):
+        with self.assertRaises(ValueError):
+            DecisionTable.from_spec({'version': 'x', 'rules': [
+                {'id': 'a', 'priority': 1, 'when': ['spot_index', '>', 0.1],
+                 'output': {'name': 'A', 'type': 'fungal'}}
+            ]})
+
+
+class TestRescore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "farmx.db")
+        self.features_dir = os.path.join(self.tmp_dir, "features")
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE detections (id INTEGER PRIMARY KEY, primary_diagnosis TEXT, "
+                     "disease_details TEXT, health_status TEXT)")
+        conn.execute("CREATE TABLE test_results (id INTEGER PRIMARY KEY, test_type TEXT, result TEXT, "
+                     "confidence REAL, detection_id INTEGER)")
+
+        store = FeatureStore(self.features_dir)
+        healthy = np.zeros(len(FEATURE_KEYS), dtype=np.float32)
+        healthy[FEATURE_INDEX['healthy_green']] = 0.9
+        mildew = healthy.copy()
+        mildew[FEATURE_INDEX['white_mildew']] = 0.3
+
+        # Row 1 is consistent with the rules, row 2 was stored with an outdated diagnosis
+        for detection_id, vector, stored in ((1, healthy, 'Healthy Plant'), (2, mildew, 'Healthy Plant')):
+            store.append(detection_id, vector)
+            conn.execute("INSERT INTO detections VALUES (?, ?, '[]', 'Healthy')", (detection_id, stored))
+            conn.execute("INSERT INTO test_results (test_type, result, confidence, detection_id) "
+                         "VALUES ('disease', ?, 0.5, ?)", (stored, detection_id))
+        store.flush()
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_dry_run_and_apply(self):
+        report = os.path.join(self.tmp_dir, "report.csv")
+        summary = rescore(self.features_dir, self.db_path, report)
+        self.assertEqual(summary['total'], 2)
+        self.assertEqual(summary['changed'], 1)
+        self.assertIn('Healthy Plant -> Powdery Mildew', summary['transitions'])
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT primary_diagnosis FROM detections WHERE id = 2").fetchone()[0],
+                         'Healthy Plant')
+
+        rescore(self.features_dir, self.db_path, report, apply=True)
+        self.assertEqual(conn.execute("SELECT primary_diagnosis, health_status FROM detections WHERE id = 2").fetchone(),
+                         ('Powdery Mildew', 'Diseased'))
+        self.assertEqual(conn.execute("SELECT result FROM test_results WHERE detection_id = 2").fetchone()[0],
+                         'Powdery Mildew')
+        conn.close()
+
+    def test_classifier_diagnoses_are_left_alone(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("ALTER TABLE test_results ADD COLUMN diagnosis_source TEXT")
+        conn.execute("UPDATE test_results SET diagnosis_source = 'onnx' WHERE detection_id = 2")
+        conn.commit()
+
+        report = os.path.join(self.tmp_dir, "report.csv")
+        summary = rescore(self.features_dir, self.db_path, report, apply=True)
+        self.assertEqual(summary['changed'], 0)
+        self.assertEqual(summary['classifier_decided'], 1)
+        self.assertEqual(conn.execute("SELECT primary_diagnosis FROM detections WHERE id = 2").fetchone()[0],
+                         'Healthy Plant')
+
+        # Rows stored before diagnosis_source existed: the first stored diagnosis says who decided
+        conn.execute("UPDATE test_results SET diagnosis_source = NULL")
+        conn.execute("UPDATE detections SET disease_details = ? WHERE id = 2",
+                     ('[{"name": "Healthy Plant", "source": "onnx"}]',))
+        conn.commit()
+        summary = rescore(self.features_dir, self.db_path, report)
+        self.assertEqual((summary['changed'], summary['classifier_decided']), (0, 1))
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
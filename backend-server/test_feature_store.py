@@ -0,0 +1,94 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.feature_store import (
+    FeatureStore, FEATURE_KEYS, FEATURE_INDEX, features_to_vector, vector_to_features, validate_features
+)
+
+
+class TestFeatureStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_vector_roundtrip(self):
+        shape = {'aspect_ratio': 2.5, 'curl_index': 0.3}
+        texture = {'edge_density': 0.12}
+        color = {'red_index': 0.2, 'spot_index': 0.05}
+
+        vector = features_to_vector(shape, texture, color)
+        self.assertEqual(vector.shape, (len(FEATURE_KEYS),))
+        self.assertEqual(vector.dtype, np.float32)
+
+        shape2, texture2, color2 = vector_to_features(vector)
+        self.assertAlmostEqual(shape2['aspect_ratio'], 2.5, places=5)
+        self.assertAlmostEqual(color2['red_index'], 0.2, places=5)
+        self.assertEqual(texture2['contrast'], 0.0)  # missing keys default to 0
+
+    def test_append_and_bulk_read_across_chunks(self):
+        store = FeatureStore(self.tmp_dir, chunk_rows=4)
+        for detection_id in range(1, 11):
+            vector = np.full(len(FEATURE_KEYS), detection_id, dtype=np.float32)
+            store.append(detection_id, vector)
+        store.flush()
+
+        # A fresh instance (e.g. an offline job) sees every row
+        reader = FeatureStore(self.tmp_dir, chunk_rows=4)
+        ids, matrix = reader.load()
+        self.assertEqual(list(ids), list(range(1, 11)))
+        self.assertEqual(matrix.shape, (10, len(FEATURE_KEYS)))
+        self.assertTrue(np.all(matrix[:, 0] == ids))
+        self.assertEqual(len(reader), 10)
+
+        ids, columns = reader.load_columns(['red_index'])
+        self.assertEqual(columns['red_index'][4], 5.0)
+
+        self.assertEqual(reader.get(7)[FEATURE_INDEX['spot_index']], 7.0)
+        self.assertIsNone(reader.get(999))
+
+    def test_appends_resume_in_partial_chunk(self):
+        store = FeatureStore(self.tmp_dir, chunk_rows=8)
+        store.append(1, np.ones(len(FEATURE_KEYS), dtype=np.float32))
+        store.flush()
+
+        store2 = FeatureStore(self.tmp_dir, chunk_rows=8)
+        store2.append(2, np.ones(len(FEATURE_KEYS), dtype=np.float32))
+        ids, _ = store2.load()
+        self.assertEqual(list(ids), [1, 2])
+
+    def test_reopen_keeps_stored_chunk_size(self):
+        store = FeatureStore(self.tmp_dir, chunk_rows=4)
+        for detection_id in range(1, 5):
+            store.append(detection_id, np.ones(len(FEATURE_KEYS), dtype=np.float32))
+        store.flush()
+
+        store2 = FeatureStore(self.tmp_dir)  # default chunk size
+        self.assertEqual(store2.chunk_rows, 4)
+        store2.append(5, np.ones(len(FEATURE_KEYS), dtype=np.float32))
+        ids, _ = store2.load()
+        self.assertEqual(list(ids), [1, 2, 3, 4, 5])
+        self.assertEqual(store2._chunk_numbers(), [0, 1])
+
+    def test_validate_external_payload(self):
+        self.assertEqual(validate_features({'curl_index': 0.1}, {}, {'red_index': 0.2}, required=['red_index']), [])
+
+        errors = validate_features({'leaf_area': 1.0}, {}, {'red_index': float('nan')},
+                                   required=['red_index', 'spot_index'])
+        self.assertEqual(len(errors), 3)
+        self.assertIn('unknown shape features: leaf_area', errors)
+        self.assertIn('missing required features: spot_index', errors)
+
+
+if __name__ == "__main__":
+    unittest.main()
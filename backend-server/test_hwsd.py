@@ -0,0 +1,108 @@
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.hwsd import HwsdSoilDatabase, NODATA_SMU, aggregate_units, read_bil_window, write_store
+from logic.soil_engine import SoilEngine
+
+LAYER_COLUMNS = ["HWSD2_SMU_ID", "SEQUENCE", "SHARE", "LAYER", "TEXTURE_USDA", "PH_WATER", "ORG_CARBON",
+                 "SAND", "SILT", "CLAY"]
+
+
+class TestHwsd(unittest.TestCase):
+    # 1-degree cells over 70..90 E, 10..30 N
+    HDR = "BYTEORDER I\nLAYOUT BIL\nNROWS 20\nNCOLS 20\nNBANDS 1\nNBITS 16\n" \
+          "ULXMAP 70.5\nULYMAP 29.5\nXDIM 1.0\nYDIM 1.0\nNODATA 65535\n"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        grid = np.full((20, 20), 65535, dtype='<u2')
+        grid[10:20, 5:15] = 101  # 10..20 N, 75..85 E
+        grid[10:20, 10:15] = 202  # 80..85 E
+        grid.tofile(os.path.join(self.tmp_dir, "HWSD2.bil"))
+        with open(os.path.join(self.tmp_dir, "HWSD2.hdr"), "w") as f:
+            f.write(self.HDR)
+
+        self.layers_csv = os.path.join(self.tmp_dir, "HWSD2_LAYERS.csv")
+        rows = [
+            [101, 1, 60, "D1", 3, 7.8, 0.6, 30, 20, 50],   # clay
+            [101, 2, 40, "D1", 9, 6.8, 1.1, 40, 40, 20],   # loam
+            [101, 1, 60, "D2", 13, 5.0, 0.1, 90, 5, 5],    # subsoil, ignored
+            [202, 1, 100, "D1", 12, 6.0, -9, 85, 10, 5],   # loamy sand, OC missing
+            [303, 1, 100, "D1", 9, 7.0, 1.0, 40, 40, 20],  # not in the window
+        ]
+        with open(self.layers_csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(LAYER_COLUMNS)
+            writer.writerows(rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def ingest(self, bounds):
+        raster, snapped = read_bil_window(os.path.join(self.tmp_dir, "HWSD2.bil"), bounds)
+        smu_ids = set(np.unique(raster).tolist()) - {NODATA_SMU}
+        with open(self.layers_csv, newline="") as f:
+            units = aggregate_units(csv.DictReader(f), smu_ids)
+        store_dir = os.path.join(self.tmp_dir, "hwsd")
+        write_store(store_dir, raster, snapped, units, source="test")
+        return HwsdSoilDatabase(store_dir), raster, snapped
+
+    def test_window_and_attributes(self):
+        db, raster, snapped = self.ingest({"lat_top": 22.5, "lat_bottom": 8.0, "lon_left": 74.2, "lon_right": 86.0})
+        self.assertEqual(snapped, {"lat_top": 23.0, "lat_bottom": 10.0, "lon_left": 74.0, "lon_right": 86.0})
+        self.assertEqual(raster.dtype, np.uint32)
+        self.assertEqual(raster.shape, (13, 12))
+        self.assertEqual(db.header["units"], 2)
+
+        self.assertEqual(db.lookup_unit(15.5, 77.5), 101)
+        self.assertEqual(db.lookup_unit(15.5, 82.5), 202)
+        self.assertEqual(db.lookup_unit(21.5, 77.5), NODATA_SMU)  # NODATA cell
+        self.assertEqual(db.lookup_unit(40.0, 77.5), NODATA_SMU)  # outside the store
+        self.assertIsNone(db.get_prior(21.5, 77.5))
+
+        unit = db.get_prior(15.5, 77.5)
+        self.assertEqual(unit["texture_class"], "clay")
+        self.assertEqual(unit["components"], 2)
+        self.assertAlmostEqual(unit["ph"], 0.6 * 7.8 + 0.4 * 6.8, places=2)
+        self.assertEqual(unit["soil_prior"], {"Sandy": 0.0, "Clay": 0.6, "Loamy": 0.4})
+        self.assertIs(db.unit_attributes(101), unit)  # cached
+
+        sand = db.get_prior(15.5, 82.5)
+        self.assertIsNone(sand["organic_carbon"])
+        self.assertEqual(sand["soil_prior"]["Sandy"], 1.0)
+
+    def test_missing_store(self):
+        db = HwsdSoilDatabase(os.path.join(self.tmp_dir, "missing"))
+        self.assertFalse(db.available)
+        self.assertIsNone(db.get_prior(17.0, 78.0))
+
+    def test_prior_shifts_soil_decision(self):
+        db, _, _ = self.ingest({"lat_top": 30.0, "lat_bottom": 10.0, "lon_left": 70.0, "lon_right": 90.0})
+        engine = SoilEngine()
+        scores = {"Sandy": 0.34, "Clay": 0.33, "Loamy": 0.33}
+        map_data = {"soil_bias": {"Mixed": 1.0}, "land_class": "Unknown"}
+        location = {"lat": 15.5, "lon": 82.5}
+
+        engine.hwsd = HwsdSoilDatabase(os.path.join(self.tmp_dir, "missing"))
+        without = engine.determine_soil_type(scores, map_data, {}, location)
+        self.assertNotIn("hwsd", without)
+
+        engine.hwsd = db
+        result = engine.determine_soil_type(scores, map_data, {}, location)
+        self.assertEqual(result["hwsd"]["smu_id"], 202)
+        self.assertGreater(result["final_scores"]["Sandy"], without["final_scores"]["Sandy"])
+        self.assertAlmostEqual(sum(result["final_scores"].values()), 1.0, places=2)
+        self.assertTrue(any("HWSD2" in reason for reason in result["reason"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
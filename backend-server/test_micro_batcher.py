@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.micro_batcher import MicroBatcher, BatchedClassifier
+from logic.onnx_classifier import OnnxClassifier, ort
+
+try:
+    import onnx
+    from make_tiny_onnx_model import build_model
+except ImportError:
+    onnx = None
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_concurrent_calls_share_batches(self):
+        seen = []
+
+        def double(items):
+            seen.append(len(items))
+            time.sleep(0.01)
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=20)
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            results = list(pool.map(batcher, range(32)))
+
+        self.assertEqual(results, [i * 2 for i in range(32)])  # each caller gets its own result
+        self.assertLess(len(seen), 32)
+        self.assertLessEqual(max(seen), 8)
+
+        metrics = batcher.metrics()
+        self.assertEqual(metrics['requests'], 32)
+        self.assertEqual(sum(metrics['batch_size_histogram'].values()), len(seen))
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertIsNotNone(metrics['added_wait_ms']['p95'])
+
+    def test_single_call_waits_at_most_max_wait(self):
+        batcher = MicroBatcher(lambda items: items, max_batch_size=8, max_wait_ms=5)
+        started = time.perf_counter()
+        self.assertEqual(batcher("leaf"), "leaf")
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertLess(batcher.metrics()['added_wait_ms']['max'], 100)
+
+    def test_errors_reach_every_caller(self):
+        def broken(items):
+            raise ValueError("bad batch")
+
+        batcher = MicroBatcher(broken, max_batch_size=4, max_wait_ms=5)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=2)
+        self.assertGreaterEqual(batcher.metrics()['failed_batches'], 1)
+
+    def test_async_callers(self):
+        batcher = MicroBatcher(lambda items: [i + 1 for i in items], max_batch_size=16, max_wait_ms=10)
+
+        async def run():
+            return await asyncio.gather(*(asyncio.wrap_future(batcher.submit(i)) for i in range(10)))
+
+        self.assertEqual(asyncio.run(run()), list(range(1, 11)))
+
+
+@unittest.skipIf(ort is None or onnx is None, "onnxruntime / onnx not installed")
+class TestBatchedClassifier(unittest.TestCase):
+
+    def test_batched_matches_single(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            model_path = os.path.join(tmp_dir, "tiny.onnx")
+            onnx.save(build_model(size=32), model_path)
+            classifier = OnnxClassifier(model_path, quantize=False, intra_op_threads=1)
+            batched = BatchedClassifier(classifier, max_batch_size=4, max_wait_ms=10)
+
+            leaf = cv2.imread(os.path.join("logic", "TS.png"))
+            images = [leaf, cv2.flip(leaf, 1), cv2.flip(leaf, 0), leaf[:300, :300]] * 2
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(batched.classify, images))
+
+            for image, result in zip(images, results):
+                expected = classifier.classify(image)
+                self.assertEqual(result['name'], expected['name'])
+                self.assertAlmostEqual(result['score'], expected['score'], places=3)
+            self.assertEqual(batched.metrics()['requests'], 8)
+            self.assertIn('batching', batched.info())
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
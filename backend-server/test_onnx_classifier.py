@@ -0,0 +1,108 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.onnx_classifier import OnnxClassifier, ort
+from logic.plant_detection_engine import AutoPlantDiseaseDetector
+
+try:
+    import onnx
+    from make_tiny_onnx_model import build_model, DEFAULT_LABELS
+except ImportError:
+    onnx = None
+
+
+def synthetic_leaf():
+    """Green leaf with a few brown lesions on a pale background"""
+    img = np.full((320, 320, 3), (200, 205, 210), dtype=np.uint8)
+    cv2.ellipse(img, (160, 160), (120, 70), 30, 0, 360, (40, 140, 50), -1)
+    for center in [(120, 140), (190, 170), (150, 200)]:
+        cv2.circle(img, center, 9, (30, 60, 110), -1)
+    return img
+
+
+class FailingClassifier:
+    """Stands in for a model whose session errors on every call"""
+
+    min_confidence = 0.6
+
+    def __init__(self, mode):
+        self.mode = mode
+
+    def classify(self, image):
+        raise RuntimeError("session failed")
+
+    def info(self):
+        return {'mode': self.mode}
+
+
+class TestClassifierFallback(unittest.TestCase):
+
+    def test_rules_used_when_classifier_fails(self):
+        leaf = synthetic_leaf()
+        expected = AutoPlantDiseaseDetector(persist=False).analyze_image(leaf, image_name="leaf.png")
+        self.assertEqual(expected["status"], "success")
+
+        for mode in ('both', 'onnx'):
+            detector = AutoPlantDiseaseDetector(persist=False, classifier=FailingClassifier(mode))
+            with self.assertLogs(level='ERROR'):
+                result = detector.analyze_image(leaf, image_name="leaf.png")
+            self.assertEqual(result["status"], "success")
+            self.assertEqual(result["disease_diagnosis"], expected["disease_diagnosis"])
+
+
+@unittest.skipIf(ort is None or onnx is None, "onnxruntime / onnx not installed")
+class TestOnnxClassifier(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.tmp_dir, "tiny.onnx")
+        onnx.save(build_model(size=32), self.model_path)
+        self.leaf = synthetic_leaf()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_quantized_model_matches_float(self):
+        float_model = OnnxClassifier(self.model_path, quantize=False, intra_op_threads=1)
+        int8_model = OnnxClassifier(self.model_path, quantize=True, intra_op_threads=1)
+
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, "tiny.int8.onnx")))
+        self.assertEqual(int8_model.input_size, (32, 32))
+        self.assertEqual([l['name'] for l in int8_model.labels], [l['name'] for l in DEFAULT_LABELS])
+
+        p_float = float_model.predict_proba(self.leaf)
+        p_int8 = int8_model.predict_proba(self.leaf)
+        self.assertAlmostEqual(p_int8.sum(), 1.0, places=4)
+        self.assertLess(np.abs(p_float - p_int8).max(), 0.05)
+        self.assertGreater(int8_model.warmup(runs=2), 0)
+
+    def test_engine_modes(self):
+        classifier = OnnxClassifier(self.model_path, quantize=False, mode='both', min_confidence=1.1)
+        detector = object.__new__(AutoPlantDiseaseDetector)  # apply_classifier only needs the classifier
+        detector.classifier = classifier
+        contour = np.array([[[10, 10]], [[200, 10]], [[200, 200]], [[10, 200]]], dtype=np.int32)
+        rules = [{'name': 'Powdery Mildew', 'type': 'fungal', 'confidence': 'High', 'score': 0.3}]
+
+        # 'both' below min_confidence: rules stay first, classifier result is appended
+        diseases = detector.apply_classifier(self.leaf, contour, rules)
+        self.assertEqual(diseases[0]['name'], 'Powdery Mildew')
+        self.assertEqual(diseases[1]['source'], 'onnx')
+
+        classifier.mode = 'onnx'
+        diseases = detector.apply_classifier(self.leaf, contour, [])
+        self.assertEqual(len(diseases), 1)
+        self.assertEqual(diseases[0]['source'], 'onnx')
+        self.assertIn(diseases[0]['name'], [l['name'] for l in DEFAULT_LABELS])
+
+
+if __name__ == "__main__":
+    unittest.main()
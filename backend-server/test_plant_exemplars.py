@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.plant_exemplars import PlantExemplarIndex, PLANT_FEATURE_KEYS, plant_feature_vector
+
+
+def labeled_vectors(rng, n_classes, per_class):
+    centers = rng.uniform(0, 10, (n_classes, len(PLANT_FEATURE_KEYS))).astype(np.float32)
+    labels = np.repeat(np.arange(n_classes), per_class)
+    vectors = centers[labels] + rng.normal(0, 0.3, (len(labels), len(PLANT_FEATURE_KEYS))).astype(np.float32)
+    return vectors, [f"plant_{i:03d}" for i in labels], centers
+
+
+class TestPlantExemplars(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_classify_and_roundtrip(self):
+        rng = np.random.default_rng(0)
+        vectors, names, centers = labeled_vectors(rng, 12, 40)
+        index = PlantExemplarIndex.build(vectors, names, k=5)
+
+        plant, confidence, candidates = index.classify_vector(centers[3])
+        self.assertEqual(plant, "plant_003")
+        self.assertGreater(confidence, 0.9)
+        self.assertEqual(next(iter(candidates)), "plant_003")
+
+        path = os.path.join(self.tmp_dir, "exemplars.npz")
+        index.save(path)
+        loaded = PlantExemplarIndex.load(path)
+        self.assertEqual(loaded.classes, index.classes)
+        self.assertEqual(loaded.k, 5)
+        self.assertEqual(loaded.classify_vector(centers[7])[0], "plant_007")
+
+        # Dict form used by identify_plant
+        shape = {key: float(centers[7][i]) for i, key in enumerate(PLANT_FEATURE_KEYS)}
+        self.assertEqual(loaded.classify(shape, {})[0], "plant_007")
+        np.testing.assert_allclose(plant_feature_vector(shape, {}), centers[7], rtol=1e-6)
+
+    def test_batch_matches_single(self):
+        rng = np.random.default_rng(1)
+        vectors, names, _ = labeled_vectors(rng, 20, 30)
+        index = PlantExemplarIndex.build(vectors, names)
+        queries = vectors[rng.choice(len(vectors), 50)] + rng.normal(0, 0.5, (50, len(PLANT_FEATURE_KEYS)))
+
+        plants, confidence = index.classify_batch(queries)
+        for query, plant, conf in zip(queries, plants, confidence):
+            single_plant, single_conf, _ = index.classify_vector(query)
+            self.assertEqual(plant, single_plant)
+            self.assertAlmostEqual(float(conf), single_conf, places=5)
+
+    def test_query_latency(self):
+        # 120 crops x 250 exemplars each
+        rng = np.random.default_rng(2)
+        vectors, names, centers = labeled_vectors(rng, 120, 250)
+        index = PlantExemplarIndex.build(vectors, names)
+
+        index.classify_vector(centers[0])
+        started = time.perf_counter()
+        for i in range(200):
+            index.classify_vector(centers[i % 120])
+        per_query_ms = (time.perf_counter() - started) * 1000 / 200
+        self.assertLess(per_query_ms, 5.0)  # typically well under 1 ms; loose for slow CI hosts
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.plant_detection_engine import AutoPlantDiseaseDetector
+from logic.disease_rules import DecisionTable, DEFAULT_RULES_PATH
+from logic.rule_bundle import RuleBundleStore, build_bundle, apply_delta, section_digests
+
+
+class TestRuleBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rules_path = os.path.join(self.tmp_dir, "rules.json")
+        shutil.copy(DEFAULT_RULES_PATH, self.rules_path)
+        self.detector = AutoPlantDiseaseDetector(rules_path=self.rules_path, persist=False)
+        self.store = RuleBundleStore(os.path.join(self.tmp_dir, "bundles"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def edit_first_rule(self, version):
+        with open(self.rules_path) as f:
+            spec = json.load(f)
+        spec["version"] = version
+        spec["rules"][0]["output"]["symptoms"] = ["edited"]
+        with open(self.rules_path, "w") as f:
+            json.dump(spec, f)
+        self.detector.rule_table.reload()
+        return spec["rules"][0]["id"]
+
+    def test_publish_is_idempotent(self):
+        v1 = self.store.publish(build_bundle(self.detector))
+        self.assertEqual(v1, 1)
+        self.assertEqual(self.store.publish(build_bundle(self.detector)), 1)
+        self.assertEqual(self.store.publish_from(self.detector), 1)
+
+        # Reopened store sees the same history
+        reopened = RuleBundleStore(self.store.bundle_dir)
+        self.assertEqual(reopened.latest_version, 1)
+        self.assertEqual(reopened.load(1), self.store.load(1))
+
+    def test_delta_contains_only_changes(self):
+        self.store.publish(build_bundle(self.detector))
+        base = self.store.load(1)
+
+        rule_id = self.edit_first_rule("test-2")
+        self.assertEqual(self.store.publish_from(self.detector), 2)
+
+        delta = self.store.delta(1)
+        self.assertEqual(delta["version"], 2)
+        self.assertEqual(set(delta["sections"]), {"meta", "rules"})
+        self.assertEqual(list(delta["sections"]["rules"]["set"]), [rule_id])
+        self.assertEqual(apply_delta(base, delta), self.store.load(2))
+
+        self.assertEqual(self.store.delta(2)["sections"], {})
+        self.assertIsNone(self.store.delta(99))
+
+    def test_edit_keeping_version_string_is_published(self):
+        self.assertEqual(self.store.publish_from(self.detector), 1)
+        rule_id = self.edit_first_rule(self.detector.rule_table.version)  # content changes, version does not
+        self.assertEqual(self.store.publish_from(self.detector), 2)
+        self.assertEqual(list(self.store.delta(1)["sections"]["rules"]["set"]), [rule_id])
+        self.assertEqual(self.store.publish_from(self.detector), 2)
+
+    def test_workers_see_each_others_versions(self):
+        self.store.publish(build_bundle(self.detector))
+        lagging = RuleBundleStore(self.store.bundle_dir)  # another worker process
+        self.assertEqual(lagging.latest_version, 1)
+
+        self.edit_first_rule("test-2")
+        self.assertEqual(self.store.publish_from(self.detector), 2)
+        self.assertEqual(lagging.latest_version, 2)
+        self.assertEqual(lagging.versions(), [1, 2])
+        self.assertEqual(lagging.delta(1)["version"], 2)
+        self.assertFalse([name for name in os.listdir(self.store.bundle_dir) if name.endswith(".tmp")])
+
+    def test_concurrent_workers_get_distinct_versions(self):
+        base = build_bundle(self.detector)
+        bundles = []
+        for i in range(8):
+            sections = json.loads(json.dumps(base))
+            sections["meta"]["rules_version"] = f"worker-{i}"
+            bundles.append(sections)
+
+        # One store per worker: only the lock file is shared, as between processes
+        start = threading.Barrier(len(bundles))
+        published = []
+
+        def publish(sections):
+            store = RuleBundleStore(self.store.bundle_dir)
+            start.wait()
+            published.append(store.publish(sections))
+
+        threads = [threading.Thread(target=publish, args=(sections,)) for sections in bundles]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(published), list(range(1, len(bundles) + 1)))
+        reopened = RuleBundleStore(self.store.bundle_dir)
+        for entry in reopened._manifest["versions"]:
+            self.assertEqual(section_digests(reopened.load(entry["version"])), entry["digests"])
+
+    def test_bundle_rules_evaluate_like_server(self):
+        sections = build_bundle(self.detector)
+        meta = sections["meta"]
+        table = DecisionTable.from_spec({"version": meta["rules_version"], "rules": list(sections["rules"].values())})
+
+        color = {"white_mildew": 0.3, "healthy_green": 0.7}
+        expected = self.detector.detect_diseases("unknown", color, {}, {})
+        self.assertEqual(table.evaluate_one(color, {}, {}), expected)
+        self.assertIn("tomato", sections["plants"])
+        self.assertEqual(len(sections["color_ranges"]["necrosis_brown"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.plant_detection_engine import AutoPlantDiseaseDetector
+from logic.shadow_mode import CandidateProcess, CandidateUnavailable, ShadowEvaluator
+
+TEST_IMAGE = os.path.join("logic", "TS.png")
+
+
+class BlockingCandidate:
+    """Candidate that holds the worker until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.rule_table = type("Table", (), {"version": "test"})()
+
+    def analyze_image(self, img, image_name="uploaded_image"):
+        self.release.wait(5)
+        return {"status": "success", "disease_diagnosis": [{"name": "Healthy Plant"}]}
+
+
+class TestShadowMode(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "farmx.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE shadow_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, detection_id INTEGER, candidate TEXT,
+                primary_rules_version TEXT, candidate_rules_version TEXT,
+                primary_diagnosis TEXT, candidate_diagnosis TEXT, diagnosis_agrees INTEGER,
+                primary_plant TEXT, candidate_plant TEXT, plant_agrees INTEGER,
+                primary_ms REAL, candidate_ms REAL, delta_ms REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def get_db_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def test_candidate_results_recorded(self):
+        candidate = AutoPlantDiseaseDetector(persist=False)
+        with open(TEST_IMAGE, "rb") as f:
+            image_data = f.read()
+        primary = candidate.analyze_image(cv2.imread(TEST_IMAGE), image_name="TS.png")
+        self.assertIsNone(primary["detection_id"])
+
+        shadow = ShadowEvaluator(candidate, self.get_db_connection, name="same-config", sample_rate=1.0)
+        self.assertTrue(shadow.submit(image_data, primary, 1000.0))
+        shadow.join()
+
+        conn = self.get_db_connection()
+        row = conn.execute("SELECT * FROM shadow_results").fetchone()
+        conn.close()
+        self.assertEqual(row["candidate"], "same-config")
+        self.assertEqual(row["diagnosis_agrees"], 1)
+        self.assertEqual(row["plant_agrees"], 1)
+        self.assertAlmostEqual(row["delta_ms"], row["candidate_ms"] - 1000.0, places=1)
+        self.assertEqual(shadow.stats()["processed"], 1)
+
+    def test_candidate_process(self):
+        with open(TEST_IMAGE, "rb") as f:
+            image_data = f.read()
+        primary = AutoPlantDiseaseDetector(persist=False).analyze_image(cv2.imread(TEST_IMAGE), image_name="TS.png")
+
+        shadow = ShadowEvaluator(CandidateProcess({"max_dim": 800}), self.get_db_connection, sample_rate=1.0)
+        self.assertIsNone(shadow.stats()["rules_version"])
+        self.assertTrue(shadow.submit(image_data, primary, 1000.0))
+        shadow.join()
+
+        conn = self.get_db_connection()
+        row = conn.execute("SELECT * FROM shadow_results").fetchone()
+        conn.close()
+        self.assertEqual(row["diagnosis_agrees"], 1)
+        self.assertEqual(shadow.stats()["rules_version"], primary["rules_version"])
+
+    def test_candidate_process_restarts(self):
+        image_data = cv2.imencode(".png", np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+        candidate = CandidateProcess({"rules_path": os.path.join(self.tmp_dir, "missing.json")}, restart_backoff=0.5)
+        with self.assertRaises(CandidateUnavailable):  # initializer fails -> broken pool
+            candidate.evaluate(image_data, "x.png")
+        with self.assertRaises(CandidateUnavailable):  # backing off, no new process yet
+            candidate.evaluate(image_data, "x.png")
+        self.assertEqual(candidate.restarts, 0)
+
+        candidate.options = {"max_dim": 800}
+        time.sleep(0.6)
+        result, _ = candidate.evaluate(image_data, "x.png")
+        self.assertEqual(candidate.restarts, 1)
+        self.assertIn("status", result)
+
+    def test_from_env_shares_classifier(self):
+        classifier = object()
+        env = {"SHADOW_SAMPLE_RATE": "0.5", "SHADOW_PROCESS": "0", "SHADOW_MAX_DIM": "640"}
+        with mock.patch.dict(os.environ, env):
+            shadow = ShadowEvaluator.from_env(self.get_db_connection, classifier)
+        self.assertIs(shadow.candidate.classifier, classifier)
+        self.assertEqual(shadow.candidate.max_dim, 640)
+        self.assertEqual(shadow.sample_rate, 0.5)
+        with mock.patch.dict(os.environ, {"SHADOW_SAMPLE_RATE": "0"}):
+            self.assertIsNone(ShadowEvaluator.from_env(self.get_db_connection, classifier))
+
+    def test_submit_never_blocks(self):
+        candidate = BlockingCandidate()
+        shadow = ShadowEvaluator(candidate, self.get_db_connection, sample_rate=1.0, max_queue=1)
+        primary = {"status": "success", "disease_diagnosis": [{"name": "Healthy Plant"}]}
+        image_data = cv2.imencode(".png", np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+
+        started = time.perf_counter()
+        queued = [shadow.submit(image_data, primary, 10.0) for _ in range(10)]
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertLessEqual(sum(queued), 2)  # one in flight + one waiting
+        self.assertGreaterEqual(shadow.stats()["dropped"], 8)
+
+        # Not sampled / failed analyses are never queued
+        shadow.sample_rate = 0.0
+        self.assertFalse(shadow.submit(image_data, primary, 10.0))
+        self.assertFalse(shadow.submit(image_data, {"status": "no_leaf"}, 10.0))
+        candidate.release.set()
+
+
+if __name__ == "__main__":
+    unittest.main()
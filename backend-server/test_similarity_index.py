@@ -0,0 +1,102 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.feature_store import FeatureStore, FEATURE_KEYS
+from logic.similarity_index import SimilarityIndex
+
+
+def clustered_vectors(rng, n, n_clusters=20):
+    centers = rng.uniform(0, 100, (n_clusters, len(FEATURE_KEYS)))
+    labels = rng.integers(0, n_clusters, n)
+    return (centers[labels] + rng.normal(0, 1, (n, len(FEATURE_KEYS)))).astype(np.float32)
+
+
+class TestSimilarityIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_flat_search(self):
+        rng = np.random.default_rng(0)
+        vectors = clustered_vectors(rng, 500)
+        index = SimilarityIndex()
+        index.add(np.arange(1, 501), vectors)
+
+        self.assertEqual(index.mode, 'flat')
+        results = index.search(vectors[9], k=5)
+        self.assertEqual(results[0][0], 10)
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+
+        neighbours = index.search(vectors[9], k=5, exclude_id=10)
+        self.assertNotIn(10, [i for i, _ in neighbours])
+        sims = [s for _, s in neighbours]
+        self.assertEqual(sims, sorted(sims, reverse=True))
+
+    def test_ivf_matches_flat(self):
+        rng = np.random.default_rng(1)
+        vectors = clustered_vectors(rng, 6000)
+        ids = np.arange(1, 6001)
+
+        flat = SimilarityIndex()
+        flat.add(ids, vectors)
+        ivf = SimilarityIndex(ivf_min_rows=2000)
+        ivf.add(ids[:3000], vectors[:3000])
+        ivf.add(ids[3000:], vectors[3000:])  # assigned incrementally to trained clusters
+        self.assertEqual(ivf.mode, 'ivf')
+
+        recall = []
+        for q in rng.choice(6000, 50, replace=False):
+            expected = {i for i, _ in flat.search(vectors[q], k=10)}
+            found = {i for i, _ in ivf.search(vectors[q], k=10)}
+            recall.append(len(expected & found) / 10)
+        self.assertGreater(np.mean(recall), 0.9)
+
+    def test_tails_feature_store(self):
+        store = FeatureStore(self.tmp_dir, chunk_rows=4)
+        rng = np.random.default_rng(2)
+        vectors = clustered_vectors(rng, 10)
+        for i in range(5):
+            store.append(i + 1, vectors[i])
+
+        index = SimilarityIndex.from_store(store)
+        self.assertEqual(len(index), 0)  # nothing read until the first query
+        self.assertIsNone(index.search_id(6))
+        self.assertEqual(len(index), 5)
+
+        for i in range(5, 10):
+            store.append(i + 1, vectors[i])
+        neighbours = index.search_id(6, k=3)  # the appends mark the index stale
+        self.assertEqual(len(index), 10)
+        self.assertEqual(len(neighbours), 3)
+        self.assertNotIn(6, [i for i, _ in neighbours])
+
+    def test_other_writers_picked_up_on_interval(self):
+        store = FeatureStore(self.tmp_dir, chunk_rows=4)
+        vectors = clustered_vectors(np.random.default_rng(3), 6)
+        store.append(1, vectors[0])
+        index = SimilarityIndex.from_store(store)
+        index.refresh()
+
+        other = FeatureStore(self.tmp_dir, chunk_rows=4)  # e.g. another worker process
+        for i in range(1, 6):
+            other.append(i + 1, vectors[i])
+        self.assertIsNone(index.search_id(2))  # within SYNC_INTERVAL: store not re-read
+
+        index.SYNC_INTERVAL = 0.0
+        self.assertEqual(len(index.search_id(2, k=3)), 3)
+        self.assertEqual(len(index), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,631 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from logic.soil_engine import SoilEngine
+from logic.raster_cache import RasterCache
+from logic.raster_layers import RasterLayerRegistry, read_source
+from ingest_layers import ingest_region
+from soil_endpoints import register_soil_endpoints
+
+
+def reference_region_color(engine, x, y, region_size=7):
+    """Per-request window average as get_pixel_color_region computed it before the rasters"""
+    half = region_size // 2
+    region = engine.map_image[max(0, y - half):min(engine.height, y + half + 1),
+                              max(0, x - half):min(engine.width, x + half + 1)]
+    return tuple(map(int, np.mean(region, axis=(0, 1))))
+
+
+class TestSoilEngineRasters(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = SoilEngine()
+        if cls.engine.map_image is None:
+            raise unittest.SkipTest("TS.png map not available")
+
+    def sample_pixels(self):
+        rng = np.random.default_rng(0)
+        h, w = self.engine.height, self.engine.width
+        corners = [(0, 0), (w - 1, 0), (0, h - 1), (w - 1, h - 1), (2, 1), (w - 2, h - 3)]
+        return corners + list(zip(rng.integers(0, w, 400).tolist(), rng.integers(0, h, 400).tolist()))
+
+    def test_raster_matches_window_average(self):
+        # Includes the clipped windows along the map edges
+        for x, y in self.sample_pixels():
+            color = reference_region_color(self.engine, x, y)
+            self.assertEqual(self.engine.get_pixel_color_region(x, y), color)
+            expected = self.engine.classify_color(color)['color_class']
+            self.assertEqual(self.engine.class_result(int(self.engine.class_raster[y, x]))['color_class'], expected)
+
+    def test_every_class_region_matches(self):
+        # One pixel of every class present in the map
+        for class_id in np.unique(self.engine.class_raster):
+            ys, xs = np.nonzero(self.engine.class_raster == class_id)
+            x, y = int(xs[0]), int(ys[0])
+            color = reference_region_color(self.engine, x, y)
+            self.assertEqual(self.engine.classify_color(color)['color_class'],
+                             self.engine.class_result(int(class_id))['color_class'])
+
+    def test_lookup_class_matches_land_info(self):
+        rng = np.random.default_rng(1)
+        for lat, lon in rng.uniform([15.5, 77.0], [20.2, 81.5], (200, 2)):
+            info = self.engine.get_land_info(lat, lon)
+            class_id, bias = self.engine.lookup_class(lat, lon)
+            self.assertEqual(self.engine.class_result(class_id)['color_class'], info['color_class'])
+
+            converted = self.engine.convert_map_bias(info['soil_bias'], SoilEngine.SOIL_TYPES)
+            total = sum(converted.values())
+            expected = [converted[t] / total if total > 0 else 0.0 for t in SoilEngine.SOIL_TYPES]
+            np.testing.assert_allclose(bias, expected)
+            self.assertFalse(bias.flags.writeable)
+
+    def test_integral_windows_match_direct_average(self):
+        rng = np.random.default_rng(3)
+        for (x, y), size in zip(self.sample_pixels(), rng.integers(1, 90, 406).tolist()):
+            self.assertEqual(self.engine.get_pixel_color_region(x, y, size),
+                             reference_region_color(self.engine, x, y, size))
+
+            composition = self.engine.get_region_composition(x, y, size)
+            self.assertAlmostEqual(float(composition.sum()), 1.0)
+            half = size // 2
+            window = self.engine.map_image[max(0, y - half):y + half + 1, max(0, x - half):x + half + 1]
+            classes = np.minimum(self.engine.classify_raster(window), len(self.engine.class_names))
+            expected = np.bincount(classes.ravel(), minlength=composition.size) / classes.size
+            np.testing.assert_allclose(composition, expected)
+
+    def test_multiscale_prior(self):
+        priors = self.engine.get_multiscale_prior(17.385, 78.4867)
+        self.assertEqual(list(priors), list(SoilEngine.PRIOR_SCALES_KM))
+        sizes = [prior['region_size_px'] for prior in priors.values()]
+        self.assertEqual(sizes, sorted(sizes))
+        for prior in priors.values():
+            self.assertAlmostEqual(sum(prior['composition'].values()), 1.0, places=2)
+            total = sum(prior['soil_prior'].values())
+            self.assertTrue(total == 0 or abs(total - 1.0) < 1e-3)
+
+    def pixel_to_gps(self, x, y):
+        engine = self.engine
+        return (engine.LAT_TOP - y / engine.height * (engine.LAT_TOP - engine.LAT_BOTTOM),
+                engine.LON_LEFT + x / engine.width * (engine.LON_RIGHT - engine.LON_LEFT))
+
+    def test_polygon_prior_matches_pixel_window(self):
+        engine = self.engine
+        for (x0, y0, x1, y1) in [(100, 200, 150, 260), (0, 0, 400, 300)]:  # supersampled / single sample
+            boundary = [self.pixel_to_gps(x, y) for x, y in [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]]
+            result = engine.get_polygon_prior(boundary)
+            # fillPoly's closed fill may add up to one sample band along the boundary
+            self.assertAlmostEqual(result['pixels'], (x1 - x0) * (y1 - y0), delta=x1 - x0 + y1 - y0 + 1)
+
+            rows = engine.pixel_classes[y0:y1, x0:x1]
+            weights = np.broadcast_to(engine.row_pixel_area_km2[y0:y1, np.newaxis], rows.shape)
+            area = np.bincount(rows.ravel(), weights=weights.ravel(), minlength=len(engine.row_class_ids))
+            self.assertAlmostEqual(result['area_km2'], area.sum(), delta=area.sum() * 1e-3)
+            for class_id, share in zip(engine.row_class_ids, area / area.sum()):
+                self.assertAlmostEqual(result['composition'].get(engine.class_result(class_id)['color_class'], 0.0),
+                                       share, delta=0.01)
+
+    def test_polygon_outside_map(self):
+        self.assertIsNone(self.engine.get_polygon_prior([(25.0, 70.0), (25.0, 71.0), (26.0, 71.0)]))
+        tiny = [self.pixel_to_gps(10.2, 10.2), self.pixel_to_gps(10.21, 10.2), self.pixel_to_gps(10.2, 10.21)]
+        result = self.engine.get_polygon_prior(tiny)
+        self.assertTrue(0 < result['pixels'] <= 1.0)
+        self.assertEqual(sum(result['composition'].values()), 1.0)
+
+    def test_batch_lookup_matches_scalar(self):
+        rng = np.random.default_rng(2)
+        lats = rng.uniform(15.5, 20.2, 5000)
+        lons = rng.uniform(77.0, 81.5, 5000)
+        xs, ys = self.engine.gps_to_pixel_batch(lats, lons)
+        class_ids = self.engine.lookup_class_batch(lats, lons)
+        for lat, lon, x, y, class_id in zip(lats, lons, xs, ys, class_ids):
+            self.assertEqual(self.engine.gps_to_pixel(lat, lon), (int(x), int(y)))
+            self.assertEqual(self.engine.lookup_class(lat, lon)[0], int(class_id))
+
+        invalid = self.engine.lookup_class_batch(np.array([np.nan, 17.0]), np.array([78.0, np.inf]))
+        self.assertEqual(invalid.tolist(), [SoilEngine.UNKNOWN_CLASS] * 2)
+
+
+def reference_image_features(gray):
+    """Texture, crack and grain features as computed before the vectorized rewrite"""
+    sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+    sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    coarseness = np.std(np.sqrt(sobelx ** 2 + sobely ** 2)) / 255.0
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    homogeneity = np.sum(binary == 255) / binary.size
+
+    lines = cv2.HoughLinesP(cv2.Canny(gray, 50, 150), 1, np.pi / 180, threshold=30, minLineLength=30, maxLineGap=10)
+    crack_score = 0.0
+    if lines is not None:
+        total = sum(np.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2) for x1, y1, x2, y2 in lines.reshape(-1, 4).tolist())
+        crack_score = min(total / np.sqrt(gray.shape[0] ** 2 + gray.shape[1] ** 2), 1.0)
+
+    enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    grain_count = 0
+    for contour in contours:
+        area, perimeter = cv2.contourArea(contour), cv2.arcLength(contour, True)
+        if perimeter > 0 and 0.3 < 4 * np.pi * area / perimeter ** 2 < 1.0 and 10 < area < 1000:
+            grain_count += 1
+    return coarseness, homogeneity, crack_score, min(grain_count / 50.0, 1.0)
+
+
+def synthetic_soil_gray(rng, height, width):
+    """Blurred noise (grain-like blobs) with a few dark crack lines"""
+    gray = cv2.GaussianBlur(rng.integers(0, 255, (height, width)).astype(np.uint8), (0, 0), float(rng.uniform(1.5, 6)))
+    for _ in range(int(rng.integers(0, 6))):
+        pts = rng.integers(0, min(height, width), 4).tolist()
+        cv2.line(gray, (pts[0], pts[1]), (pts[2], pts[3]), 10, 2)
+    return gray
+
+
+class TestImageAnalysis(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = SoilEngine()
+
+    def test_features_match_reference(self):
+        rng = np.random.default_rng(7)
+        for _ in range(12):
+            gray = synthetic_soil_gray(rng, *rng.integers(200, 800, 2).tolist())
+            coarseness, homogeneity, crack_score, grain_score = reference_image_features(gray)
+            texture = self.engine.analyze_image_texture(gray)
+            self.assertAlmostEqual(texture['coarseness'], coarseness, places=5)
+            self.assertAlmostEqual(texture['homogeneity'], homogeneity, places=9)
+            self.assertAlmostEqual(self.engine.detect_cracks(gray), crack_score, places=9)
+            # Outline length and area are estimated from pixel counts, not traced contours
+            self.assertAlmostEqual(self.engine.detect_grains(gray), grain_score, delta=0.1)
+
+    def test_large_photos_use_working_resolution(self):
+        image = np.zeros((3000, 4000, 3), dtype=np.uint8)
+        working = self.engine.working_image(image)
+        self.assertEqual(max(working.shape[:2]), SoilEngine.ANALYSIS_MAX_SIDE)
+        self.assertEqual(working.shape[:2], (768, 1024))
+        small = image[:600, :800]
+        self.assertIs(self.engine.working_image(small), small)
+
+        scores = self.engine.analyze_soil_image(cv2.cvtColor(synthetic_soil_gray(np.random.default_rng(8), 2400, 3200),
+                                                             cv2.COLOR_GRAY2BGR))
+        self.assertAlmostEqual(sum(scores.values()), 1.0)
+
+
+class TestPatchSampling(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = SoilEngine()
+        rng = np.random.default_rng(9)
+        soil = cv2.cvtColor(synthetic_soil_gray(rng, 480, 640), cv2.COLOR_GRAY2BGR)
+        cls.soil = cv2.addWeighted(soil, 0.6, np.full_like(soil, (40, 80, 130)), 0.4, 0)  # brown
+        cls.photo = cls.soil.copy()
+        cls.photo[:, 480:] = (40, 160, 40)  # grass strip on the right quarter
+
+    def test_non_soil_patches_rejected(self):
+        # 3x4 grid of 160 px cells; the last column is grass
+        scores, info = self.engine.analyze_soil_patches(self.photo, patches=12)
+        self.assertEqual((info["patches"], info["rejected"]), (12, 3))
+        self.assertAlmostEqual(sum(scores.values()), 1.0)
+
+        # Same as sampling only the soil part
+        soil_only, _ = self.engine.analyze_soil_patches(self.soil[:, :480], patches=9)
+        for soil_type in SoilEngine.SOIL_TYPES:
+            self.assertAlmostEqual(scores[soil_type], soil_only[soil_type], places=9)
+
+    def test_grid_count_is_exact(self):
+        for patches in (1, 5, 12, 16, 18, 64):
+            boxes = self.engine.patch_boxes(480, 640, patches)
+            self.assertEqual(len(boxes), patches)
+            self.assertEqual(sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes), 480 * 640)  # full cover
+
+    def test_random_layout_is_seeded(self):
+        first = self.engine.analyze_soil_patches(self.photo, patches=9, layout="random", seed=3,
+                                                 aggregate="trimmed_mean")
+        again = self.engine.analyze_soil_patches(self.photo, patches=9, layout="random", seed=3,
+                                                 aggregate="trimmed_mean")
+        self.assertEqual(first, again)
+        self.assertEqual(first[1]["patches"], 9)
+
+    def test_fallback_and_validation(self):
+        grass = np.full((300, 400, 3), (40, 160, 40), dtype=np.uint8)
+        scores, info = self.engine.analyze_soil_patches(grass, patches=4)
+        self.assertEqual(info["fallback"], "whole_image")
+        self.assertEqual(scores, self.engine.analyze_soil_image(grass))
+
+        for options in ({"patches": 0}, {"layout": "spiral"}, {"aggregate": "mean"}):
+            with self.assertRaises(ValueError):
+                self.engine.analyze_soil_patches(self.photo, **options)
+
+
+class TestFieldBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = SoilEngine()
+        rng = np.random.default_rng(10)
+        cls.images = [cv2.cvtColor(synthetic_soil_gray(rng, 300, 400), cv2.COLOR_GRAY2BGR) for _ in range(5)]
+
+    def test_fuses_image_scores(self):
+        result = self.engine.process_batch(self.images, aggregate="median")
+        per_image = [self.engine.analyze_soil_image(image) for image in self.images]
+        self.assertEqual(result["sample_count"], 5)
+        for soil_type in SoilEngine.SOIL_TYPES:
+            median = np.median([scores[soil_type] for scores in per_image])
+            total = sum(np.median([scores[t] for scores in per_image]) for t in SoilEngine.SOIL_TYPES)
+            self.assertAlmostEqual(result["image_scores"][soil_type], median / total, places=3)
+            self.assertAlmostEqual(result["samples"][0]["image_scores"][soil_type], per_image[0][soil_type], places=3)
+        self.assertTrue(0.0 <= result["sample_agreement"] <= 1.0)
+
+    def test_single_image_matches_process(self):
+        batch = self.engine.process_batch(self.images[:1], aggregate="trimmed_mean")
+        single = self.engine.process(self.images[0])
+        self.assertEqual(batch["final_scores"], single["final_scores"])
+
+    def test_rejects_empty_batch(self):
+        with self.assertRaises(ValueError):
+            self.engine.process_batch([])
+
+
+class FixedPriors:
+    """HWSD stand-in: get_prior(lat, lon) returns units[lat]"""
+
+    def __init__(self, units):
+        self.units = units
+
+    def get_prior(self, lat, lon):
+        return self.units[lat]
+
+
+class TestBatchDecision(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = SoilEngine()
+        rng = np.random.default_rng(11)
+        cls.count = 200
+        cls.scores = rng.dirichlet(np.ones(3), cls.count)
+        biases = [{"Mixed": 1.0}, {"Sandy": 0.7, "Loamy": 0.3}, {"Black": 0.6, "Red": 0.4}, {"Red": 1.0}]
+        cls.biases = [biases[i % len(biases)] for i in range(cls.count)]
+        cls.land_classes = [f"class-{i % 4}" for i in range(cls.count)]
+        cls.adjustments = []
+        for i in range(cls.count):
+            adjustment = {}
+            if i % 3 == 0:
+                adjustment["sandy_reduction"] = float(rng.uniform(0, 0.4))
+            if i % 4 == 0:
+                adjustment["clay_crack_increase"] = float(rng.uniform(0, 0.4))
+            if i % 5 == 0:
+                adjustment["texture_reliability"] = float(rng.uniform(0.5, 1.0))
+                adjustment["color_bias_reliability"] = float(rng.uniform(0.5, 1.0))
+            cls.adjustments.append(adjustment)
+
+    def scalar(self, i):
+        return self.engine.determine_soil_type(
+            dict(zip(SoilEngine.SOIL_TYPES, self.scores[i].tolist())),
+            {"soil_bias": self.biases[i], "land_class": self.land_classes[i]},
+            {"adjustments": self.adjustments[i]},
+            {"lat": i, "lon": 0.0}
+        )
+
+    def test_matches_scalar_decision(self):
+        batch = self.engine.determine_soil_type_batch(
+            self.scores, self.engine.map_bias_matrix(self.biases),
+            self.engine.adjustment_matrix(self.adjustments), land_classes=self.land_classes)
+        self.assertEqual(len(batch), self.count)
+        for i in range(self.count):
+            expected = self.scalar(i)
+            row = batch.result(i, reasons=True)
+            self.assertEqual(row["soil_type"], expected["soil_type"])
+            self.assertAlmostEqual(row["confidence"], expected["confidence"], places=2)
+            for key in ("final_scores", "image_scores", "map_bias"):
+                for soil_type in SoilEngine.SOIL_TYPES:
+                    self.assertAlmostEqual(row[key][soil_type], expected[key][soil_type], places=3)
+            self.assertEqual(row["reason"], expected["reason"])
+        self.assertEqual(batch.soil_types[:3], [self.scalar(i)["soil_type"] for i in range(3)])
+
+    def test_hwsd_prior_rows(self):
+        units = [{"smu_id": i, "texture_class": "clay", "soil_prior": {"Sandy": 0.1, "Clay": 0.7, "Loamy": 0.2}}
+                 if i % 2 else None for i in range(self.count)]
+        priors = np.array([[unit["soil_prior"][t] for t in SoilEngine.SOIL_TYPES] if unit else [np.nan] * 3
+                           for unit in units])
+        original = self.engine.hwsd
+        self.engine.hwsd = FixedPriors(units)
+        try:
+            batch = self.engine.determine_soil_type_batch(
+                self.scores, self.engine.map_bias_matrix(self.biases), self.engine.adjustment_matrix(self.adjustments),
+                hwsd_prior=priors, land_classes=self.land_classes, hwsd_units=units)
+            for i in range(0, self.count, 7):
+                expected = self.scalar(i)
+                self.assertEqual(batch.soil_types[i], expected["soil_type"])
+                for j, soil_type in enumerate(SoilEngine.SOIL_TYPES):
+                    self.assertAlmostEqual(batch.final_scores[i, j], expected["final_scores"][soil_type], places=3)
+                self.assertEqual(batch.reasons(i), expected["reason"])
+        finally:
+            self.engine.hwsd = original
+
+    def test_defaults_without_adjustments(self):
+        batch = self.engine.determine_soil_type_batch(self.scores[:4], self.engine.map_bias_matrix(self.biases[:4]))
+        np.testing.assert_allclose(batch.adjustments, [SoilEngine.WEATHER_ADJUSTMENT_DEFAULTS] * 4)
+        np.testing.assert_allclose(batch.final_scores.sum(axis=1), 1.0)
+
+
+class TestRasterLayers(unittest.TestCase):
+    # TS.png ingested again as a made-up region south-west of Telangana
+    BOUNDS = {"lat_top": 14.0, "lat_bottom": 10.0, "lon_left": 73.0, "lon_right": 77.0}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = SoilEngine()
+        if cls.engine.map_image is None:
+            raise unittest.SkipTest("TS.png map not available")
+        cls.tmp_dir = tempfile.mkdtemp()
+        region = {"name": "test_region", "source": "logic/TS.png", "bounds": cls.BOUNDS}
+        ingest_region(cls.engine, region, cls.tmp_dir, tile_size=64)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.home_layers = self.engine.layers
+        self.engine.layers = RasterLayerRegistry(self.tmp_dir, class_params=self.engine.class_params())
+
+    def tearDown(self):
+        self.engine.layers = self.home_layers
+
+    def region_point(self, x, y):
+        b, engine = self.BOUNDS, self.engine
+        return (b["lat_top"] - (y + 0.5) / engine.height * (b["lat_top"] - b["lat_bottom"]),
+                b["lon_left"] + (x + 0.5) / engine.width * (b["lon_right"] - b["lon_left"]))
+
+    def test_region_matches_home_rasters(self):
+        engine = self.engine
+        rng = np.random.default_rng(4)
+        for x, y in zip(rng.integers(0, engine.width, 200).tolist(), rng.integers(0, engine.height, 200).tolist()):
+            lat, lon = self.region_point(x, y)
+            info = engine.get_land_info(lat, lon)
+            self.assertEqual(info["region"], "test_region")
+            self.assertEqual(info["color_class"], engine.class_result(int(engine.class_raster[y, x]))["color_class"])
+            b, g, r = engine.avg_raster[y, x]
+            self.assertEqual(info["average_color_rgb"], (int(r), int(g), int(b)))
+            self.assertEqual(engine.lookup_class(lat, lon)[0], int(engine.class_raster[y, x]))
+
+    def test_outside_every_region_is_unknown(self):
+        info = self.engine.get_land_info(25.0, 70.0)
+        self.assertIsNone(info["region"])
+        self.assertEqual(info["land_class"], self.engine.unknown_result["land_class"])
+        self.assertEqual(self.engine.lookup_class(25.0, 70.0)[0], SoilEngine.UNKNOWN_CLASS)
+        self.assertIsNone(self.engine.layers.sample("classes", 25.0, 70.0))
+
+    def test_multiscale_prior_uses_regions(self):
+        engine = self.engine
+        x, y = 200, 150
+        priors = engine.get_multiscale_prior(*self.region_point(x, y))
+        self.assertEqual(list(priors), list(SoilEngine.PRIOR_SCALES_KM))
+        field = priors["field"]
+        self.assertEqual(field["region"], "test_region")
+        self.assertAlmostEqual(sum(field["composition"].values()), 1.0, places=3)
+        dominant = max(field["composition"], key=field["composition"].get)
+        self.assertEqual(dominant, engine.class_result(int(engine.class_raster[y, x]))["color_class"])
+        self.assertIn("average_color_rgb", field)
+
+        # Beyond TS.png and every region: no prior instead of the map border's
+        self.assertEqual(engine.get_multiscale_prior(25.0, 70.0), {})
+        self.assertEqual(engine.get_multiscale_prior(engine.LAT_TOP + 0.5, 78.5), {})
+
+    def test_batch_matches_scalar_across_regions(self):
+        rng = np.random.default_rng(5)
+        lats = rng.uniform(9.0, 21.0, 3000)
+        lons = rng.uniform(72.0, 82.0, 3000)
+        class_ids = self.engine.lookup_class_batch(lats, lons)
+        for lat, lon, class_id in zip(lats, lons, class_ids):
+            self.assertEqual(self.engine.lookup_class(lat, lon)[0], int(class_id))
+
+    def test_layers_with_other_classes_skipped(self):
+        self.assertEqual(len(self.engine.layers), 1)
+        params = self.engine.class_params()
+        params["classes"][0] = ("forest", [(0, 0, 0), (10, 10, 10)])
+        self.assertEqual(len(RasterLayerRegistry(self.tmp_dir, class_params=params)), 0)
+        self.assertEqual(len(RasterLayerRegistry(self.tmp_dir)), 1)  # unchecked without class_params
+
+    def test_polygon_prior_uses_regions(self):
+        engine = self.engine
+        home_bounds = {"lat_top": engine.LAT_TOP, "lat_bottom": engine.LAT_BOTTOM,
+                       "lon_left": engine.LON_LEFT, "lon_right": engine.LON_RIGHT}
+
+        def boundary(b, corners):
+            return [(b["lat_top"] - y / engine.height * (b["lat_top"] - b["lat_bottom"]),
+                     b["lon_left"] + x / engine.width * (b["lon_right"] - b["lon_left"])) for x, y in corners]
+
+        for (x0, y0, x1, y1) in [(100, 200, 150, 260), (0, 0, 400, 300)]:
+            corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+            home = engine.get_polygon_prior(boundary(home_bounds, corners))
+            region = engine.get_polygon_prior(boundary(self.BOUNDS, corners))
+            self.assertEqual((home["region"], region["region"]), (SoilEngine.HOME_REGION, "test_region"))
+            self.assertAlmostEqual(region["pixels"], (x1 - x0) * (y1 - y0), delta=x1 - x0 + y1 - y0 + 1)
+            self.assertGreater(region["area_km2"], 0)
+
+            # The region only has the window-averaged classes (TS.png's class_raster)
+            b = self.BOUNDS
+            rows = np.minimum(engine.class_raster[y0:y1, x0:x1], len(engine.class_names))
+            row_lats = b["lat_top"] - (np.arange(y0, y1) + 0.5) / engine.height * (b["lat_top"] - b["lat_bottom"])
+            weights = np.broadcast_to(np.cos(np.radians(row_lats))[:, np.newaxis], rows.shape)
+            area = np.bincount(rows.ravel(), weights=weights.ravel(), minlength=len(engine.row_class_ids))
+            for class_id, share in zip(engine.row_class_ids, area / area.sum()):
+                self.assertAlmostEqual(region["composition"].get(engine.class_result(class_id)["color_class"], 0.0),
+                                       share, delta=0.01)
+
+        self.assertIsNone(engine.get_polygon_prior([(25.0, 70.0), (25.0, 71.0), (26.0, 71.0)]))
+
+    def test_tiles_evicted_beyond_budget(self):
+        # 64x64 class tiles are 4 KiB each: room for two
+        registry = RasterLayerRegistry(self.tmp_dir, max_resident_bytes=2 * 64 * 64)
+        for x in (10, 100, 200, 300):
+            registry.sample("classes", *self.region_point(x, 10))
+        registry.sample("classes", *self.region_point(300, 10))
+        stats = registry.stats()
+        self.assertEqual((stats["tile_misses"], stats["tile_hits"]), (4, 1))
+        self.assertEqual((stats["resident_tiles"], stats["tile_evictions"]), (2, 2))
+
+    def test_source_needs_bounds(self):
+        with self.assertRaises(ValueError):
+            read_source(os.path.join("logic", "TS.png"))
+        with self.assertRaises(ValueError):
+            read_source(os.path.join("logic", "TS.png"), dict(self.BOUNDS, lat_top=9.0))
+
+
+class TestWeatherDeadline(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = SoilEngine()
+        self.engine.WEATHER_DEADLINE_S = 0.5
+        self.image = np.full((240, 320, 3), (60, 100, 140), dtype=np.uint8)
+
+    def fake_weather(self, weather_delay, rainfall_delay):
+        def current_weather(lat, lon, timeout=5):
+            time.sleep(weather_delay)
+            return {'temperature': 40, 'humidity': 50, 'pressure': 1000, 'description': 'clear', 'wind_speed': 1}
+
+        def rainfall(lat, lon, days=5, timeout=5):
+            time.sleep(rainfall_delay)
+            return 45.0
+
+        self.engine.get_current_weather = current_weather
+        self.engine.get_historical_rainfall = rainfall
+
+    def test_weather_calls_overlap(self):
+        self.fake_weather(0.3, 0.3)
+        start = time.monotonic()
+        result = self.engine.process(self.image, 17.385, 78.4867)
+        self.assertLess(time.monotonic() - start, 0.5)  # sequential calls alone would take 0.6s
+        self.assertGreater(result['weather_adjustments']['clay_crack_increase'], 0)
+        self.assertGreater(result['weather_adjustments']['sandy_reduction'], 0)
+
+    def test_deadline_falls_back(self):
+        self.fake_weather(0.05, 2.0)
+        start = time.monotonic()
+        pending = self.engine.start_weather_fetch(17.385, 78.4867)
+        weather = self.engine.collect_weather_adjustments(pending)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(weather['timed_out'], ['rainfall'])
+        self.assertEqual(weather['avg_rainfall_5days_mm'], SoilEngine.FALLBACK_RAINFALL_MM)
+        self.assertEqual(weather['weather_data']['temperature'], 40)
+
+        self.assertEqual(self.engine.collect_weather_adjustments(self.engine.start_weather_fetch(None, None)),
+                         {'adjustments': {}, 'weather_data': {}})
+
+
+class TestRasterCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp_dir, "map.png")
+        with open(self.source, "wb") as f:
+            f.write(b"v1")
+        self.builds = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def build(self):
+        self.builds += 1
+        return np.full((4, 5), self.builds, dtype=np.uint8)
+
+    def test_reuses_until_source_or_params_change(self):
+        cache = RasterCache(self.source, os.path.join(self.tmp_dir, "cache"))
+        first = cache.get("classes", self.build, {"k": 1})
+        self.assertIsInstance(first.base, np.memmap)
+        self.assertFalse(first.flags.writeable)
+
+        # Another process (fresh instance) maps the same file without rebuilding
+        again = RasterCache(self.source, os.path.join(self.tmp_dir, "cache")).get("classes", self.build, {"k": 1})
+        self.assertEqual(self.builds, 1)
+        np.testing.assert_array_equal(again, first)
+
+        cache.get("classes", self.build, {"k": 2})
+        self.assertEqual(self.builds, 2)
+
+        stat = os.stat(self.source)
+        os.utime(self.source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(int(cache.get("classes", self.build, {"k": 2})[0, 0]), 3)
+
+    def test_missing_source(self):
+        cache = RasterCache(os.path.join(self.tmp_dir, "missing.png"), os.path.join(self.tmp_dir, "cache"))
+        self.assertIsNone(cache.get("bgr", self.build))
+        self.assertEqual(self.builds, 0)
+
+
+class TestEngineWithoutMap(unittest.TestCase):
+    """TS.png missing: reduced functionality, every point unknown"""
+
+    @classmethod
+    def setUpClass(cls):
+        from fastapi import FastAPI, HTTPException
+        from fastapi.testclient import TestClient
+
+        with mock.patch.object(RasterCache, "get", return_value=None):  # as if the source did not exist
+            cls.engine = SoilEngine()
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.engine.layers = RasterLayerRegistry(cls.tmp_dir)  # no ingested regions either
+        app = FastAPI()
+        register_soil_endpoints(app, HTTPException, cls.engine)
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def test_batch_lookup_is_unknown(self):
+        self.assertIsNone(self.engine.class_raster)
+        class_ids = self.engine.lookup_class_batch(np.array([17.385, 12.0, np.nan]), np.array([78.4867, 75.0, 1.0]))
+        self.assertEqual(class_ids.tolist(), [SoilEngine.UNKNOWN_CLASS] * 3)
+
+    def test_bulk_endpoint(self):
+        response = self.client.post("/soil/land-info/bulk?format=binary",
+                                    json={"lat": [17.385, 18.0], "lon": [78.4867, 79.0]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(np.frombuffer(response.content, np.uint8).tolist(), [SoilEngine.UNKNOWN_CLASS] * 2)
+
+
+class TestBulkEndpoint(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from fastapi import FastAPI, HTTPException
+        from fastapi.testclient import TestClient
+
+        cls.engine = SoilEngine()
+        app = FastAPI()
+        register_soil_endpoints(app, HTTPException, cls.engine)
+        cls.client = TestClient(app)
+
+    def post(self, payload):
+        return self.client.post("/soil/land-info/bulk?format=binary", json=payload)
+
+    def test_points(self):
+        response = self.post({"lat": [17.385, None], "lon": [78.4867, None]})
+        self.assertEqual(response.status_code, 200)
+        class_ids = np.frombuffer(response.content, np.uint8)
+        expected = self.engine.lookup_class_batch(np.array([17.385, np.nan]), np.array([78.4867, np.nan]))
+        self.assertEqual(class_ids.tolist(), expected.tolist())  # null -> unmapped point
+
+    def test_malformed_points(self):
+        for payload in ({"lat": [{}], "lon": [78.0]}, {"lat": ["x"], "lon": [78.0]},
+                        {"lat": [17.0, 18.0], "lon": [78.0]}, {"lat": [17.0]}, [17.0, 78.0]):
+            self.assertEqual(self.post(payload).status_code, 400, payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
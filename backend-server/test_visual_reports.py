@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from logic.visual_reports import VisualReportStore
+from detection_endpoints import register_detection_endpoints
+
+DISEASES = [{"name": "Leaf Spot", "type": "fungal", "confidence": "Medium", "symptoms": ["spots"]}]
+
+
+class CountingDetector:
+    """Renders a copy of the image and counts how often it was asked to"""
+
+    ENGINE_VERSION = "1.1.0"
+
+    def __init__(self):
+        self.rule_table = type("Table", (), {"digest": "rules-a"})()
+        self.renders = 0
+
+    def render_visual_report(self, img, plant_name, diseases):
+        self.renders += 1
+        return img.copy()
+
+
+def leaf_jpeg():
+    img = np.full((64, 64, 3), (40, 150, 60), dtype=np.uint8)
+    cv2.circle(img, (32, 32), 8, (30, 60, 110), -1)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+class TestVisualReportStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = VisualReportStore(self.tmp_dir)
+        self.detector = CountingDetector()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_save_source(self):
+        path = self.store.save_source(7, b"bytes", "leaf.PNG")
+        self.assertTrue(path.endswith("7.png"))
+        self.assertEqual(self.store.source_path(7), path)
+        self.assertTrue(self.store.save_source(8, b"bytes", "leaf.gif").endswith("8.jpg"))
+        self.assertIsNone(self.store.save_source(None, b"bytes"))
+        self.assertEqual(sorted(os.listdir(self.store.source_dir)), ["7.png", "8.jpg"])  # no .tmp left behind
+
+    def test_partial_write_is_not_a_source(self):
+        # Left behind by a crash (or still being written by another worker)
+        with open(os.path.join(self.store.source_dir, "9.jpg.1234.tmp"), "wb") as f:
+            f.write(b"partial")
+        self.assertIsNone(self.store.source_path(9))
+        path = self.store.save_source(9, b"bytes", "leaf.jpg")
+        self.assertEqual(self.store.source_path(9), path)
+
+    def test_cache_hit(self):
+        self.store.save_source(1, leaf_jpeg(), "leaf.jpg")
+        first = self.store.get_or_render(self.detector, 1, "Tomato", DISEASES)
+        again = self.store.get_or_render(self.detector, 1, "Tomato", DISEASES)
+        self.assertEqual(first, again)
+        self.assertEqual(self.detector.renders, 1)
+        self.assertTrue(self.store.get_or_render(self.detector, 1, "Tomato", DISEASES, fmt="webp").endswith(".webp"))
+        self.assertEqual(self.detector.renders, 2)
+
+    def test_rerender_after_rules_or_diagnosis_change(self):
+        self.store.save_source(1, leaf_jpeg(), "leaf.jpg")
+        first = self.store.get_or_render(self.detector, 1, "Tomato", DISEASES)
+
+        self.detector.rule_table.digest = "rules-b"  # rules edited, same ENGINE_VERSION
+        edited = self.store.get_or_render(self.detector, 1, "Tomato", DISEASES)
+        self.assertNotEqual(edited, first)
+        self.assertFalse(os.path.exists(first))
+
+        rescored = self.store.get_or_render(self.detector, 1, "Tomato", [dict(DISEASES[0], name="Blight")])
+        self.assertNotEqual(rescored, edited)
+        self.assertEqual(self.detector.renders, 3)
+        self.assertEqual(os.listdir(self.store.cache_dir), [os.path.basename(rescored)])
+
+    def test_missing_source(self):
+        self.assertIsNone(self.store.get_or_render(self.detector, 99, "Tomato", DISEASES))
+        self.store.save_source(5, b"not an image", "leaf.jpg")
+        self.assertIsNone(self.store.get_or_render(self.detector, 5, "Tomato", DISEASES))
+        self.assertEqual(self.detector.renders, 0)
+
+
+class TestVisualEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "farmx.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE detections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                image_name TEXT,
+                plant_detected TEXT,
+                disease_details TEXT,
+                visual_report_path TEXT
+            )
+        ''')
+        conn.executemany("INSERT INTO detections (id, plant_detected, disease_details) VALUES (?, ?, ?)",
+                         [(1, "Tomato", json.dumps(DISEASES)), (2, "Tomato", "[]")])
+        conn.commit()
+        conn.close()
+
+        self.store = VisualReportStore(self.tmp_dir)
+        self.store.save_source(1, leaf_jpeg(), "leaf.jpg")
+        self.detector = CountingDetector()
+        app = FastAPI()
+        register_detection_endpoints(app, self.connect, HTTPException, self.detector, self.store, None)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def test_renders_once_and_records_path(self):
+        response = self.client.get("/detections/1/visual")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "image/jpeg")
+        self.assertIsNotNone(cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR))
+        self.assertEqual(self.client.get("/detections/1/visual").status_code, 200)
+        self.assertEqual(self.detector.renders, 1)
+
+        conn = self.connect()
+        stored = conn.execute("SELECT visual_report_path FROM detections WHERE id = 1").fetchone()[0]
+        conn.close()
+        self.assertEqual(os.path.dirname(stored), self.store.cache_dir)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get("/detections/1/visual?format=gif").status_code, 400)
+        self.assertEqual(self.client.get("/detections/42/visual").status_code, 404)
+        self.assertEqual(self.client.get("/detections/2/visual").status_code, 404)  # no source image
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -18,9 +18,13 @@ if [ -z "$GEMINI_API_KEY" ]; then
     echo "⚠️  WARNING: GEMINI_API_KEY not set. AI Advice feature will not work."
 fi
 
-# Check if HWSD2.mdb exists
-if [ ! -f "/app/HWSD2.mdb" ]; then
-    echo "⚠️  WARNING: HWSD2.mdb not found. Soil analysis may be limited."
+# Check if the HWSD2 soil store has been ingested (python ingest_hwsd.py)
+if [ ! -f "${HWSD_DIR:-/app/hwsd}/hwsd.json" ]; then
+    if [ -f "/app/HWSD2.mdb" ]; then
+        echo "⚠️  WARNING: HWSD2.mdb found but not ingested. Run: python ingest_hwsd.py --bil HWSD2.bil --mdb HWSD2.mdb"
+    else
+        echo "⚠️  WARNING: HWSD2 soil store not found. Soil analysis may be limited."
+    fi
 fi
 
 echo ""
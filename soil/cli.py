@@ -1,12 +1,15 @@
 
 import os
+import sys
 import cv2
+import argparse
 import numpy as np
 from config import Config
 from services.map_reader import MapReader
 from services.weather_fetcher import WeatherFetcher
 from services.image_analyzer import ImageAnalyzer
 from services.decision_engine import DecisionEngine
+from services.batch_processor import BatchProcessor
 
 def cli_interface():
     """Command line interface for testing"""
@@ -99,5 +102,43 @@ def cli_interface():
     except Exception as e:
         print(f"Error during execution: {e}")
 
+def batch_interface(args):
+    """Non-interactive mode: process every row of a CSV manifest"""
+    output_format = args.format or ('jsonl' if args.output.endswith('.jsonl') else 'csv')
+    processor = BatchProcessor(
+        workers=args.workers,
+        weather_precision=args.weather_precision,
+        use_weather=not args.no_weather
+    )
+    stats = processor.run(args.manifest, args.output, output_format, resume=not args.no_resume)
+    
+    print("=" * 60)
+    print(f"Rows in manifest: {stats['rows']} ({stats['skipped']} already done)")
+    print(f"Processed: {stats['processed']} ({stats['failed']} failed)")
+    print(f"Weather fetches: {stats['weather_fetches']}")
+    print(f"Elapsed: {stats['elapsed_s']}s, {stats['images_per_s']} images/s on {stats['workers']} workers")
+    print(f"Results: {args.output}")
+    print("=" * 60)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Soil Estimation System (interactive without --manifest)")
+    parser.add_argument('--manifest', help="CSV with image (or image_path), lat, lon and optional id columns")
+    parser.add_argument('--output', default='soil_results.csv', help="Results file (.csv or .jsonl)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Output format (default: from the extension)")
+    parser.add_argument('--workers', type=int, help="Image analysis processes (default: CPU count)")
+    parser.add_argument('--weather-precision', type=int, default=Config.BATCH_WEATHER_PRECISION,
+                        help="Decimals coordinates are rounded to before sharing a weather fetch")
+    parser.add_argument('--no-weather', action='store_true', help="Skip weather adjustments (offline runs)")
+    parser.add_argument('--no-resume', action='store_true', help="Overwrite the output instead of skipping rows done without error")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    cli_interface()
+    args = parse_args()
+    if args.manifest:
+        try:
+            batch_interface(args)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    else:
+        cli_interface()
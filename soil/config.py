@@ -12,9 +12,22 @@ class Config:
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     
+    # Longest side (px) soil photos are analyzed at; larger photos are downscaled
+    ANALYSIS_MAX_SIDE = int(os.environ.get('ANALYSIS_MAX_SIDE', '1024'))
+    
+    # Batch mode (cli.py --manifest): weather is fetched once per coordinate
+    # rounded to this many decimals (2 ~ 1 km), with this many concurrent fetches;
+    # results are written every BATCH_FLUSH_EVERY rows
+    BATCH_WEATHER_PRECISION = int(os.environ.get('BATCH_WEATHER_PRECISION', '2'))
+    BATCH_WEATHER_WORKERS = int(os.environ.get('BATCH_WEATHER_WORKERS', '8'))
+    BATCH_FLUSH_EVERY = int(os.environ.get('BATCH_FLUSH_EVERY', '64'))
+    
     # Map file
     MAP_FILE = 'TS.png'
     
+    # Decoded map rasters (.npy, memory-mapped by every process)
+    MAP_CACHE_DIR = os.environ.get('MAP_CACHE_DIR', os.path.join('cache', 'rasters'))
+    
     # OpenWeatherMap API
     OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY', '0eb1b6f980c80a0423e9c9cb1f13d9b0')
     OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
@@ -0,0 +1,240 @@
+import os
+import csv
+import sys
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from config import Config
+from services.map_reader import MapReader
+from services.weather_fetcher import WeatherFetcher
+from services.image_analyzer import ImageAnalyzer
+from services.decision_engine import DecisionEngine
+
+# Columns written for every manifest row in CSV output (JSONL adds the full result)
+RESULT_COLUMNS = ['id', 'image', 'lat', 'lon', 'soil_type', 'confidence', 'land_class',
+                  'sandy', 'clay', 'loamy', 'reason', 'error']
+
+
+def _analyze_image(image_path: str) -> Tuple[Optional[Dict[str, float]], Optional[str]]:
+    """Process-pool task: image scores, or the error that stopped them"""
+    try:
+        return ImageAnalyzer.analyze_soil_image(image_path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+class BatchProcessor:
+    """
+    Non-interactive soil estimation over a CSV manifest of (image, lat, lon)
+    rows. The map is loaded once, weather is fetched once per rounded
+    coordinate, image analysis runs in a process pool and results are
+    appended to a CSV or JSONL file as they complete; rows already in the
+    output file without an error are skipped, so an interrupted run can simply
+    be restarted and failed images are retried (a later row for an id
+    supersedes earlier ones).
+    """
+
+    def __init__(
+        self,
+        workers: int = None,
+        weather_precision: int = Config.BATCH_WEATHER_PRECISION,
+        weather_workers: int = Config.BATCH_WEATHER_WORKERS,
+        flush_every: int = Config.BATCH_FLUSH_EVERY,
+        use_weather: bool = True,
+        map_reader: MapReader = None,
+        weather_fetcher: WeatherFetcher = None
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.weather_precision = weather_precision
+        self.weather_workers = weather_workers
+        self.flush_every = max(1, flush_every)
+        self.use_weather = use_weather
+        self.map_reader = map_reader or MapReader()
+        self.weather_fetcher = weather_fetcher or WeatherFetcher()
+
+    @staticmethod
+    def read_manifest(manifest_path: str) -> List[Dict]:
+        """
+        Rows of a manifest with columns image (or image_path), lat, lon and an
+        optional id. Relative image paths are resolved against the manifest's
+        folder; the id defaults to the image path as written.
+        """
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+        rows = []
+        with open(manifest_path, newline='') as f:
+            reader = csv.DictReader(f)
+            for line_no, record in enumerate(reader, start=2):
+                image = (record.get('image') or record.get('image_path') or '').strip()
+                if not image:
+                    raise ValueError(f"{manifest_path}:{line_no}: missing image column")
+                try:
+                    lat, lon = float(record['lat']), float(record['lon'])
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError(f"{manifest_path}:{line_no}: lat and lon must be numbers")
+                rows.append({
+                    'id': (record.get('id') or '').strip() or image,
+                    'image': image,
+                    'path': image if os.path.isabs(image) else os.path.join(base_dir, image),
+                    'lat': lat,
+                    'lon': lon
+                })
+        return rows
+
+    @staticmethod
+    def completed_ids(output_path: str, output_format: str) -> Set[str]:
+        """
+        Ids an earlier run wrote a result for; rows with an error do not count,
+        so those images are tried again. A trailing partial line (run killed
+        mid-write) is cut off so appended rows start cleanly.
+        """
+        if not os.path.exists(output_path):
+            return set()
+
+        with open(output_path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+
+        ids = set()
+        with open(output_path, newline='') as f:
+            if output_format == 'jsonl':
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        if not record.get('error'):
+                            ids.add(record['id'])
+                    except (ValueError, KeyError, AttributeError):
+                        continue
+            else:
+                for record in csv.DictReader(f):
+                    if record.get('id') is not None and not record.get('error'):
+                        ids.add(record['id'])
+        return ids
+
+    def weather_key(self, lat: float, lon: float) -> Tuple[float, float]:
+        return round(lat, self.weather_precision), round(lon, self.weather_precision)
+
+    def start_weather(self, rows: List[Dict], pool: ThreadPoolExecutor) -> Dict:
+        """One weather fetch per distinct rounded coordinate, running in `pool`"""
+        if not self.use_weather:
+            return {}
+        pending = {}
+        for row in rows:
+            key = self.weather_key(row['lat'], row['lon'])
+            if key not in pending:
+                pending[key] = pool.submit(self.weather_fetcher.get_weather_adjustments, *key)
+        return pending
+
+    def decide(self, rows: List[Dict], scores: List[Tuple], weather: Dict) -> Iterator[Dict]:
+        """Output records for one flushed block of rows (failed images keep their error)"""
+        analyzed = [i for i, (image_scores, _) in enumerate(scores) if image_scores is not None]
+        batch = None
+        if analyzed:
+            land_infos = [self.map_reader.get_land_info(rows[i]['lat'], rows[i]['lon']) for i in analyzed]
+            adjustments = [
+                weather[self.weather_key(rows[i]['lat'], rows[i]['lon'])].result()['adjustments']
+                if self.use_weather else {}
+                for i in analyzed
+            ]
+            batch = DecisionEngine.determine_soil_type_batch(
+                [[scores[i][0][t] for t in DecisionEngine.SOIL_TYPES] for i in analyzed],
+                DecisionEngine.map_bias_matrix([info['soil_bias'] for info in land_infos]),
+                DecisionEngine.adjustment_matrix(adjustments),
+                land_classes=[info['land_class'] for info in land_infos]
+            )
+
+        position = {row_index: batch_index for batch_index, row_index in enumerate(analyzed)}
+        for i, row in enumerate(rows):
+            record = {'id': row['id'], 'image': row['image'], 'lat': row['lat'], 'lon': row['lon']}
+            if i in position:
+                record.update(batch.result(position[i], reasons=True))
+                record['error'] = None
+            else:
+                record['error'] = scores[i][1]
+            yield record
+
+    @staticmethod
+    def csv_row(record: Dict) -> Dict:
+        final_scores = record.get('final_scores', {})
+        return {
+            'id': record['id'],
+            'image': record['image'],
+            'lat': record['lat'],
+            'lon': record['lon'],
+            'soil_type': record.get('soil_type', ''),
+            'confidence': record.get('confidence', ''),
+            'land_class': record.get('land_class', ''),
+            'sandy': final_scores.get('Sandy', ''),
+            'clay': final_scores.get('Clay', ''),
+            'loamy': final_scores.get('Loamy', ''),
+            'reason': ' | '.join(record.get('reason', [])),
+            'error': record['error'] or ''
+        }
+
+    def run(self, manifest_path: str, output_path: str, output_format: str = 'csv', resume: bool = True,
+            progress=sys.stderr) -> Dict:
+        """Process a manifest into output_path; returns throughput stats"""
+        started = time.time()
+        rows = self.read_manifest(manifest_path)
+
+        done = self.completed_ids(output_path, output_format) if resume else set()
+        todo = [row for row in rows if row['id'] not in done]
+        stats = {
+            'rows': len(rows),
+            'skipped': len(rows) - len(todo),
+            'processed': 0,
+            'failed': 0,
+            'weather_fetches': 0,
+            'workers': self.workers
+        }
+
+        # Append to an earlier run's output (its CSV header included), even one with only failed rows
+        mode = 'a' if resume and os.path.exists(output_path) and os.path.getsize(output_path) > 0 else 'w'
+        with open(output_path, mode, newline='') as out, \
+                ThreadPoolExecutor(max_workers=self.weather_workers) as weather_pool, \
+                ProcessPoolExecutor(max_workers=self.workers) as image_pool:
+            writer = None
+            if output_format == 'csv':
+                writer = csv.DictWriter(out, fieldnames=RESULT_COLUMNS)
+                if mode == 'w':
+                    writer.writeheader()
+
+            # Weather downloads overlap the image analysis
+            weather = self.start_weather(todo, weather_pool)
+            stats['weather_fetches'] = len(weather)
+
+            chunksize = max(1, min(16, len(todo) // (self.workers * 4) or 1))
+            scores = image_pool.map(_analyze_image, [row['path'] for row in todo], chunksize=chunksize)
+
+            block_rows, block_scores = [], []
+            for row, result in zip(todo, scores):
+                block_rows.append(row)
+                block_scores.append(result)
+                if len(block_rows) < self.flush_every and len(block_rows) + stats['processed'] < len(todo):
+                    continue
+
+                for record in self.decide(block_rows, block_scores, weather):
+                    if record['error']:
+                        stats['failed'] += 1
+                    if writer:
+                        writer.writerow(self.csv_row(record))
+                    else:
+                        out.write(json.dumps(record) + '\n')
+                out.flush()
+
+                stats['processed'] += len(block_rows)
+                block_rows, block_scores = [], []
+                if progress:
+                    elapsed = time.time() - started
+                    rate = stats['processed'] / elapsed if elapsed > 0 else 0.0
+                    eta = (len(todo) - stats['processed']) / rate if rate > 0 else 0.0
+                    print(f"[{stats['processed']}/{len(todo)}] {rate:.1f} images/s, "
+                          f"{stats['failed']} failed, ETA {eta:.0f}s", file=progress, flush=True)
+
+        stats['elapsed_s'] = round(time.time() - started, 2)
+        stats['images_per_s'] = round(stats['processed'] / stats['elapsed_s'], 2) if stats['elapsed_s'] > 0 else 0.0
+        logging.info(f"Batch finished: {stats}")
+        return stats
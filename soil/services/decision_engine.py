@@ -1,8 +1,76 @@
 
+import numpy as np
 from typing import Dict, List
 from config import Config
 
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Rows divided by their sum; rows summing to 0 are left as they are"""
+    totals = matrix.sum(axis=1, keepdims=True)
+    return np.divide(matrix, totals, out=matrix.copy(), where=totals > 0)
+
+
+class SoilDecisionBatch:
+    """
+    Row-wise determine_soil_type results for N samples (arrays over
+    DecisionEngine.SOIL_TYPES). Reasons are only generated for the rows asked for.
+    """
+
+    def __init__(self, image_scores, map_scores, adjustments, final_scores, land_classes=None):
+        self.image_scores = image_scores
+        self.map_scores = map_scores
+        self.adjustments = adjustments
+        self.final_scores = final_scores
+        self.land_classes = land_classes
+        self.winners = np.argmax(final_scores, axis=1)
+        self.confidence = np.round(final_scores[np.arange(len(final_scores)), self.winners], 2)
+
+    def __len__(self):
+        return len(self.final_scores)
+
+    @property
+    def soil_types(self) -> List[str]:
+        return [DecisionEngine.SOIL_TYPES[i] for i in self.winners]
+
+    def _row(self, matrix, i) -> Dict[str, float]:
+        return {t: float(v) for t, v in zip(DecisionEngine.SOIL_TYPES, matrix[i])}
+
+    def reasons(self, i: int) -> List[str]:
+        """_generate_reasons() for row i"""
+        return DecisionEngine._generate_reasons(
+            soil_scores=self._row(self.image_scores, i),
+            map_data={'land_class': self.land_classes[i] if self.land_classes is not None else 'Unknown'},
+            weather_data={'adjustments': dict(zip(DecisionEngine.WEATHER_ADJUSTMENT_KEYS, self.adjustments[i].tolist()))},
+            final_scores=self._row(self.final_scores, i),
+            winning_type=DecisionEngine.SOIL_TYPES[self.winners[i]]
+        )
+
+    def result(self, i: int, reasons: bool = False) -> Dict:
+        """Row i shaped like determine_soil_type()'s result (without location / map color)"""
+        result = {
+            'soil_type': DecisionEngine.SOIL_TYPES[self.winners[i]],
+            'confidence': float(self.confidence[i]),
+            'land_class': self.land_classes[i] if self.land_classes is not None else 'Unknown',
+            'final_scores': {k: round(v, 3) for k, v in self._row(self.final_scores, i).items()},
+            'image_scores': {k: round(v, 3) for k, v in self._row(self.image_scores, i).items()},
+            'map_bias': {k: round(v, 3) for k, v in self._row(self.map_scores, i).items()},
+            'weather_adjustments': dict(zip(DecisionEngine.WEATHER_ADJUSTMENT_KEYS, self.adjustments[i].tolist()))
+        }
+        if reasons:
+            result['reason'] = self.reasons(i)
+        return result
+
+
 class DecisionEngine:
+    # Score columns of the batch matrices
+    SOIL_TYPES = ('Sandy', 'Clay', 'Loamy')
+    
+    # Columns of the adjustment matrix in determine_soil_type_batch, with the
+    # value used when a sample has no such adjustment
+    WEATHER_ADJUSTMENT_KEYS = ('sandy_reduction', 'clay_crack_increase', 'texture_reliability',
+                               'color_bias_reliability')
+    WEATHER_ADJUSTMENT_DEFAULTS = (0.0, 0.0, 1.0, 1.0)
+    
     @staticmethod
     def determine_soil_type(
         soil_scores: Dict[str, float],
@@ -96,6 +164,64 @@ class DecisionEngine:
         
         return result
     
+    @staticmethod
+    def determine_soil_type_batch(
+        image_scores: np.ndarray,
+        map_bias: np.ndarray,
+        adjustments: np.ndarray = None,
+        land_classes: List[str] = None
+    ) -> SoilDecisionBatch:
+        """
+        determine_soil_type for N samples at once. image_scores and map_bias are
+        N x 3 over SOIL_TYPES (see map_bias_matrix); adjustments is N x 4 over
+        WEATHER_ADJUSTMENT_KEYS (see adjustment_matrix). land_classes is only
+        used for reasons.
+        """
+        soil_types = DecisionEngine.SOIL_TYPES
+        image_scores = np.asarray(image_scores, dtype=np.float64).reshape(-1, len(soil_types))
+        count = len(image_scores)
+        map_bias = np.asarray(map_bias, dtype=np.float64).reshape(count, len(soil_types))
+        if adjustments is None:
+            adjustments = np.tile(DecisionEngine.WEATHER_ADJUSTMENT_DEFAULTS, (count, 1))
+        adjustments = np.asarray(adjustments, dtype=np.float64).reshape(count, len(DecisionEngine.WEATHER_ADJUSTMENT_KEYS))
+        sandy_reduction, clay_crack_increase, texture_reliability, color_reliability = adjustments.T
+        
+        # Apply weather adjustments and normalize soil scores
+        factors = np.ones_like(image_scores)
+        factors[:, soil_types.index('Sandy')] = 1.0 - sandy_reduction
+        factors[:, soil_types.index('Clay')] = 1.0 + clay_crack_increase
+        adjusted = _normalize_rows(image_scores * factors * texture_reliability[:, np.newaxis])
+        
+        # Apply reliability to map scores and normalize
+        uniform = 1.0 / len(soil_types)
+        reliability = color_reliability[:, np.newaxis]
+        map_scores = _normalize_rows(map_bias * reliability + (1.0 - reliability) * uniform)
+        
+        # Combine scores with weights
+        final_scores = _normalize_rows(0.5 * adjusted + 0.3 * map_scores + 0.2 * uniform)
+        
+        return SoilDecisionBatch(image_scores, map_scores, adjustments, final_scores, land_classes=land_classes)
+    
+    @staticmethod
+    def map_bias_matrix(map_biases: List[Dict]) -> np.ndarray:
+        """N x 3 _convert_map_bias rows for determine_soil_type_batch (each distinct bias converted once)"""
+        converted = {}
+        rows = []
+        for bias in map_biases:
+            key = tuple(sorted(bias.items()))
+            if key not in converted:
+                scores = DecisionEngine._convert_map_bias(bias, DecisionEngine.SOIL_TYPES)
+                converted[key] = [scores[t] for t in DecisionEngine.SOIL_TYPES]
+            rows.append(converted[key])
+        return np.array(rows, dtype=np.float64).reshape(-1, len(DecisionEngine.SOIL_TYPES))
+    
+    @staticmethod
+    def adjustment_matrix(adjustments: List[Dict]) -> np.ndarray:
+        """N x 4 weather adjustment rows for determine_soil_type_batch (missing keys get their defaults)"""
+        keys = list(zip(DecisionEngine.WEATHER_ADJUSTMENT_KEYS, DecisionEngine.WEATHER_ADJUSTMENT_DEFAULTS))
+        return np.array([[a.get(key, default) for key, default in keys] for a in adjustments],
+                        dtype=np.float64).reshape(-1, len(DecisionEngine.WEATHER_ADJUSTMENT_KEYS))
+    
     @staticmethod
     def _convert_map_bias(map_bias: Dict, target_soil_types: List[str]) -> Dict[str, float]:
         """Convert map bias to match available soil types"""
@@ -3,6 +3,11 @@ import cv2
 import numpy as np
 import os
 from typing import Dict
+from config import Config
+
+# Grain detection: blob pixels with a 4-neighbour outside the blob form its outline
+GRAIN_CROSS_KERNEL = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+GRAIN_STEP_KERNEL = np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]], dtype=np.float32)
 
 class ImageAnalyzer:
     @staticmethod
@@ -20,6 +25,9 @@ class ImageAnalyzer:
         if img is None:
             raise ValueError(f"Could not read image: {image_path}")
         
+        # Analyze at a bounded resolution; photos within it are used as-is
+        img = ImageAnalyzer._working_image(img)
+        
         # Convert to HSV for better color analysis
         hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
         
@@ -81,20 +89,33 @@ class ImageAnalyzer:
         
         return scores
     
+    @staticmethod
+    def _working_image(img: np.ndarray) -> np.ndarray:
+        """img downscaled (INTER_AREA) so its longest side is at most Config.ANALYSIS_MAX_SIDE"""
+        height, width = img.shape[:2]
+        scale = Config.ANALYSIS_MAX_SIDE / max(height, width)
+        if scale >= 1.0:
+            return img
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    
     @staticmethod
     def _analyze_texture(gray_img: np.ndarray) -> Dict[str, float]:
         """Analyze texture features"""
         # Calculate gradient magnitude
-        sobelx = cv2.Sobel(gray_img, cv2.CV_64F, 1, 0, ksize=3)
-        sobely = cv2.Sobel(gray_img, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_magnitude = np.sqrt(sobelx**2 + sobely**2)
+        sobelx = cv2.Sobel(gray_img, cv2.CV_32F, 1, 0, ksize=3)
+        sobely = cv2.Sobel(gray_img, cv2.CV_32F, 0, 1, ksize=3)
+        # Plain float32 sqrt: cv2.magnitude's last bit differs with the calling
+        # thread, which made patch scores from the pool unreproducible
+        gradient_magnitude = np.sqrt(sobelx * sobelx + sobely * sobely)
         
         # Coarseness measure
-        coarseness = np.std(gradient_magnitude) / 255.0
+        _, std = cv2.meanStdDev(gradient_magnitude)
+        coarseness = std[0, 0] / 255.0
         
         # Homogeneity measure
         _, binary = cv2.threshold(gray_img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        homogeneity = np.sum(binary == 255) / (binary.shape[0] * binary.shape[1])
+        homogeneity = cv2.countNonZero(binary) / binary.size
         
         return {
             'coarseness': float(coarseness),
@@ -112,11 +133,9 @@ class ImageAnalyzer:
         
         crack_score = 0.0
         if lines is not None:
-            total_line_length = 0
-            for line in lines:
-                x1, y1, x2, y2 = line[0]
-                length = np.sqrt((x2-x1)**2 + (y2-y1)**2)
-                total_line_length += length
+            # (N, 1, 4) or (N, 4) depending on the OpenCV version
+            x1, y1, x2, y2 = lines.reshape(-1, 4).astype(np.float64).T
+            total_line_length = np.hypot(x2 - x1, y2 - y1).sum()
             
             # Normalize by image diagonal
             img_diag = np.sqrt(gray_img.shape[0]**2 + gray_img.shape[1]**2)
@@ -126,7 +145,7 @@ class ImageAnalyzer:
     
     @staticmethod
     def _detect_grains(gray_img: np.ndarray) -> float:
-        """Detect sand grains using contour analysis"""
+        """Detect sand grains from connected-component statistics"""
         # Enhance contrast
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
         enhanced = clahe.apply(gray_img)
@@ -134,23 +153,40 @@ class ImageAnalyzer:
         # Threshold
         _, thresh = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
-        # Find contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Analyze contour properties
-        grain_count = 0
-        
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            perimeter = cv2.arcLength(contour, True)
-            
-            # Circularity measure
-            if perimeter > 0:
-                circularity = 4 * np.pi * area / (perimeter ** 2)
-                
-                # Typical grain size range
-                if 0.3 < circularity < 1.0 and 10 < area < 1000:
-                    grain_count += 1
+        # Fill holes (dark pixels not reachable from the image border) so a blob
+        # covers everything inside its outer outline, like an external contour
+        height, width = thresh.shape
+        padded = cv2.copyMakeBorder(thresh, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        cv2.floodFill(padded, np.zeros((height + 4, width + 4), np.uint8), (0, 0), 128)
+        filled = cv2.compare(padded[1:-1, 1:-1], 128, cv2.CMP_NE)
+        
+        # Label bright blobs; area and perimeter of every blob at once instead of
+        # tracing a contour per blob. Boundary pixels: blob pixels with a
+        # 4-neighbour outside the blob.
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(filled, connectivity=8)
+        eroded = cv2.erode(filled, GRAIN_CROSS_KERNEL, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        _, boundary = cv2.threshold(cv2.subtract(filled, eroded), 0, 1, cv2.THRESH_BINARY)
+        pixels = np.flatnonzero(boundary)
+        boundary_labels = labels.ravel()[pixels]
+        
+        # Outline length: each boundary pixel links to two neighbours along the
+        # outline, straight (1) when they are 4-neighbours, diagonal (sqrt 2) otherwise
+        neighbours = cv2.filter2D(boundary, -1, GRAIN_STEP_KERNEL, borderType=cv2.BORDER_CONSTANT)
+        straight = np.minimum(neighbours.ravel()[pixels], 2).astype(np.float64)
+        steps = straight / 2 + (2.0 - straight) / 2 * np.sqrt(2)
+        boundary_count = np.bincount(boundary_labels, minlength=count).astype(np.float64)
+        perimeter = np.bincount(boundary_labels, weights=steps, minlength=count)
+        
+        # Area enclosed by the outline through boundary pixel centres (Pick's
+        # theorem), comparable to contourArea
+        area = np.maximum(stats[:, cv2.CC_STAT_AREA] - boundary_count / 2 - 1, 0.0)
+        
+        # Circularity measure
+        circularity = 4 * np.pi * area / np.maximum(perimeter, 1e-9) ** 2
+        # Typical grain size range
+        grains = (perimeter > 0) & (0.3 < circularity) & (circularity < 1.0) & (10 < area) & (area < 1000)
+        grains[0] = False  # background
+        grain_count = int(np.count_nonzero(grains))
         
         # Normalize score
         grain_score = min(grain_count / 50.0, 1.0)
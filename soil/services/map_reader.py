@@ -4,12 +4,14 @@ import numpy as np
 import logging
 from typing import Tuple, Dict
 from config import Config
+from services.raster_cache import RasterCache
 
 class MapReader:
-    def __init__(self, map_path: str = Config.MAP_FILE):
+    def __init__(self, map_path: str = Config.MAP_FILE, cache_dir: str = Config.MAP_CACHE_DIR):
         """Initialize map reader with the satellite map"""
         self.map_path = map_path
-        self.map_image = cv2.imread(map_path)
+        # Decoded once into a memmapped .npy; later runs skip PNG decoding
+        self.map_image = RasterCache(map_path, cache_dir).get('bgr', lambda: cv2.imread(map_path))
         if self.map_image is None:
             # Create a dummy map for testing if file doesn't exist
             logging.warning(f"Map file {map_path} not found. Creating dummy map.")
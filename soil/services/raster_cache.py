@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+from typing import Callable, Optional
+
+# Decoded map rasters cached as uncompressed .npy files next to each other and
+# opened with np.load(mmap_mode='r'): every worker process maps the same file,
+# so the OS page cache holds one copy instead of one decoded array per process.
+
+
+class RasterCache:
+    """
+    Read-only memmapped artifacts derived from one source file (e.g. TS.png).
+
+    Each artifact `name` is stored as <stem>.<name>.npy with a small
+    <stem>.<name>.json stamp recording the source's mtime/size and a digest
+    of the build parameters; a stale or missing stamp triggers a rebuild.
+    Files are written to a temp name and renamed, so concurrent workers
+    building the same artifact never see a partial file.
+    """
+
+    def __init__(self, source_path: str, cache_dir: str):
+        self.source_path = source_path
+        self.cache_dir = cache_dir
+        self.stem = os.path.splitext(os.path.basename(source_path))[0]
+
+    def _paths(self, name: str):
+        prefix = os.path.join(self.cache_dir, f"{self.stem}.{name}")
+        return f"{prefix}.npy", f"{prefix}.json"
+
+    def _stamp(self, params) -> Optional[dict]:
+        try:
+            stat = os.stat(self.source_path)
+        except OSError:
+            return None
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return {'source_mtime_ns': stat.st_mtime_ns, 'source_size': stat.st_size, 'params': digest}
+
+    @staticmethod
+    def _open(npy_path: str) -> np.ndarray:
+        # Plain ndarray view of the read-only mapping: np.memmap's subclass
+        # bookkeeping makes every small slice several times slower
+        return np.asarray(np.load(npy_path, mmap_mode='r'))
+
+    def get(self, name: str, build_fn: Callable[[], Optional[np.ndarray]], params=None) -> Optional[np.ndarray]:
+        """Read-only file-backed array of artifact `name`, building it with build_fn() when missing or stale"""
+        stamp = self._stamp(params)
+        if stamp is None:
+            return None  # no source file: nothing to derive from
+
+        npy_path, stamp_path = self._paths(name)
+        try:
+            with open(stamp_path) as f:
+                if json.load(f) == stamp:
+                    return self._open(npy_path)
+        except (OSError, ValueError):
+            pass
+
+        array = build_fn()
+        if array is None:
+            return None
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_suffix = f".{os.getpid()}.tmp"
+            with open(npy_path + tmp_suffix, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(npy_path + tmp_suffix, npy_path)
+            with open(stamp_path + tmp_suffix, 'w') as f:
+                json.dump(stamp, f)
+            os.replace(stamp_path + tmp_suffix, stamp_path)  # stamp last: marks the .npy as complete
+            logging.info(f"Cached {self.stem}.{name} ({array.nbytes / 1e6:.1f} MB) in {self.cache_dir}")
+            return self._open(npy_path)
+        except OSError as e:
+            logging.warning(f"Raster cache unavailable ({e}); keeping {self.stem}.{name} in memory")
+            array.setflags(write=False)
+            return array
@@ -0,0 +1,163 @@
+import os
+import sys
+import csv
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from services.map_reader import MapReader
+from services.batch_processor import BatchProcessor
+
+ADJUSTMENTS = {'sandy_reduction': 0.0, 'clay_crack_increase': 0.0,
+               'texture_reliability': 1.0, 'color_bias_reliability': 1.0}
+
+
+class CountingWeather:
+    """WeatherFetcher stand-in: neutral adjustments, records every fetch"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get_weather_adjustments(self, lat, lon):
+        with self._lock:
+            self.calls.append((lat, lon))
+        return {'adjustments': dict(ADJUSTMENTS), 'weather_data': {}, 'avg_rainfall_5days_mm': 0.0}
+
+
+class BlockRecorder(BatchProcessor):
+    """Records the size of every flushed block"""
+
+    def decide(self, rows, scores, weather):
+        self.blocks.append(len(rows))
+        return super().decide(rows, scores, weather)
+
+
+class TestBatchProcessor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.weather = CountingWeather()
+        self.map_reader = MapReader(cache_dir=os.path.join(self.tmp_dir, 'cache'))
+        os.makedirs(os.path.join(self.tmp_dir, 'images'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def processor(self, cls=BatchProcessor, **kwargs):
+        processor = cls(workers=2, map_reader=self.map_reader, weather_fetcher=self.weather, **kwargs)
+        processor.blocks = []
+        return processor
+
+    def write_image(self, name, seed):
+        rng = np.random.default_rng(seed)
+        img = (rng.normal(0, 25, (120, 160, 3)) + np.array([40, 80, 130])).clip(0, 255).astype(np.uint8)
+        cv2.imwrite(os.path.join(self.tmp_dir, 'images', name), img)
+
+    def write_file(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w', newline='') as f:
+            f.write(text)
+        return path
+
+    def write_manifest(self, count, missing=()):
+        lines = ['id,image,lat,lon']
+        for i in range(count):
+            if i not in missing:
+                self.write_image(f'{i}.jpg', i)
+            lines.append(f'r{i},images/{i}.jpg,{17.3 + i * 0.01:.2f},78.48')
+        return self.write_file('manifest.csv', '\n'.join(lines) + '\n')
+
+    def test_read_manifest(self):
+        path = self.write_file('manifest.csv', 'image_path,lat,lon\nimages/a.jpg,17.0,78.5\n/abs/b.jpg, 18 ,79\n')
+        rows = BatchProcessor.read_manifest(path)
+        self.assertEqual([row['id'] for row in rows], ['images/a.jpg', '/abs/b.jpg'])  # id defaults to the image
+        self.assertEqual(rows[0]['path'], os.path.join(self.tmp_dir, 'images', 'a.jpg'))
+        self.assertEqual(rows[1]['path'], '/abs/b.jpg')
+        self.assertEqual((rows[1]['lat'], rows[1]['lon']), (18.0, 79.0))
+
+        for body in ('id,lat,lon\nx,17,78\n', 'image,lat,lon\na.jpg,north,78\n', 'image,lat\na.jpg,17\n'):
+            with self.assertRaises(ValueError):
+                BatchProcessor.read_manifest(self.write_file('bad.csv', body))
+
+    def test_completed_ids_skip_errors_and_partial_line(self):
+        csv_path = self.write_file('out.csv', 'id,image,error\na,a.jpg,\nb,b.jpg,ValueError: unreadable\nc,c.j')
+        self.assertEqual(BatchProcessor.completed_ids(csv_path, 'csv'), {'a'})
+        with open(csv_path) as f:
+            self.assertEqual(f.read(), 'id,image,error\na,a.jpg,\nb,b.jpg,ValueError: unreadable\n')
+
+        jsonl_path = self.write_file('out.jsonl', '\n'.join([
+            json.dumps({'id': 'a', 'error': None}),
+            json.dumps({'id': 'b', 'error': 'FileNotFoundError: b.jpg'}),
+            json.dumps({'id': 'b', 'error': None}),  # retried later
+            '{"id": "c", "err'
+        ]))
+        self.assertEqual(BatchProcessor.completed_ids(jsonl_path, 'jsonl'), {'a', 'b'})
+        self.assertEqual(BatchProcessor.completed_ids(os.path.join(self.tmp_dir, 'none.csv'), 'csv'), set())
+
+    def test_weather_fetched_once_per_rounded_point(self):
+        processor = self.processor()
+        rows = [{'lat': 17.3861, 'lon': 78.4867}, {'lat': 17.3899, 'lon': 78.4851},  # both (17.39, 78.49)
+                {'lat': 17.3951, 'lon': 78.4867}]
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            weather = processor.start_weather(rows, pool)
+            self.assertEqual(set(weather), {(17.39, 78.49), (17.40, 78.49)})
+            self.assertEqual(weather[(17.39, 78.49)].result()['adjustments'], ADJUSTMENTS)
+        self.assertEqual(len(self.weather.calls), 2)
+
+        self.assertEqual(self.processor(use_weather=False).start_weather(rows, None), {})
+
+    def test_blocks_flushed_and_failures_retried(self):
+        manifest = self.write_manifest(7, missing={4})
+        output = os.path.join(self.tmp_dir, 'out.csv')
+
+        processor = self.processor(BlockRecorder, flush_every=3)
+        stats = processor.run(manifest, output, progress=None)
+        self.assertEqual(processor.blocks, [3, 3, 1])
+        self.assertEqual((stats['processed'], stats['failed'], stats['skipped']), (7, 1, 0))
+        with open(output, newline='') as f:
+            records = list(csv.DictReader(f))
+        self.assertEqual([record['id'] for record in records], [f'r{i}' for i in range(7)])
+        self.assertTrue(records[4]['error'].startswith('FileNotFoundError'))
+        self.assertTrue(all(record['soil_type'] for i, record in enumerate(records) if i != 4))
+
+        # The missing photo turns up; only it is processed on the rerun
+        self.write_image('4.jpg', 4)
+        processor = self.processor(BlockRecorder, flush_every=3)
+        stats = processor.run(manifest, output, progress=None)
+        self.assertEqual(processor.blocks, [1])
+        self.assertEqual((stats['processed'], stats['failed'], stats['skipped']), (1, 0, 6))
+        with open(output, newline='') as f:
+            records = list(csv.DictReader(f))
+        self.assertEqual(len(records), 8)  # header written once, retry appended
+        self.assertEqual((records[-1]['id'], records[-1]['error']), ('r4', ''))
+        self.assertEqual(BatchProcessor.completed_ids(output, 'csv'), {f'r{i}' for i in range(7)})
+
+    def test_resume_after_interrupted_write(self):
+        manifest = self.write_manifest(4)
+        output = os.path.join(self.tmp_dir, 'out.jsonl')
+        self.processor().run(manifest, output, 'jsonl', progress=None)
+        with open(output) as f:
+            lines = f.readlines()
+        with open(output, 'w') as f:  # killed while writing the third record
+            f.writelines(lines[:2] + [lines[2][:10]])
+
+        stats = self.processor().run(manifest, output, 'jsonl', progress=None)
+        self.assertEqual((stats['processed'], stats['skipped']), (2, 2))
+        with open(output) as f:
+            ids = [json.loads(line)['id'] for line in f]
+        self.assertEqual(sorted(ids), ['r0', 'r1', 'r2', 'r3'])
+        self.assertEqual(len(self.weather.calls), 4 + 2)  # the rerun fetches only for rows still to do
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# Add current directory to path to import local modules
+sys.path.append(os.getcwd())
+
+from services.image_analyzer import ImageAnalyzer
+
+
+class TestTextureAnalysis(unittest.TestCase):
+    """Must stay identical to SoilEngine.analyze_image_texture in backend-server"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.gray = cv2.GaussianBlur(rng.integers(0, 256, (240, 320), dtype=np.uint8), (5, 5), 0)
+
+    def test_coarseness_uses_float32_sqrt(self):
+        sobelx = cv2.Sobel(self.gray, cv2.CV_32F, 1, 0, ksize=3)
+        sobely = cv2.Sobel(self.gray, cv2.CV_32F, 0, 1, ksize=3)
+        _, std = cv2.meanStdDev(np.sqrt(sobelx * sobelx + sobely * sobely))
+        self.assertEqual(ImageAnalyzer._analyze_texture(self.gray)['coarseness'], float(std[0, 0] / 255.0))
+
+    def test_same_result_on_every_thread(self):
+        expected = ImageAnalyzer._analyze_texture(self.gray)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(ImageAnalyzer._analyze_texture, [self.gray] * 16))
+        self.assertTrue(all(result == expected for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()